@@ -15,6 +15,7 @@ from dotenv import load_dotenv
 from app.database import Base
 from app.models import (
     Account,
+    AccountDailyBalance,
     AccountType,
     DefaultCategory,
     UserCategory,
@@ -26,6 +27,9 @@ from app.models import (
     ExchangeRateHistory,
     ActivationToken,
     Budget,
+    BudgetCategory,
+    DailyLedgerRollup,
+    DailyExchangeRate,
     TransactionTemplate,
 )
 
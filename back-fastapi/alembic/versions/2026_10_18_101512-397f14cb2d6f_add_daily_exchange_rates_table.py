@@ -0,0 +1,69 @@
+"""add_daily_exchange_rates_table
+
+Revision ID: 397f14cb2d6f
+Revises: ed93d09cf19a
+Create Date: 2026-10-18 10:15:12.408311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '397f14cb2d6f'
+down_revision = 'ed93d09cf19a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'daily_exchange_rates',
+        sa.Column('actual_date', sa.Date(), nullable=False),
+        sa.Column('currency_code', sa.String(length=3), nullable=False),
+        sa.Column('rate', sa.Numeric(), nullable=False),
+        sa.PrimaryKeyConstraint('actual_date', 'currency_code')
+    )
+    op.create_index('ix_daily_exchange_rates_currency_code_actual_date', 'daily_exchange_rates',
+                    ['currency_code', 'actual_date'], unique=False)
+
+    # Spread every known rate over the days till the next rate of the same currency
+    op.execute("""
+        WITH points AS (
+            SELECT DISTINCT ON (er.actual_date, rate.key)
+                er.actual_date, rate.key AS currency_code, CAST(rate.value AS numeric) AS rate
+            FROM exchange_rates er
+            CROSS JOIN LATERAL jsonb_each_text(er.rates) rate
+            WHERE length(rate.key) = 3
+            ORDER BY er.actual_date, rate.key, er.updated_at DESC
+        ),
+        days AS (
+            SELECT CAST(day AS date) AS actual_date
+            FROM generate_series(
+                (SELECT min(actual_date) FROM points),
+                greatest((SELECT max(actual_date) FROM points), current_date),
+                interval '1 day'
+            ) day
+        ),
+        grid AS (
+            SELECT days.actual_date, codes.currency_code, points.rate,
+                count(points.rate) OVER (PARTITION BY codes.currency_code ORDER BY days.actual_date) AS rate_group
+            FROM days
+            CROSS JOIN (SELECT DISTINCT currency_code FROM points) codes
+            LEFT JOIN points ON points.actual_date = days.actual_date AND points.currency_code = codes.currency_code
+        ),
+        filled AS (
+            SELECT actual_date, currency_code, rate_group,
+                first_value(rate) OVER (PARTITION BY currency_code, rate_group ORDER BY actual_date) AS rate
+            FROM grid
+        )
+        INSERT INTO daily_exchange_rates (actual_date, currency_code, rate)
+        SELECT actual_date, currency_code, rate
+        FROM filled
+        WHERE rate_group > 0
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_daily_exchange_rates_currency_code_actual_date', table_name='daily_exchange_rates')
+    op.drop_table('daily_exchange_rates')
@@ -0,0 +1,26 @@
+"""add_transactions_user_date_time_index
+
+Revision ID: 89dd337ec406
+Revises: 397f14cb2d6f
+Create Date: 2026-10-18 14:22:07.913204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '89dd337ec406'
+down_revision = '397f14cb2d6f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keyset pagination of transactions by (date_time, id) within a user
+    op.create_index('ix_transactions_user_id_date_time_id', 'transactions', ['user_id', 'date_time', 'id'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_user_id_date_time_id', table_name='transactions')
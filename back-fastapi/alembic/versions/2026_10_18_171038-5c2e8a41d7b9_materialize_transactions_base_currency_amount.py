@@ -0,0 +1,50 @@
+"""materialize_transactions_base_currency_amount
+
+Revision ID: 5c2e8a41d7b9
+Revises: 89dd337ec406
+Create Date: 2026-10-18 17:10:38.271546
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8a41d7b9'
+down_revision = '89dd337ec406'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Convert every transaction into the base currency of its user with the daily rates of the transaction date,
+    # the transactions with absent rates are left empty and converted on read
+    op.execute("""
+        UPDATE transactions
+        SET base_currency_amount = converted.amount
+        FROM (
+            SELECT t.id,
+                CASE
+                    WHEN currency.code = base_currency.code THEN t.amount
+                    ELSE t.amount / from_rate.rate * base_rate.rate
+                END AS amount
+            FROM transactions t
+            JOIN accounts account ON account.id = t.account_id
+            JOIN currencies currency ON currency.id = account.currency_id
+            JOIN users u ON u.id = t.user_id
+            JOIN currencies base_currency ON base_currency.id = u.base_currency_id
+            LEFT JOIN daily_exchange_rates from_rate
+                ON from_rate.currency_code = currency.code
+                AND from_rate.actual_date = least(
+                    CAST(t.date_time AS date), (SELECT max(actual_date) FROM daily_exchange_rates)
+                )
+            LEFT JOIN daily_exchange_rates base_rate
+                ON base_rate.currency_code = base_currency.code
+                AND base_rate.actual_date = from_rate.actual_date
+        ) converted
+        WHERE transactions.id = converted.id
+    """)
+
+
+def downgrade() -> None:
+    op.execute('UPDATE transactions SET base_currency_amount = NULL')
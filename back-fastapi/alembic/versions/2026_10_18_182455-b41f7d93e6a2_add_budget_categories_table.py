@@ -0,0 +1,42 @@
+"""add_budget_categories_table
+
+Revision ID: b41f7d93e6a2
+Revises: 5c2e8a41d7b9
+Create Date: 2026-10-18 18:24:55.630718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41f7d93e6a2'
+down_revision = '5c2e8a41d7b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'budget_categories',
+        sa.Column('budget_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['budget_id'], ['budgets.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['category_id'], ['user_categories.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('budget_id', 'category_id')
+    )
+    op.create_index(op.f('ix_budget_categories_category_id'), 'budget_categories', ['category_id'], unique=False)
+
+    # Split the comma-separated ids of budgets.included_categories, ids of the removed categories are dropped
+    op.execute("""
+        INSERT INTO budget_categories (budget_id, category_id)
+        SELECT DISTINCT budgets.id, user_categories.id
+        FROM budgets
+        CROSS JOIN LATERAL unnest(string_to_array(budgets.included_categories, ',')) category_id
+        JOIN user_categories ON CAST(user_categories.id AS text) = trim(category_id)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_budget_categories_category_id'), table_name='budget_categories')
+    op.drop_table('budget_categories')
@@ -0,0 +1,40 @@
+"""add_account_daily_balances_table
+
+Revision ID: e7c14a9d2b58
+Revises: b41f7d93e6a2
+Create Date: 2026-10-18 19:31:12.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c14a9d2b58'
+down_revision = 'b41f7d93e6a2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'account_daily_balances',
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('balance', sa.Numeric(), nullable=False),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('account_id', 'day')
+    )
+
+    # Closing balance of every account on every day with transactions
+    op.execute("""
+        INSERT INTO account_daily_balances (account_id, day, balance)
+        SELECT DISTINCT ON (account_id, CAST(date_time AS date)) account_id, CAST(date_time AS date), new_balance
+        FROM transactions
+        WHERE is_deleted = false AND date_time IS NOT NULL AND new_balance IS NOT NULL
+        ORDER BY account_id, CAST(date_time AS date), date_time DESC, id DESC
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('account_daily_balances')
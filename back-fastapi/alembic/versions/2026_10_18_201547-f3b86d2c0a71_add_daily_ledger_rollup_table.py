@@ -0,0 +1,64 @@
+"""add_daily_ledger_rollup_table
+
+Revision ID: f3b86d2c0a71
+Revises: e7c14a9d2b58
+Create Date: 2026-10-18 20:15:47.113942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b86d2c0a71'
+down_revision = 'e7c14a9d2b58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'daily_ledger_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('income', sa.Numeric(), server_default='0', nullable=False),
+        sa.Column('expense', sa.Numeric(), server_default='0', nullable=False),
+        sa.Column('count', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['category_id'], ['user_categories.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_daily_ledger_rollup_account_id_category_id_day',
+        'daily_ledger_rollup',
+        ['account_id', 'category_id', 'day'],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+    op.create_index('ix_daily_ledger_rollup_user_id_day', 'daily_ledger_rollup', ['user_id', 'day'], unique=False)
+    op.create_index(
+        op.f('ix_daily_ledger_rollup_category_id'), 'daily_ledger_rollup', ['category_id'], unique=False
+    )
+
+    # Sum up the not deleted, not transfer transactions per account, category and day
+    op.execute("""
+        INSERT INTO daily_ledger_rollup (user_id, account_id, category_id, day, income, expense, count)
+        SELECT user_id, account_id, category_id, CAST(date_time AS date),
+            coalesce(sum(amount) FILTER (WHERE is_income), 0),
+            coalesce(sum(amount) FILTER (WHERE NOT is_income), 0),
+            count(*)
+        FROM transactions
+        WHERE is_deleted = false AND is_transfer = false AND date_time IS NOT NULL
+        GROUP BY user_id, account_id, category_id, CAST(date_time AS date)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_daily_ledger_rollup_category_id'), table_name='daily_ledger_rollup')
+    op.drop_index('ix_daily_ledger_rollup_user_id_day', table_name='daily_ledger_rollup')
+    op.drop_index('ix_daily_ledger_rollup_account_id_category_id_day', table_name='daily_ledger_rollup')
+    op.drop_table('daily_ledger_rollup')
@@ -51,6 +51,18 @@ celery_app.conf.beat_schedule = {
         "task": "app.tasks.tasks.process_due_planned_transactions",
         "schedule": crontab(hour=0, minute=5),  # Daily at 00:05
     },
+    "repair-budgets": {
+        "task": "app.tasks.tasks.run_budgets_repair",
+        "schedule": crontab(hour=3, minute=0),  # Daily at 03:00
+    },
+    "repair-account-daily-balances": {
+        "task": "app.tasks.tasks.run_account_daily_balances_repair",
+        "schedule": crontab(hour=3, minute=30),  # Daily at 03:30
+    },
+    "repair-daily-ledger-rollup": {
+        "task": "app.tasks.tasks.run_daily_ledger_rollup_repair",
+        "schedule": crontab(hour=4, minute=0),  # Daily at 04:00
+    },
     "delete-old-activation-tokens": {
         "task": "app.tasks.tasks.delete_old_activation_tokens",
         "schedule": crontab(hour=2, minute=0),  # Daily at 02:00
@@ -15,6 +15,34 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL: str = "redis://redis-budgeter:6379"
     CELERY_RESULT_BACKEND: str = "redis://redis-budgeter:6379"
 
+    # Redis shared by all API and Celery workers (cache versions, locks, etc.)
+    REDIS_URL: str = "redis://redis-budgeter:6379"
+    REDIS_SOCKET_TIMEOUT: float = 1.0
+
+    # How often (in seconds) a worker checks whether another process has updated exchange rates
+    EXCHANGE_RATES_VERSION_CHECK_SECONDS: int = 5
+    # Binary exchange rates table built by the daily exchange rates task and memory-mapped by all the workers
+    EXCHANGE_RATES_FILE: str = "data/exchange_rates.bin"
+    # Calendar years of exchange rates (the current one included) every worker keeps loaded
+    EXCHANGE_RATES_RECENT_YEARS: int = 2
+    # Older rates are loaded on demand by calendar year, at most this many years are kept in memory
+    EXCHANGE_RATES_HISTORY_SEGMENTS: int = 5
+    # Max number of (currency from, currency to, day) cross rates memoized by every worker
+    EXCHANGE_RATES_CROSS_RATES_CACHE_SIZE: int = 10000
+
+    # Budgets of a user are recalculated once per this many seconds, whatever the number of changed transactions
+    BUDGETS_UPDATE_DELAY_SECONDS: int = 10
+    # A pending budgets update is forgotten after this many seconds, e.g. if no worker has picked it up
+    BUDGETS_UPDATE_PENDING_TTL_SECONDS: int = 300
+    # Category trees are cached per user for this many seconds, they are invalidated when the categories are changed
+    CATEGORY_TREE_CACHE_SECONDS: int = 3600
+    # Report results are cached per user and data version for this many seconds
+    REPORT_CACHE_SECONDS: int = 300
+    # Max number of report results cached by every worker
+    REPORT_CACHE_SIZE: int = 1000
+    # Report results are shared by the workers through Redis as well
+    REPORT_CACHE_USE_REDIS: bool = False
+
     CURRENCYBEACON_API_URL: str = ""
     CURRENCYBEACON_API_KEY: str = "currencybeaconapikey"
     CURRENCYBEACON_API_VERSION: str = "v1"
@@ -0,0 +1,52 @@
+import hashlib
+import json
+from datetime import date
+
+from fastapi import HTTPException, Request, Response, status
+
+from app.config import settings
+from app.services.data_versions import get_data_version
+
+if settings.ENVIRONMENT != "production":
+    from icecream import ic  # type: ignore
+
+    ic.configureOutput(includeContext=True)
+
+
+def check_etag(request: Request, response: Response) -> str | None:
+    """
+    Strong ETag of the response, built from the user's data version, the current date, the path and the query.
+    Answers 304 Not Modified before the endpoint runs if the ETag is in If-None-Match.
+    No ETag is sent and nothing is answered with 304 while the data version is unknown.
+    Must go after check_token, which sets request.state.user.
+    """
+    user_id = request.state.user["id"]
+    version = get_data_version(user_id)
+    if version is None:
+        return None
+
+    etag = _make_etag(request, user_id, version)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # If-None-Match uses the weak comparison, W/ prefixes are ignored
+        client_etags = {client_etag.strip().removeprefix("W/") for client_etag in if_none_match.split(",")}
+        if etag in client_etags or "*" in client_etags:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return etag
+
+
+def _make_etag(request: Request, user_id: int, version: str) -> str:
+    key = json.dumps(
+        [
+            user_id,
+            version,
+            date.today().isoformat(),
+            request.url.path,
+            sorted(request.query_params.multi_items()),
+        ]
+    )
+
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
@@ -52,6 +52,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["next_cursor", "ETag"],
 )
 app.add_middleware(BaseHTTPMiddleware, dispatch=update_token)
 
@@ -16,6 +16,11 @@ async def update_token(request: Request, call_next):
     if not hasattr(request.state, "user"):
         return response
 
+    # clients polling with If-None-Match get only 304 responses, their tokens must be renewed as well
+    if response.status_code == 304:
+        add_new_access_token(response, request.state.user)
+        return response
+
     content_type = response.headers.get("content-type", "")
     if content_type.lower().startswith("application/json"):
         response_body = b""
@@ -29,14 +34,8 @@ async def update_token(request: Request, call_next):
         response_json = json.loads(response_body.decode("utf-8"))
         modified_response = json.dumps(response_json).encode("utf-8")
 
-        user = request.state.user
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        new_payload = create_access_token(user, access_token_expires)
-        # decoded_payload = jwt.decode(new_payload, SECRET_KEY, algorithms=["HS256"])
-
         response.headers['Content-Length'] = str(len(modified_response))
-        response.headers['new_access_token'] = new_payload
-        response.headers["Access-Control-Expose-Headers"] = "new_access_token"
+        add_new_access_token(response, request.state.user)
 
         return Response(
             content=json.dumps(response_json).encode("utf-8"),
@@ -46,3 +45,15 @@ async def update_token(request: Request, call_next):
         )
 
     return response
+
+
+def add_new_access_token(response: Response, user: dict):
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    new_payload = create_access_token(user, access_token_expires)
+    # decoded_payload = jwt.decode(new_payload, SECRET_KEY, algorithms=["HS256"])
+
+    response.headers['new_access_token'] = new_payload
+    exposed_headers = response.headers.get("Access-Control-Expose-Headers")
+    response.headers["Access-Control-Expose-Headers"] = (
+        f"{exposed_headers}, new_access_token" if exposed_headers else "new_access_token"
+    )
@@ -0,0 +1,21 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, ForeignKey, Numeric
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class AccountDailyBalance(Base):
+    """
+    Closing balance of an account on every day it has transactions, i.e. new_balance of the last transaction of the day.
+    The balance on any date is the one of the latest row at or before it, found by the primary key.
+    Kept in sync by app.services.account_daily_balances.
+    """
+
+    __tablename__ = 'account_daily_balances'
+
+    account_id: Mapped[int] = mapped_column(ForeignKey('accounts.id', ondelete='CASCADE'), primary_key=True)
+    day: Mapped[date] = mapped_column(Date(), primary_key=True)
+    balance: Mapped[Decimal] = mapped_column(Numeric(), nullable=False)
@@ -7,6 +7,7 @@ from sqlalchemy import Enum as SqlAlchemyEnum
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
+from app.models.BudgetCategory import BudgetCategory
 from app.models.Currency import Currency
 from app.models.User import User
 
@@ -37,6 +38,7 @@ class Budget(Base):
 
     user: Mapped[User] = relationship(backref="budgets", passive_deletes=True)
     currency: Mapped[Currency] = relationship(backref="budgets", passive_deletes=True)
+    category_links: Mapped[list[BudgetCategory]] = relationship(cascade="all, delete-orphan", passive_deletes=True)
 
     is_deleted: Mapped[bool] = mapped_column(default=False, nullable=False, server_default='f')
     is_archived: Mapped[bool] = mapped_column(default=False, nullable=False, server_default='f')
@@ -0,0 +1,18 @@
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class BudgetCategory(Base):
+    """
+    Categories whose expenses are collected by a budget.
+    Budget.included_categories keeps the same ids as a comma-separated string for the API.
+    """
+
+    __tablename__ = 'budget_categories'
+
+    budget_id: Mapped[int] = mapped_column(ForeignKey('budgets.id', ondelete='CASCADE'), primary_key=True)
+    category_id: Mapped[int] = mapped_column(
+        ForeignKey('user_categories.id', ondelete='CASCADE'), primary_key=True, index=True
+    )
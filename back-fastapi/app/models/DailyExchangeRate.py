@@ -0,0 +1,21 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, Index, Numeric, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class DailyExchangeRate(Base):
+    """
+    Exchange rates from `exchange_rates` with one row per day and currency, forward-filled for the days without rates.
+    Kept in sync by app.services.daily_exchange_rates.sync_daily_exchange_rates, so reports can convert in SQL.
+    """
+
+    __tablename__ = 'daily_exchange_rates'
+    __table_args__ = (Index('ix_daily_exchange_rates_currency_code_actual_date', 'currency_code', 'actual_date'),)
+
+    actual_date: Mapped[date] = mapped_column(Date(), primary_key=True)
+    currency_code: Mapped[str] = mapped_column(String(3), primary_key=True)
+    rate: Mapped[Decimal] = mapped_column(Numeric(), nullable=False)
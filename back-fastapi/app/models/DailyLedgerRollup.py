@@ -0,0 +1,39 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import Date, ForeignKey, Index, Numeric
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class DailyLedgerRollup(Base):
+    """
+    Income, expenses (in the account currency) and number of the not deleted, not transfer transactions
+    per account, category and day. Kept in sync by app.services.daily_ledger_rollup, so reports read
+    a few rows per day instead of every transaction.
+    """
+
+    __tablename__ = 'daily_ledger_rollup'
+    __table_args__ = (
+        Index(
+            'ix_daily_ledger_rollup_account_id_category_id_day',
+            'account_id',
+            'category_id',
+            'day',
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+        Index('ix_daily_ledger_rollup_user_id_day', 'user_id', 'day'),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    account_id: Mapped[int] = mapped_column(ForeignKey('accounts.id', ondelete='CASCADE'), nullable=False)
+    category_id: Mapped[int | None] = mapped_column(
+        ForeignKey('user_categories.id', ondelete='CASCADE'), nullable=True, index=True
+    )
+    day: Mapped[date] = mapped_column(Date(), nullable=False)
+    income: Mapped[Decimal] = mapped_column(Numeric(), nullable=False, default=0, server_default='0')
+    expense: Mapped[Decimal] = mapped_column(Numeric(), nullable=False, default=0, server_default='0')
+    count: Mapped[int] = mapped_column(nullable=False, default=0, server_default='0')
@@ -1,7 +1,7 @@
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import DateTime, ForeignKey, String, func
+from sqlalchemy import DateTime, ForeignKey, Index, String, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -14,6 +14,8 @@ LABEL_MAX_LENGTH = 50
 
 class Transaction(Base):
     __tablename__ = 'transactions'
+    # transactions of a user are listed by (date_time, id), see get_transactions
+    __table_args__ = (Index('ix_transactions_user_id_date_time_id', 'user_id', 'date_time', 'id'),)
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True)
@@ -3,6 +3,7 @@ from icecream import ic
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.dependencies.check_etag import check_etag
 from app.dependencies.check_token import check_token
 from app.logger_config import logger
 from app.models.Account import Account
@@ -44,7 +45,7 @@ def add_account(account_dto: CreateAccountSchema, request: Request, db: Session
         raise HTTPException(status_code=400, detail='Failed to create account')
 
 
-@router.get('/', response_model=list[AccountResponseSchema] | None)
+@router.get('/', response_model=list[AccountResponseSchema] | None, dependencies=[Depends(check_etag)])
 def get_accounts(
     request: Request,
     includeHidden: bool = False,
@@ -3,6 +3,7 @@ from icecream import ic
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.dependencies.check_etag import check_etag
 from app.dependencies.check_token import check_token
 from app.logger_config import logger
 from app.schemas.budgets_schema import (
@@ -59,7 +60,7 @@ def update(request: Request, input_dto: EditBudgetInputSchema, db: Session = Dep
         )
 
 
-@router.get('/', response_model=list[BudgetSchema])
+@router.get('/', response_model=list[BudgetSchema], dependencies=[Depends(check_etag)])
 def get_budgets(request: Request, include: str = 'all', db: Session = Depends(get_db)):
     """Get all budgets"""
     logger.info(f"Getting all budgets for user_id: {request.state.user['id']}")
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Body, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.dependencies.check_etag import check_etag
 from app.dependencies.check_token import check_token
 from app.logger_config import logger
 from app.models.UserCategory import UserCategory
@@ -20,12 +21,12 @@ from app.services.categories import (
 router = APIRouter(tags=['Categories'], prefix='/categories', dependencies=[Depends(check_token)])
 
 
-@router.get('/', response_model=list[ResponseCategorySchema])
-def get_categories(request: Request, db: Session = Depends(get_db)) -> list[UserCategory]:
+@router.get('/', response_model=list[ResponseCategorySchema], dependencies=[Depends(check_etag)])
+def get_categories(request: Request, db: Session = Depends(get_db)) -> list[dict]:
     return get_user_categories(request.state.user['id'], db)
 
 
-@router.get('/grouped/', response_model=GroupedCategorySchema)
+@router.get('/grouped/', response_model=GroupedCategorySchema, dependencies=[Depends(check_etag)])
 def get_grouped_categories(request: Request, db: Session = Depends(get_db)) -> GroupedCategorySchema:
     user_id = request.state.user['id']
     return grouped_user_categories(user_id, db)
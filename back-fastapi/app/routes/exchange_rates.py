@@ -9,8 +9,10 @@ from app.dependencies.check_token import check_token
 from app.logger_config import logger
 from app.models.ExchangeRateHistory import ExchangeRateHistory
 from app.schemas.exchange_rates_schema import ExchangeRateSchema
+from app.services.CurrencyProcessor import get_cross_rates_stats
 from app.services.exchange_rates import get_exchange_rates, update_exchange_rates
 from app.services.exchange_services.exceptions import ErrorFetchingData
+from app.tasks.tasks import materialize_transactions_base_currency_amounts
 
 ic.configureOutput(includeContext=True)
 
@@ -35,11 +37,18 @@ def get_rates(db: Session = Depends(get_db)):
         )
 
 
+@router.get('/cache-stats/')
+def get_cache_stats() -> dict:
+    """Get hit/miss counters of the cross rates cache of the worker serving the request"""
+    return get_cross_rates_stats()
+
+
 @router.get('/update/', status_code=status.HTTP_200_OK, response_model=ExchangeRateSchema)
 def update_rates(db: Session = Depends(get_db)):
     """Update exchange rates just for today"""
     try:
         exchange_rates: ExchangeRateHistory = update_exchange_rates(db, when=date.today())
+        materialize_transactions_base_currency_amounts.delay(since=date.today().isoformat())  # type: ignore
         return exchange_rates
     except ErrorFetchingData as e:
         logger.exception(e)
@@ -72,6 +81,8 @@ def update_rates_from_to(start_date: date, end_date: date, db: Session = Depends
             exchange_rates: ExchangeRateHistory = update_exchange_rates(db, when=current_date)
             updated_rates.append(exchange_rates)
             current_date += timedelta(days=1)
+        # the corrected rates are carried forward, so all the later transactions are converted again
+        materialize_transactions_base_currency_amounts.delay(since=start_date.isoformat())  # type: ignore
         return updated_rates[-1] if updated_rates else None
     except ErrorFetchingData as e:
         logger.exception(e)
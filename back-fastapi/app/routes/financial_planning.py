@@ -11,6 +11,7 @@ from app.schemas.planned_transaction_schema import (
     FutureBalanceResponseSchema,
 )
 from app.services import financial_planning as fp_service
+from app.services.report_cache import get_cached_report
 
 router = APIRouter(
     tags=['Financial Planning'],
@@ -31,7 +32,12 @@ def calculate_future_balance(
     Returns total balance in base currency and breakdown by account.
     """
     try:
-        result = fp_service.calculate_future_balance(balance_request, request.state.user['id'], db)
+        result = get_cached_report(
+            request.state.user['id'],
+            'future-balance',
+            balance_request.model_dump(),
+            lambda: fp_service.calculate_future_balance(balance_request, request.state.user['id'], db),
+        )
         return result
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -57,7 +63,12 @@ def get_balance_projection(
     Useful for visualizing balance trends over time.
     """
     try:
-        result = fp_service.get_balance_projection(projection_request, request.state.user['id'], db)
+        result = get_cached_report(
+            request.state.user['id'],
+            'projection',
+            projection_request.model_dump(),
+            lambda: fp_service.get_balance_projection(projection_request, request.state.user['id'], db),
+        )
         return result
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -5,6 +5,7 @@ from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.dependencies.check_etag import check_etag
 from app.dependencies.check_token import check_token
 from app.logger_config import logger
 from app.schemas.planned_transaction_schema import (
@@ -97,7 +98,9 @@ def get_planned_transactions(
         )
 
 
-@router.get('/upcoming/occurrences', response_model=list[PlannedTransactionOccurrenceSchema])
+@router.get(
+    '/upcoming/occurrences', response_model=list[PlannedTransactionOccurrenceSchema], dependencies=[Depends(check_etag)]
+)
 def get_upcoming_occurrences(
     request: Request,
     db: Session = Depends(get_db),
@@ -5,19 +5,24 @@ from icecream import ic
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.dependencies.check_etag import check_etag
 from app.dependencies.check_token import check_token
 from app.logger_config import logger
 from app.schemas.reports_schema import (
     BalanceReportInputSchema,
     BalanceReportOutputSchema,
+    BalanceSeriesInputSchema,
+    BalanceSeriesOutputSchema,
     CashFlowReportInputSchema,
     CashFlowReportOutputSchema,
     ExpensesReportInputSchema,
     ExpensesReportOutputItemSchema,
 )
-from app.services.errors import AccessDenied
+from app.services.errors import AccessDenied, InvalidPeriod
+from app.services.report_cache import get_cached_report
 from app.services.reports import (
     get_balance_report,
+    get_balance_series,
     get_cash_flows,
     get_diagram,
     get_expenses_by_categories,
@@ -46,17 +51,24 @@ def cash_flow(
         f"end_date: {input_data.end_date}, period: {input_data.period}"
     )
     try:
-        result: list[dict] = get_cash_flows(
+        result: list[dict] = get_cached_report(
             request.state.user['id'],
-            db,
-            input_data.start_date,
-            input_data.end_date,
-            input_data.period,
+            'cashflow',
+            input_data.model_dump(),
+            lambda: get_cash_flows(
+                request.state.user['id'],
+                db,
+                input_data.start_date,
+                input_data.end_date,
+                input_data.period,
+            ),
         )
         return result
     except AccessDenied as e:
         logger.exception(e)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Access denied')
+    except InvalidPeriod as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
     except Exception as e:
         logger.exception(e)
         raise HTTPException(
@@ -77,7 +89,12 @@ def balance_report(
         f"account_ids: {input_data.account_ids}, date: {input_data.balance_date}"
     )
     try:
-        result: list[dict] = get_balance_report(request.state.user['id'], db, [], input_data.balance_date)
+        result: list[dict] = get_cached_report(
+            request.state.user['id'],
+            'balance',
+            {'balance_date': input_data.balance_date},
+            lambda: get_balance_report(request.state.user['id'], db, [], input_data.balance_date),
+        )
         return result
     except AccessDenied as e:
         logger.exception(e)
@@ -102,11 +119,16 @@ def balance_report_non_hidden(
         f"account_ids: {input_data.account_ids}, date: {input_data.balance_date}"
     )
     try:
-        result: list[dict] = get_balance_report(
+        result: list[dict] = get_cached_report(
             request.state.user['id'],
-            db,
-            input_data.account_ids,
-            input_data.balance_date,
+            'balance-non-hidden',
+            input_data.model_dump(),
+            lambda: get_balance_report(
+                request.state.user['id'],
+                db,
+                input_data.account_ids,
+                input_data.balance_date,
+            ),
         )
         return result
     except AccessDenied as e:
@@ -120,6 +142,43 @@ def balance_report_non_hidden(
         )
 
 
+@router.post('/balance-series/', response_model=BalanceSeriesOutputSchema)
+def balance_series(
+    request: Request,
+    input_data: BalanceSeriesInputSchema,
+    db: Session = Depends(get_db),
+) -> dict:
+    """Get balances of accounts and their total in the base currency for a list of dates or a period"""
+    logger.info(
+        f"Getting balance series for user_id: {request.state.user['id']}, account_ids: {input_data.account_ids}, "
+        f"dates: {input_data.dates}, period: {input_data.period}, "
+        f"start_date: {input_data.start_date}, end_date: {input_data.end_date}"
+    )
+    try:
+        return get_cached_report(
+            request.state.user['id'],
+            'balance-series',
+            input_data.model_dump(),
+            lambda: get_balance_series(
+                request.state.user['id'],
+                db,
+                input_data.account_ids,
+                input_data.dates,
+                input_data.period,
+                input_data.start_date,
+                input_data.end_date,
+            ),
+        )
+    except InvalidPeriod as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+    except Exception as e:
+        logger.exception(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Error generting report',
+        )
+
+
 @router.post('/expenses-by-categories/', response_model=list[ExpensesReportOutputItemSchema])
 def expenses_by_categories(
     request: Request,
@@ -129,12 +188,17 @@ def expenses_by_categories(
     """Get all expenses within a given time period"""
     logger.info(f"Getting expenses by categories for user_id: {request.state.user['id']}")
     try:
-        result: dict = get_expenses_by_categories(
+        result: dict = get_cached_report(
             request.state.user['id'],
-            db,
-            input_data.start_date,
-            input_data.end_date,
-            input_data.hide_empty_categories,
+            'expenses-by-categories',
+            input_data.model_dump(),
+            lambda: get_expenses_by_categories(
+                request.state.user['id'],
+                db,
+                input_data.start_date,
+                input_data.end_date,
+                input_data.hide_empty_categories,
+            ),
         )
         return result
     except Exception as e:
@@ -145,7 +209,7 @@ def expenses_by_categories(
         )
 
 
-@router.get('/diagram/{diagram_type}/{start_date}/{end_date}')
+@router.get('/diagram/{diagram_type}/{start_date}/{end_date}', dependencies=[Depends(check_etag)])
 def diagram(
     request: Request,
     diagram_type: str,
@@ -159,15 +223,23 @@ def diagram(
         f" start_date: {start_date}, end_date: {end_date}"
     )
 
-    expenses = get_expenses_by_categories(
-        user_id,
-        db,
-        datetime.strptime(start_date, '%Y-%m-%d').date(),
-        datetime.strptime(end_date, '%Y-%m-%d').date(),
-        hide_empty_categories=False,
-    )
+    def get_diagram_data() -> dict:
+        expenses = get_expenses_by_categories(
+            user_id,
+            db,
+            datetime.strptime(start_date, '%Y-%m-%d').date(),
+            datetime.strptime(end_date, '%Y-%m-%d').date(),
+            hide_empty_categories=False,
+        )
+        return get_diagram(expenses, db, user_id)
+
     try:
-        diagramImage: dict = get_diagram(expenses, db, user_id)
+        diagramImage: dict = get_cached_report(
+            user_id,
+            'diagram',
+            {'diagram_type': diagram_type, 'start_date': start_date, 'end_date': end_date},
+            get_diagram_data,
+        )
     except Exception as e:
         logger.exception(e)
         raise HTTPException(
@@ -190,11 +262,16 @@ def expenses_data(
         f" start_date: {input_data.start_date}, end_date: {input_data.end_date}"
     )
 
-    expenses = get_expenses_diagram_data(
+    expenses = get_cached_report(
         user_id,
-        db,
-        input_data.start_date,
-        input_data.end_date,
-        hide_empty_categories=False,
+        'expenses-data',
+        {'start_date': input_data.start_date, 'end_date': input_data.end_date},
+        lambda: get_expenses_diagram_data(
+            user_id,
+            db,
+            input_data.start_date,
+            input_data.end_date,
+            hide_empty_categories=False,
+        ),
     )
     return expenses
@@ -1,30 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+import io
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
 from icecream import ic
 from sqlalchemy.orm import Session
 
 from app.database import get_db
+from app.dependencies.check_etag import check_etag
 from app.dependencies.check_token import check_token
 from app.logger_config import logger
 from app.models.TransactionTemplate import TransactionTemplate
 from app.schemas.transaction_schema import (
     CreateTransactionSchema,
+    ImportTransactionsResponseSchema,
     ResponseTransactionSchema,
     ResponseTransactionTemplateSchema,
     TemplateIdsSchema,
     UpdateTransactionSchema,
 )
-from app.services.errors import AccessDenied, InvalidAccount, InvalidCategory
+from app.services.errors import AccessDenied, InvalidAccount, InvalidCategory, InvalidImportFile
 from app.services.transaction_management.errors import InvalidTransaction
 from app.services.transactions import (
     create_template,
     create_transaction,
     delete,
     delete_templates,
+    get_next_cursor,
     get_templates,
     get_transaction_details,
     get_transactions,
     update,
 )
+from app.services.transactions_export import EXPORT_FORMATS, export_transactions
+from app.services.transactions_import import import_transactions, parse_csv, parse_ofx
 from app.utils.sanitize_transaction_filters import prepare_filters
 
 ic.configureOutput(includeContext=True)
@@ -62,14 +70,64 @@ def add_user_transaction(
         )
 
 
-@router.get("/", response_model=list[ResponseTransactionSchema])
-def get_user_transactions(request: Request, db: Session = Depends(get_db)):
-    """Get all transactions for a user"""
+@router.post("/import/", response_model=ImportTransactionsResponseSchema)
+def import_user_transactions(
+    request: Request,
+    file: UploadFile = File(...),
+    account_id: int = Form(..., alias="accountId"),
+    expense_category_id: int = Form(..., alias="expenseCategoryId"),
+    income_category_id: int = Form(..., alias="incomeCategoryId"),
+    db: Session = Depends(get_db),
+):
+    """
+    Import transactions of a bank statement into the account.
+    OFX files are recognized by the .ofx/.qfx extension, everything else is read as CSV.
+    """
+    is_ofx = (file.filename or "").lower().endswith((".ofx", ".qfx"))
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="replace", newline="")
+
+    try:
+        imported = import_transactions(
+            request.state.user["id"],
+            account_id,
+            parse_ofx(lines) if is_ofx else parse_csv(lines),
+            expense_category_id,
+            income_category_id,
+            db,
+        )
+        return ImportTransactionsResponseSchema(imported=imported)
+    except AccessDenied:
+        logger.error("Access denied")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    except InvalidCategory:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Invalid category")
+    except InvalidAccount:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Invalid account")
+    except InvalidImportFile as e:
+        logger.error(f"Invalid import file {file.filename}: {e}")
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+    except Exception as e:  # pragma: no cover
+        logger.exception(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to import transactions",
+        )
+
+
+@router.get("/", response_model=list[ResponseTransactionSchema], dependencies=[Depends(check_etag)])
+def get_user_transactions(request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Get all transactions for a user.
+    Pages are selected either by page/per_page or by the cursor returned in the next_cursor header of the previous page.
+    """
     params = dict(request.query_params)
     prepare_filters(params)
 
     try:
         transactions = get_transactions(request.state.user["id"], db, dict(params))
+        next_cursor = get_next_cursor(transactions, params)
+        if next_cursor is not None:
+            response.headers["next_cursor"] = next_cursor
         return transactions
     except Exception as e:  # pragma: no cover
         logger.exception(e)
@@ -79,6 +137,25 @@ def get_user_transactions(request: Request, db: Session = Depends(get_db)):
         )
 
 
+@router.get("/export/", response_class=StreamingResponse)
+def export_user_transactions(request: Request, db: Session = Depends(get_db)):
+    """
+    Export all the transactions of a user matching the filters of GET /transactions/.
+    The format query param selects csv (default) or ndjson, pagination params are ignored.
+    """
+    params = dict(request.query_params)
+    export_format = params.pop("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status.HTTP_422_UNPROCESSABLE_CONTENT, f"Incorrect export format: {export_format}")
+    prepare_filters(params)
+
+    return StreamingResponse(
+        export_transactions(request.state.user["id"], db, params, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="transactions.{export_format}"'},
+    )
+
+
 @router.get("/templates", response_model=list[ResponseTransactionTemplateSchema])
 def get_user_templates(request: Request, db: Session = Depends(get_db)):
     """Get all templates for a user"""
@@ -64,3 +64,45 @@ class BalanceReportOutputSchema(BaseModel):
     report_date: date
 
     model_config = ConfigDict(from_attributes=True, populate_by_name=True, alias_generator=to_camel)
+
+
+class BalanceSeriesInputSchema(BaseModel):
+    account_ids: list[int] = []
+    dates: list[date] = []
+    period: str | None = None
+    start_date: date | None = None
+    end_date: date | None = None
+
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True, alias_generator=to_camel)
+
+
+class BalanceSeriesPointSchema(BaseModel):
+    date: date
+    balance: float
+    base_currency_balance: float
+
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True, alias_generator=to_camel)
+
+
+class BalanceSeriesAccountSchema(BaseModel):
+    account_id: int
+    account_name: str
+    currency_code: str
+    balances: list[BalanceSeriesPointSchema]
+
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True, alias_generator=to_camel)
+
+
+class BalanceSeriesTotalSchema(BaseModel):
+    date: date
+    base_currency_balance: float
+
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True, alias_generator=to_camel)
+
+
+class BalanceSeriesOutputSchema(BaseModel):
+    base_currency_code: str
+    accounts: list[BalanceSeriesAccountSchema]
+    totals: list[BalanceSeriesTotalSchema]
+
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True, alias_generator=to_camel)
@@ -104,3 +104,9 @@ class ResponseTransactionTemplateSchema(BaseModel):
     category: ResponseCategorySchema
 
     model_config = ConfigDict(from_attributes=True, populate_by_name=True, alias_generator=to_camel)
+
+
+class ImportTransactionsResponseSchema(BaseModel):
+    imported: int
+
+    model_config = ConfigDict(populate_by_name=True, alias_generator=to_camel)
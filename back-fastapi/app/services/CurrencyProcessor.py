@@ -1,42 +1,206 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from collections.abc import Sequence
 from datetime import date, datetime, timedelta
 from decimal import Decimal
-from typing import TypedDict
+from typing import NamedTuple, TypedDict
 
+from cachetools import LRUCache
 from icecream import ic
+from redis import RedisError
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+from app.config import settings
 from app.logger_config import logger
 from app.models.ExchangeRateHistory import ExchangeRateHistory
+from app.services.data_versions import bump_global_data_version
+from app.services.exchange_rates_file import MappedRatesTable, write_rates_file
+from app.utils.redis_client import get_redis
 
 ic.configureOutput(includeContext=True)
 
+# Redis key incremented every time exchange rates are written, so all the workers know their cache is outdated
+EXCHANGE_RATES_VERSION_KEY = "exchange_rates:version"
+
+# Rows are re-fetched with this overlap: updated_at is set at the start of the writing DB transaction,
+# so a row may become visible a bit later than rows with a newer updated_at
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+
+class RatesTable(TypedDict):
+    """
+    Exchange rates indexed for lookups by date.
+    `dates` holds ascending date ordinals, `rates` holds one column per currency code aligned with `dates`.
+    Every column is forward-filled, so a position holds the latest known rate on or before that day.
+    """
+
+    dates: list[int]
+    rates: dict[str, list[Decimal | None]]
+
+
+class RatesRow(NamedTuple):
+    actual_date: date
+    rates: dict
+
 
 # Global cache to store exchange rates
 class CurrencyCache(TypedDict):
-    data: dict
+    data: RatesTable | MappedRatesTable  # rates from get_rates_window_start() till today
+    history: OrderedDict[int, RatesTable]  # older rates by year, the least recently used year goes first
+    rows: dict[date, dict]  # raw rates by actual date, the table is built from them
+    watermark: datetime | None  # the latest updated_at among the loaded rows
+    version: int | None  # value of EXCHANGE_RATES_VERSION_KEY the cache corresponds to
+    version_checked_at: float
     last_updated: datetime | None
 
 
-currency_cache: CurrencyCache = {"data": {}, "last_updated": None}
+# One loader of the recent rates per process, the other threads wait for it or keep serving the stale rates
+_load_lock = threading.Lock()
+# Guards currency_cache["history"], which is reordered on every lookup
+_history_lock = threading.Lock()
+
+# (currency_code_from, currency_code_to, date ordinal) -> rate to multiply amounts by, built from currency_cache
+cross_rates_cache: LRUCache[tuple[str, str, int], Decimal] = LRUCache(
+    maxsize=settings.EXCHANGE_RATES_CROSS_RATES_CACHE_SIZE
+)
+cross_rates_stats = {"hits": 0, "misses": 0}
+# Bumped every time the cross rates are dropped, so rates computed from the replaced data are not cached
+_cross_rates_generation = 0
+_cross_rates_lock = threading.Lock()
+
+currency_cache: CurrencyCache = {
+    "data": {"dates": [], "rates": {}},
+    "history": OrderedDict(),
+    "rows": {},
+    "watermark": None,
+    "version": None,
+    "version_checked_at": 0.0,
+    "last_updated": None,
+}
+
+
+def get_exchange_rates_for_year(db: Session) -> RatesTable | MappedRatesTable:
+    """
+    Load exchange rates for the last EXCHANGE_RATES_RECENT_YEARS calendar years, see get_rates_window_start().
+    Apply back-fill and forward-fill for missing dates, and cache them in memory.
+    The shared exchange rates file is used when it is up to date, otherwise the rates are loaded from DB:
+    the first call loads the whole period, later calls only load rows written after the cached ones.
+    Both happen once a day, or as soon as another process reports new rates via EXCHANGE_RATES_VERSION_KEY.
+    Only the first load blocks the callers, later the stale rates are served while a background thread reloads them.
+    """
+    if currency_cache["last_updated"] is None:
+        with _load_lock:
+            # another thread may have loaded the rates while this one was waiting for the lock
+            if currency_cache["last_updated"] is None:
+                load_exchange_rates(db)
+    elif not is_cache_valid() or is_cache_outdated():
+        start_background_refresh(db)
+
+    return currency_cache["data"]
 
 
-def get_exchange_rates_for_year(db: Session):
+def load_exchange_rates(db: Session):
     """
-    --- Load exchange rates for the last year.
-        This is changed to 3 years as a dirty hack to fix the error for longer than a year transactions.
-    ---
-    Apply back-fill and forward-fill for missing dates, and cache them in memory.
+    Load the recent rates from the shared file or from DB. The caller must hold _load_lock.
     """
-    global currency_cache
-    today = date.today()
-    three_years_ago = today - timedelta(days=365 * 3)
+    if not map_exchange_rates_file():
+        refresh_exchange_rates(db)
 
-    if not is_cache_valid():
-        rows = fetch_exchange_rate_rows(db, three_years_ago)
-        rates = fill_exchange_rates(rows, three_years_ago, today)
-        update_cache(rates)
 
-    return currency_cache["data"]
+def start_background_refresh(db: Session):
+    """
+    Reload the recent rates in a background thread unless another thread is already loading them.
+    """
+    if not _load_lock.acquire(blocking=False):
+        return
+
+    def refresh():
+        try:
+            # the session of the request can not be shared between threads
+            with Session(bind=db.get_bind()) as refresh_db:
+                load_exchange_rates(refresh_db)
+        except Exception as e:
+            logger.exception(f"Unable to refresh exchange rates: {e}")
+        finally:
+            _load_lock.release()
+
+    try:
+        threading.Thread(target=refresh, name="exchange-rates-refresh", daemon=True).start()
+    except RuntimeError:
+        _load_lock.release()
+        raise
+
+
+def get_exchange_rates_for_date(db: Session, calc_date: date) -> RatesTable | MappedRatesTable:
+    """
+    Get the cached exchange rates covering calc_date: the recent rates or the history segment of its year.
+    """
+    exchange_rates = get_exchange_rates_for_year(db)
+    if calc_date >= get_rates_window_start():
+        return exchange_rates
+    return get_history_segment(db, calc_date.year)
+
+
+def get_rates_window_start() -> date:
+    """
+    Get the first day of the recent rates, which are always kept loaded.
+    """
+    return date(date.today().year - settings.EXCHANGE_RATES_RECENT_YEARS + 1, 1, 1)
+
+
+def get_history_segment(db: Session, year: int) -> RatesTable:
+    """
+    Get the exchange rates for the given year, loading them from DB if they are not in the cache.
+    Only EXCHANGE_RATES_HISTORY_SEGMENTS years are kept, the least recently used one is evicted first.
+    """
+    segments = currency_cache["history"]
+    with _history_lock:
+        if year in segments:
+            segments.move_to_end(year)
+            return segments[year]
+
+        start_date = date(year, 1, 1)
+        end_date = date(year, 12, 31)
+        rows = fetch_exchange_rate_rows(db, start_date, end_date)
+        segment = build_rates_table(fill_exchange_rates(list(rows), start_date, end_date))
+
+        segments[year] = segment
+        while len(segments) > settings.EXCHANGE_RATES_HISTORY_SEGMENTS:
+            evicted_year, _ = segments.popitem(last=False)
+            logger.info(f"Exchange rates for {evicted_year} are evicted from the cache.")
+        return segment
+
+
+def clear_history_segments():
+    with _history_lock:
+        currency_cache["history"].clear()
+    clear_cross_rates()
+
+
+def clear_cross_rates():
+    """
+    Drop the cross rates, they have to be called every time the rates they are built from change.
+    """
+    global _cross_rates_generation
+    with _cross_rates_lock:
+        cross_rates_cache.clear()
+        _cross_rates_generation += 1
+
+
+def get_cross_rates_stats() -> dict:
+    """
+    Get hit/miss counters and the size of the cross rates cache of the current process.
+    """
+    with _cross_rates_lock:
+        return {
+            **cross_rates_stats,
+            "size": len(cross_rates_cache),
+            "max_size": cross_rates_cache.maxsize,
+        }
 
 
 def is_cache_valid():
@@ -48,20 +212,185 @@ def is_cache_valid():
     return (datetime.now() - currency_cache["last_updated"]).total_seconds() <= 86400  # 24 hours
 
 
-def fetch_exchange_rate_rows(db: Session, start_date: date):
+def is_cache_outdated() -> bool:
     """
-    Fetch exchange rate rows from the database for dates >= start_date.
+    Check if another process has written exchange rates since the cache was refreshed.
+    Redis is asked at most once per EXCHANGE_RATES_VERSION_CHECK_SECONDS.
+    """
+    now = time.monotonic()
+    if now - currency_cache["version_checked_at"] < settings.EXCHANGE_RATES_VERSION_CHECK_SECONDS:
+        return False
+    currency_cache["version_checked_at"] = now
+
+    version = get_rates_version()
+    return version is not None and version != currency_cache["version"]
+
+
+def get_rates_version() -> int | None:
+    """
+    Get the shared exchange rates version, None if Redis is not available.
+    """
+    try:
+        version = get_redis().get(EXCHANGE_RATES_VERSION_KEY)
+    except RedisError as e:
+        logger.warning(f"Unable to get exchange rates version: {e}")
+        return None
+
+    return int(version) if version is not None else 0
+
+
+def notify_exchange_rates_updated(db: Session):
+    """
+    Bump the shared exchange rates version, so all the workers reload the new rates,
+    and refresh the cache of the current process right away.
+    """
+    try:
+        get_redis().incr(EXCHANGE_RATES_VERSION_KEY)
+    except RedisError as e:
+        logger.warning(f"Unable to bump exchange rates version: {e}")
+    # reports of all the users depend on the rates
+    bump_global_data_version()
+
+    with _load_lock:
+        if isinstance(currency_cache["data"], MappedRatesTable):
+            # the shared file is outdated now, decide where to take the rates from on the next lookup
+            currency_cache["last_updated"] = None
+        elif currency_cache["last_updated"] is not None:
+            refresh_exchange_rates(db)
+
+
+def map_exchange_rates_file() -> bool:
+    """
+    Switch the cache to the shared exchange rates file if it is up to date. The caller must hold _load_lock.
+    Return False if there is no such file and the rates have to be loaded from DB.
+    """
+    path = settings.EXCHANGE_RATES_FILE
+    if not path or not os.path.exists(path):
+        return False
+
+    version = get_rates_version()
+    try:
+        mapped_rates = MappedRatesTable(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unable to map exchange rates file {path}: {e}")
+        return False
+
+    if version is None:
+        # Redis is not available, so trust the file if it was built within the last 24 hours
+        is_up_to_date = time.time() - os.path.getmtime(path) <= 86400
+    else:
+        is_up_to_date = mapped_rates.version == version
+    if not is_up_to_date:
+        return False
+
+    logger.info(f"Using exchange rates file {path}, version {mapped_rates.version}.")
+    currency_cache["data"] = mapped_rates
+    clear_history_segments()  # the cross rates are dropped too
+    # the raw rows are not needed anymore, the next load from DB is a full one
+    currency_cache["rows"] = {}
+    currency_cache["watermark"] = None
+    currency_cache["version"] = version
+    currency_cache["last_updated"] = datetime.now()
+    return True
+
+
+def build_exchange_rates_file(db: Session):
+    """
+    Build the shared exchange rates file from DB. It is done by one process (the daily exchange rates task),
+    all the others just map the file.
+    """
+    window_start = get_rates_window_start()
+
+    version = get_rates_version()
+    rows = fetch_exchange_rate_rows(db, window_start)
+    table = build_rates_table(fill_exchange_rates(list(rows), window_start, date.today()))
+    write_rates_file(settings.EXCHANGE_RATES_FILE, table, version or 0)
+    logger.info(f"Exchange rates file {settings.EXCHANGE_RATES_FILE} is built, version {version}.")
+
+
+def refresh_exchange_rates(db: Session):
+    """
+    Load the exchange rate rows which are not in the cache yet and rebuild the cached table.
+    The caller must hold _load_lock.
+    """
+    today = date.today()
+    window_start = get_rates_window_start()
+
+    # read the version before the rows, so rates written in between are picked up by the next refresh
+    version = get_rates_version()
+
+    last_updated = currency_cache["last_updated"]
+    watermark = currency_cache["watermark"]
+    if last_updated is None or watermark is None:
+        # nothing is loaded yet, so load the whole period
+        currency_cache["rows"] = {}
+        clear_history_segments()
+        watermark = None
+        rows = fetch_exchange_rate_rows(db, window_start)
+    else:
+        # rows of any date may be rewritten, so look for the older ones as well
+        rows = fetch_exchange_rate_rows(db, None, updated_after=watermark - WATERMARK_OVERLAP)
+
+    cached_rows = currency_cache["rows"]
+    for row in rows:
+        cached_rows[row.actual_date] = row.rates
+        if watermark is None or row.updated_at > watermark:
+            watermark = row.updated_at
+        if row.actual_date < window_start:
+            # history segments may hold the outdated rates, they are loaded again on demand
+            clear_history_segments()
+
+    if rows or last_updated is None or last_updated.date() != today:
+        # keep only the latest rates before the window, they are carried forward to its first days
+        older_dates = sorted(actual_date for actual_date in cached_rows if actual_date < window_start)
+        for actual_date in older_dates[:-1]:
+            del cached_rows[actual_date]
+
+        rates = fill_exchange_rates(
+            [RatesRow(actual_date, cached_rows[actual_date]) for actual_date in sorted(cached_rows)],
+            window_start,
+            today,
+        )
+        update_cache(rates)
+    else:
+        currency_cache["last_updated"] = datetime.now()
+
+    currency_cache["watermark"] = watermark
+    currency_cache["version"] = version
+
+
+def fetch_exchange_rate_rows(
+    db: Session,
+    start_date: date | None,
+    end_date: date | None = None,
+    updated_after: datetime | None = None,
+):
+    """
+    Fetch exchange rate rows from the database for dates from start_date till end_date.
+    The latest row before start_date is fetched too, as its rates are the ones known on start_date.
+    If updated_after is set, only rows written after it are fetched.
     """
     logger.info("Fetching exchange rate data from the database.")
-    rows = (
-        db.query(ExchangeRateHistory)
-        .filter(ExchangeRateHistory.actual_date >= start_date)
-        .order_by(ExchangeRateHistory.actual_date)
-        .all()
+    query = db.query(
+        ExchangeRateHistory.actual_date,
+        ExchangeRateHistory.rates,
+        ExchangeRateHistory.updated_at,
     )
-
-    if not rows:
-        raise ExchangeRateAbsentError("All", start_date)
+    if start_date is not None:
+        known_date = (
+            db.query(func.max(ExchangeRateHistory.actual_date))
+            .filter(ExchangeRateHistory.actual_date <= start_date)
+            .scalar()
+        )
+        query = query.filter(ExchangeRateHistory.actual_date >= (known_date or start_date))
+    if end_date is not None:
+        query = query.filter(ExchangeRateHistory.actual_date <= end_date)
+    if updated_after is not None:
+        query = query.filter(ExchangeRateHistory.updated_at > updated_after)
+    rows = query.order_by(ExchangeRateHistory.actual_date).all()
+
+    if not rows and updated_after is None:
+        raise ExchangeRateAbsentError("All", start_date or date.today())
     return rows
 
 
@@ -113,25 +442,61 @@ def forward_fill(rows, current_date_str, rates):
         raise ExchangeRateAbsentError("All", date.fromisoformat(current_date_str))
 
 
+def build_rates_table(rates: dict) -> RatesTable:
+    """
+    Convert {iso_date: {currency_code: rate}} into a RatesTable.
+    Dates are parsed once here, so lookups never touch date strings.
+    """
+    sorted_days = sorted(rates.items(), key=lambda x: x[0])
+    dates = [date.fromisoformat(date_str).toordinal() for date_str, _ in sorted_days]
+
+    columns: dict[str, list[Decimal | None]] = {}
+    for idx, (_, day_rates) in enumerate(sorted_days):
+        for currency_code, rate in day_rates.items():
+            if currency_code not in columns:
+                columns[currency_code] = [None] * len(dates)
+            columns[currency_code][idx] = Decimal(rate)
+
+    # forward-fill every column, so the lookup does not need to walk back to the latest known rate
+    for column in columns.values():
+        last_rate = None
+        for idx, rate in enumerate(column):
+            if rate is None:
+                column[idx] = last_rate
+            else:
+                last_rate = rate
+
+    return {"dates": dates, "rates": columns}
+
+
 def update_cache(rates):
     """
-    Update the global cache with the newly generated rates, sorting the data by date.
+    Update the global cache with the newly generated rates, indexed by date.
     """
     logger.info("Updating the cache with the latest exchange rates.")
     global currency_cache
-    sorted_rates = dict(sorted(rates.items(), key=lambda x: x[0], reverse=True))
-    currency_cache["data"] = sorted_rates
+    currency_cache["data"] = build_rates_table(rates)
     currency_cache["last_updated"] = datetime.now()
+    clear_cross_rates()
 
 
-def get_rate_with_fallback(exchange_rates: dict, calc_date: date, currency_code: str) -> Decimal:
+def get_rate_with_fallback(
+    exchange_rates: RatesTable | MappedRatesTable, calc_date: date, currency_code: str
+) -> Decimal:
     """
     Get the exchange rate for the given currency code and if absent, return the latest available rate.
     """
-    for date_str, rates in exchange_rates.items():
-        if date.fromisoformat(date_str) <= calc_date:
-            if currency_code in rates:
-                return Decimal(rates[currency_code])
+    if isinstance(exchange_rates, MappedRatesTable):
+        mapped_rate = exchange_rates.get_rate(calc_date, currency_code)
+        if mapped_rate is not None:
+            return mapped_rate
+    else:
+        column = exchange_rates["rates"].get(currency_code)
+        idx = bisect_right(exchange_rates["dates"], calc_date.toordinal()) - 1
+        if column is not None and idx >= 0:
+            rate = column[idx]
+            if rate is not None:
+                return rate
 
     logger.error(f"Exchange rate not found for {currency_code} for date {calc_date}")
     raise ExchangeRateAbsentError(currency_code, calc_date)
@@ -160,19 +525,75 @@ def calc_amount(
     if currency_code_from == user_base_currency_code:
         return src_amount
 
-    # Load exchange rates for the last year (from cache or database)
-    exchange_rates = get_exchange_rates_for_year(db)
+    # Perform the conversion with the rate from the source currency into the user's base currency
+    converted_amount = src_amount * get_cross_rate(currency_code_from, user_base_currency_code, calc_date, db)
+
+    return converted_amount
+
 
+def get_cross_rate(currency_code_from: str, currency_code_to: str, calc_date: date, db: Session) -> Decimal:
+    """
+    Get the rate to convert amounts from currency_code_from into currency_code_to on calc_date.
+    Rates are memoized in cross_rates_cache, the least recently used ones are evicted first.
+    """
+    # Load exchange rates (from cache or database), this also drops the cross rates if the rates are outdated
+    get_exchange_rates_for_year(db)
+
+    key = (currency_code_from, currency_code_to, calc_date.toordinal())
+    with _cross_rates_lock:
+        rate = cross_rates_cache.get(key)
+        if rate is not None:
+            cross_rates_stats["hits"] += 1
+            return rate
+        cross_rates_stats["misses"] += 1
+        generation = _cross_rates_generation
+
+    exchange_rates = get_exchange_rates_for_date(db, calc_date)
     # Get the exchange rate for the source currency
     exchange_rate_HBCR = get_rate_with_fallback(exchange_rates, calc_date, currency_code_from)
+    # Get the exchange rate for the target currency
+    target_currency_rate = get_rate_with_fallback(exchange_rates, calc_date, currency_code_to)
+    rate = target_currency_rate / exchange_rate_HBCR
 
-    # Get the exchange rate for the user's base currency
-    user_base_currency_rate = get_rate_with_fallback(exchange_rates, calc_date, user_base_currency_code)
+    with _cross_rates_lock:
+        if generation == _cross_rates_generation:
+            cross_rates_cache[key] = rate
+    return rate
 
-    # Perform the conversion
-    converted_amount = src_amount / Decimal(exchange_rate_HBCR) * Decimal(user_base_currency_rate)
 
-    return converted_amount
+def calc_amounts(
+    items: Sequence[tuple[Decimal, str, date]],
+    user_base_currency_code: str,
+    db: Session,
+) -> list[Decimal]:
+    """
+    Vectorized version of calc_amount: convert a whole result set into the user's base currency in one pass.
+    Cross rates are looked up once per (currency, date) pair and reused for all the items sharing it.
+    Items older than the recent rates load the history segments of their years.
+
+    Parameters:
+    - items: Sequence of (src_amount, currency_code_from, calc_date) tuples.
+    - user_base_currency_code: str, the user's base currency code.
+    - db: Session, the database session to query exchange rates.
+
+    Returns:
+    - list[Decimal]: The converted amounts in the same order as items.
+    """
+    pair_rates: dict[tuple[str, int], Decimal] = {}
+
+    converted_amounts: list[Decimal] = []
+    for src_amount, currency_code_from, calc_date in items:
+        if currency_code_from == user_base_currency_code:
+            converted_amounts.append(src_amount)
+            continue
+
+        key = (currency_code_from, calc_date.toordinal())
+        if key not in pair_rates:
+            pair_rates[key] = get_cross_rate(currency_code_from, user_base_currency_code, calc_date, db)
+
+        converted_amounts.append(src_amount * pair_rates[key])
+
+    return converted_amounts
 
 
 class ExchangeRateAbsentError(Exception):
@@ -0,0 +1,99 @@
+from datetime import date, datetime
+
+from icecream import ic
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.logger_config import logger
+from app.models.AccountDailyBalance import AccountDailyBalance
+
+ic.configureOutput(includeContext=True)
+
+# Daily balances of :account_id (all the accounts if NULL) on the days at or after :since (all the days if NULL)
+DELETE_ACCOUNT_DAILY_BALANCES_SQL = text("""
+    DELETE FROM account_daily_balances
+    WHERE (CAST(:account_id AS integer) IS NULL OR account_id = :account_id)
+        AND (CAST(:since AS date) IS NULL OR day >= CAST(:since AS date))
+""")
+
+# Closing balances of the same accounts and days: new_balance of the last not deleted transaction of every day
+INSERT_ACCOUNT_DAILY_BALANCES_SQL = text("""
+    INSERT INTO account_daily_balances (account_id, day, balance)
+    SELECT DISTINCT ON (account_id, CAST(date_time AS date)) account_id, CAST(date_time AS date), new_balance
+    FROM transactions
+    WHERE is_deleted = false
+        AND date_time IS NOT NULL
+        AND new_balance IS NOT NULL
+        AND (CAST(:account_id AS integer) IS NULL OR account_id = :account_id)
+        AND (CAST(:since AS date) IS NULL OR CAST(date_time AS date) >= CAST(:since AS date))
+    ORDER BY account_id, CAST(date_time AS date), date_time DESC, id DESC
+""")
+
+# Rewrite only the daily balances of all the accounts which differ from their transactions,
+# returns the users whose balances were inserted, updated or deleted
+REPAIR_ACCOUNT_DAILY_BALANCES_SQL = text("""
+    WITH expected AS (
+        SELECT DISTINCT ON (account_id, CAST(date_time AS date))
+            account_id, CAST(date_time AS date) AS day, new_balance AS balance
+        FROM transactions
+        WHERE is_deleted = false
+            AND date_time IS NOT NULL
+            AND new_balance IS NOT NULL
+        ORDER BY account_id, CAST(date_time AS date), date_time DESC, id DESC
+    ),
+    deleted AS (
+        DELETE FROM account_daily_balances adb
+        WHERE NOT EXISTS (SELECT 1 FROM expected WHERE expected.account_id = adb.account_id AND expected.day = adb.day)
+        RETURNING adb.account_id
+    ),
+    upserted AS (
+        INSERT INTO account_daily_balances (account_id, day, balance)
+        SELECT account_id, day, balance
+        FROM expected
+        ON CONFLICT (account_id, day) DO UPDATE SET balance = excluded.balance
+        WHERE account_daily_balances.balance IS DISTINCT FROM excluded.balance
+        RETURNING account_id
+    )
+    SELECT DISTINCT user_id
+    FROM accounts
+    WHERE id IN (SELECT account_id FROM deleted UNION SELECT account_id FROM upserted)
+    ORDER BY user_id
+""")
+
+
+def refresh_account_daily_balances(db: Session, account_id: int | None = None, since: date | datetime | None = None):
+    """
+    Rewrite the daily balances of account_id (all the accounts if None) from the day of since (all the days if None)
+    with new_balance of its transactions, which must be up to date. The caller commits.
+    """
+    # since is cast to the date in SQL, so its day is the same as the days of the transactions
+    params = {'account_id': account_id, 'since': since}
+    db.execute(DELETE_ACCOUNT_DAILY_BALANCES_SQL, params)
+    db.execute(INSERT_ACCOUNT_DAILY_BALANCES_SQL, params)
+
+
+def rebuild_account_daily_balances(db: Session) -> list[int]:
+    """
+    Repair the daily balances of all the accounts, only the wrong ones are rewritten.
+    Returns the ids of the users whose balances were repaired.
+    """
+    user_ids = list(db.execute(REPAIR_ACCOUNT_DAILY_BALANCES_SQL).scalars())
+    db.commit()
+
+    logger.info(f'Account daily balances are rebuilt, repaired users: {user_ids}')
+
+    return user_ids
+
+
+def latest_account_daily_balance(account_id, balance_date: date):
+    """
+    Lateral subquery with the balance of account_id (a column of the outer query) at the end of balance_date.
+    No row if the account has no transactions till then.
+    """
+    return (
+        select(AccountDailyBalance.balance)
+        .where(AccountDailyBalance.account_id == account_id, AccountDailyBalance.day <= balance_date)
+        .order_by(AccountDailyBalance.day.desc())
+        .limit(1)
+        .lateral()
+    )
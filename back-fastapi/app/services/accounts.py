@@ -10,7 +10,9 @@ from app.models.AccountType import AccountType
 from app.models.Currency import Currency
 from app.models.User import User
 from app.schemas.account_schema import CreateAccountSchema, UpdateAccountSchema
+from app.services.base_currency_amounts import reset_base_currency_amounts
 from app.services.CurrencyProcessor import calc_amount
+from app.services.data_versions import bump_user_data_version
 from app.services.errors import (
     AccessDenied,
     InvalidAccount,
@@ -19,6 +21,7 @@ from app.services.errors import (
     InvalidUser,
     NotFoundError,
 )
+from app.tasks.tasks import materialize_transactions_base_currency_amounts
 
 ic.configureOutput(includeContext=True)
 
@@ -40,6 +43,7 @@ def create_account(account_dto: CreateAccountSchema | UpdateAccountSchema, user_
     if account_dto.opening_date is None:
         account_dto.opening_date = datetime.now(UTC)
 
+    is_currency_changed = False
     if hasattr(account_dto, 'id'):
         account = db.execute(
             select(Account).where(Account.id == account_dto.id, Account.user_id == user_id)
@@ -49,6 +53,10 @@ def create_account(account_dto: CreateAccountSchema | UpdateAccountSchema, user_
         if account:
             account.user = existing_user
             account.account_type = account_type
+            if account.currency_id != currency.id:
+                # amounts converted from the old currency are not served, they are converted on read till materialized
+                reset_base_currency_amounts(db, user_id, account.id)
+                is_currency_changed = True
             account.currency = currency
             if account_dto.initial_balance:
                 account.initial_balance = account_dto.initial_balance
@@ -75,6 +83,10 @@ def create_account(account_dto: CreateAccountSchema | UpdateAccountSchema, user_
     db.add(account)
     db.commit()
     db.refresh(account)
+    bump_user_data_version(user_id)
+
+    if is_currency_changed:
+        materialize_transactions_base_currency_amounts.delay(user_id=user_id)  # type: ignore
 
     return account
 
@@ -130,6 +142,7 @@ def delete_account(account_id: int, user_id: int, db: Session) -> Account:
     account = get_account_details(account_id, user_id, db)
     account.is_deleted = True
     db.commit()
+    bump_user_data_version(user_id)
     return account
 
 
@@ -138,5 +151,6 @@ def set_archive_status(account_id: int, is_archived: bool, user_id: int, db: Ses
     account.is_archived = is_archived
     account.archived_at = datetime.now(UTC)
     db.commit()
+    bump_user_data_version(user_id)
 
     return True
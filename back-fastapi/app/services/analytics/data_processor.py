@@ -1,15 +1,16 @@
 from datetime import date
 from typing import Any, Dict, List, cast
 
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
 from app.logger_config import logger
 from app.models.Account import Account
+from app.models.DailyLedgerRollup import DailyLedgerRollup
 from app.models.Transaction import Transaction
 from app.models.User import User
 from app.models.UserCategory import UserCategory
-from app.services.CurrencyProcessor import calc_amount
+from app.services.base_currency_amounts import get_base_currency_amounts
 
 
 class ExpenseDataProcessor:
@@ -51,21 +52,17 @@ class ExpenseDataProcessor:
 
             results = self.db.execute(query).all()
 
+            base_currency_amounts = get_base_currency_amounts(
+                [result.Transaction for result in results], user.base_currency.code, self.db
+            )
+
             transactions_data = []
-            for result in results:
+            for result, base_currency_amount in zip(results, base_currency_amounts):
                 transaction = result.Transaction
                 transactions_data.append(
                     {
                         'id': transaction.id,
-                        'amount': float(
-                            calc_amount(
-                                transaction.amount,
-                                transaction.account.currency.code,
-                                transaction.date_time.date(),
-                                user.base_currency.code,
-                                self.db,
-                            )
-                        ),
+                        'amount': float(base_currency_amount),
                         'currency': user.base_currency.code,
                         'date': transaction.date_time.strftime('%Y-%m-%d'),
                         'label': transaction.label or '',
@@ -117,23 +114,26 @@ class ExpenseDataProcessor:
 
     def get_category_summary(self, start_date: date, end_date: date) -> Dict[str, Any]:
         try:
+            # income and expenses come summed up per category and day from the rollup
             query = (
                 select(
                     UserCategory.name,
-                    Transaction.amount.label('amount'),
-                    Transaction.is_income,
+                    func.sum(DailyLedgerRollup.income).label('income'),
+                    func.sum(DailyLedgerRollup.expense).label('expense'),
+                    func.sum(DailyLedgerRollup.count).label('count'),
                 )
+                .select_from(DailyLedgerRollup)
                 .join(
                     UserCategory,
-                    Transaction.category_id == UserCategory.id,
+                    DailyLedgerRollup.category_id == UserCategory.id,
                     isouter=True,
                 )
                 .where(
-                    Transaction.user_id == self.user_id,
-                    Transaction.date_time >= start_date,
-                    Transaction.date_time <= end_date,
-                    ~Transaction.is_transfer,
+                    DailyLedgerRollup.user_id == self.user_id,
+                    DailyLedgerRollup.day >= start_date,
+                    DailyLedgerRollup.day <= end_date,
                 )
+                .group_by(UserCategory.name)
             )
 
             results = self.db.execute(query).all()
@@ -141,17 +141,13 @@ class ExpenseDataProcessor:
             category_summary = {}
             for result in results:
                 category = result.name or 'No Category'
-                amount = float(result.amount)
 
                 if category not in category_summary:
                     category_summary[category] = {'expense': 0, 'income': 0, 'count': 0}
 
-                if result.is_income:
-                    category_summary[category]['income'] += amount
-                else:
-                    category_summary[category]['expense'] += amount
-
-                category_summary[category]['count'] += 1
+                category_summary[category]['income'] += float(result.income)
+                category_summary[category]['expense'] += float(result.expense)
+                category_summary[category]['count'] += result.count
 
             return category_summary
 
@@ -17,6 +17,8 @@ from app.models.User import DEFAULT_CURRENCY_CODE, User
 from app.models.UserCategory import UserCategory
 from app.schemas.token_schema import Token
 from app.schemas.user_schema import UserLoginSchema, UserRegistration
+from app.services.category_tree import invalidate_category_tree
+from app.services.data_versions import bump_user_data_version
 from app.services.errors import NotFoundError, UserNotActivated
 from app.services.user_settings import generate_initial_settings
 from app.tasks.tasks import send_activation_email
@@ -59,6 +61,8 @@ def copy_all_categories(user_id: int, db: Session):
     root_categories = db.query(DefaultCategory).filter(DefaultCategory.parent_id == None).all()  # noqa: E711
     for root_category in root_categories:
         copy_categories(root_category, user_id, db, None)
+    invalidate_category_tree(user_id)
+    bump_user_data_version(user_id)
 
 
 def create_users(user_request: UserRegistration, db: Session, is_oauth: bool = False):
@@ -0,0 +1,115 @@
+from datetime import date
+from decimal import Decimal
+from typing import Sequence
+
+from icecream import ic
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from app.logger_config import logger
+from app.models.Transaction import Transaction
+from app.services.CurrencyProcessor import ExchangeRateAbsentError, calc_amount, calc_amounts
+
+ic.configureOutput(includeContext=True)
+
+# base_currency_amount of the transactions (of :user_id, all the users if NULL) dated at or after :since
+# (all the dates if NULL), converted with the daily rates of the transaction date.
+# Dates later than the latest known rates use the latest ones, the amount is NULL when a rate is absent.
+MATERIALIZE_BASE_CURRENCY_AMOUNTS_SQL = text("""
+    UPDATE transactions
+    SET base_currency_amount = converted.amount
+    FROM (
+        SELECT t.id,
+            CASE
+                WHEN currency.code = base_currency.code THEN t.amount
+                ELSE t.amount / from_rate.rate * base_rate.rate
+            END AS amount
+        FROM transactions t
+        JOIN accounts account ON account.id = t.account_id
+        JOIN currencies currency ON currency.id = account.currency_id
+        JOIN users u ON u.id = t.user_id
+        JOIN currencies base_currency ON base_currency.id = u.base_currency_id
+        LEFT JOIN daily_exchange_rates from_rate
+            ON from_rate.currency_code = currency.code
+            AND from_rate.actual_date = greatest(
+                least(CAST(t.date_time AS date), (SELECT max(actual_date) FROM daily_exchange_rates)),
+                (SELECT min(actual_date) FROM daily_exchange_rates)
+            )
+        LEFT JOIN daily_exchange_rates base_rate
+            ON base_rate.currency_code = base_currency.code
+            AND base_rate.actual_date = from_rate.actual_date
+        WHERE (CAST(:user_id AS integer) IS NULL OR t.user_id = :user_id)
+            AND (CAST(:since AS date) IS NULL OR t.date_time >= :since)
+    ) converted
+    WHERE transactions.id = converted.id
+        AND transactions.base_currency_amount IS DISTINCT FROM converted.amount
+""")
+
+
+def calc_base_currency_amount(transaction: Transaction, base_currency_code: str, db: Session) -> Decimal | None:
+    """
+    Convert the amount of the transaction into base_currency_code with the rates of the transaction date.
+    None if the rates are absent, such transactions are converted on read.
+    """
+    try:
+        return calc_amount(
+            transaction.amount,
+            transaction.account.currency.code,
+            transaction.date_time.date(),  # type: ignore
+            base_currency_code,
+            db,
+        )
+    except ExchangeRateAbsentError as e:
+        logger.warning(f'Base currency amount of transaction {transaction.id} is left empty: {e}')
+        return None
+
+
+def get_base_currency_amounts(
+    transactions: Sequence[Transaction], base_currency_code: str, db: Session
+) -> list[Decimal]:
+    """
+    Stored base currency amounts of the transactions, the ones which are not stored yet are converted in one pass.
+    Transactions must have account.currency loaded.
+    """
+    missing = [idx for idx, transaction in enumerate(transactions) if transaction.base_currency_amount is None]
+    amounts = [transaction.base_currency_amount for transaction in transactions]
+    if missing:
+        converted_amounts = calc_amounts(
+            [
+                (
+                    transactions[idx].amount,
+                    transactions[idx].account.currency.code,
+                    transactions[idx].date_time.date(),  # type: ignore
+                )
+                for idx in missing
+            ],
+            base_currency_code,
+            db,
+        )
+        for idx, converted_amount in zip(missing, converted_amounts):
+            amounts[idx] = converted_amount
+
+    return amounts
+
+
+def materialize_base_currency_amounts(db: Session, user_id: int | None = None, since: date | None = None) -> int:
+    """
+    Rewrite base_currency_amount of the transactions of user_id (all the users if None)
+    dated at or after since (all the dates if None). Returns the number of the updated transactions.
+    """
+    result = db.execute(MATERIALIZE_BASE_CURRENCY_AMOUNTS_SQL, {'user_id': user_id, 'since': since})
+    db.commit()
+    logger.info(f'Base currency amounts of {result.rowcount} transactions are updated')  # type: ignore
+
+    return result.rowcount  # type: ignore
+
+
+def reset_base_currency_amounts(db: Session, user_id: int, account_id: int | None = None):
+    """
+    Forget the stored base currency amounts of the user (only of account_id if set),
+    they are converted on read till they are materialized again. The caller commits.
+    """
+    query = update(Transaction).where(Transaction.user_id == user_id, Transaction.base_currency_amount.is_not(None))
+    if account_id is not None:
+        query = query.where(Transaction.account_id == account_id)
+    db.execute(query.values(base_currency_amount=None).execution_options(synchronize_session=False))
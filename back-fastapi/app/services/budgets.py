@@ -3,18 +3,64 @@ from decimal import Decimal
 
 import pendulum
 from icecream import ic
+from sqlalchemy import text, update
 from sqlalchemy.orm import Session, joinedload
 
 from app.logger_config import logger
+from app.models.Account import Account
 from app.models.Budget import Budget, PeriodEnum
+from app.models.BudgetCategory import BudgetCategory
+from app.models.Currency import Currency
 from app.models.Transaction import Transaction
 from app.models.UserCategory import UserCategory
 from app.schemas.budgets_schema import EditBudgetInputSchema, NewBudgetInputSchema
-from app.services.CurrencyProcessor import calc_amount
+from app.services.CurrencyProcessor import ExchangeRateAbsentError, calc_amount
+from app.services.data_versions import bump_user_data_version
 from app.services.errors import InvalidPeriod, NotFoundError
 
 ic.configureOutput(includeContext=True)
 
+# collected amounts which differ by less are considered equal, they are sums of the same amounts in different order
+COLLECTED_AMOUNT_TOLERANCE = Decimal("0.01")
+
+# Expenses of the categories of every budget of :budget_ids within the budget dates, converted into the budget
+# currency with the daily rates of the transaction date. Dates later than the latest known rates use the latest ones.
+BUDGETS_COLLECTED_AMOUNTS_SQL = text("""
+    SELECT b.id AS budget_id,
+        coalesce(sum(
+            CASE
+                WHEN currency.code = budget_currency.code THEN t.amount
+                ELSE t.amount / from_rate.rate * budget_rate.rate
+            END
+        ), 0) AS collected_amount,
+        count(t.id) FILTER (
+            WHERE currency.code <> budget_currency.code AND (from_rate.rate IS NULL OR budget_rate.rate IS NULL)
+        ) AS absent_rates_count
+    FROM budgets b
+    JOIN currencies budget_currency ON budget_currency.id = b.currency_id
+    LEFT JOIN budget_categories bc ON bc.budget_id = b.id
+    LEFT JOIN transactions t
+        ON t.category_id = bc.category_id
+        AND t.user_id = b.user_id
+        AND t.is_deleted = false
+        AND t.is_transfer = false
+        AND t.is_income = false
+        AND t.date_time BETWEEN b.start_date AND b.end_date
+    LEFT JOIN accounts account ON account.id = t.account_id
+    LEFT JOIN currencies currency ON currency.id = account.currency_id
+    LEFT JOIN daily_exchange_rates from_rate
+        ON from_rate.currency_code = currency.code
+        AND from_rate.actual_date = greatest(
+            least(CAST(t.date_time AS date), (SELECT max(actual_date) FROM daily_exchange_rates)),
+            (SELECT min(actual_date) FROM daily_exchange_rates)
+        )
+    LEFT JOIN daily_exchange_rates budget_rate
+        ON budget_rate.currency_code = budget_currency.code
+        AND budget_rate.actual_date = from_rate.actual_date
+    WHERE b.id = ANY(:budget_ids)
+    GROUP BY b.id
+""")
+
 
 def create_new_budget(user_id: int, db: Session, budget_dto: NewBudgetInputSchema | EditBudgetInputSchema) -> Budget:
     """Create new budget"""
@@ -49,6 +95,7 @@ def create_new_budget(user_id: int, db: Session, budget_dto: NewBudgetInputSchem
         budget.start_date = budget_dto.start_date
         budget.end_date = budget_dto.end_date + timedelta(days=1)  # add 1 day to include the full end date
         budget.included_categories = included_categories_str
+        budget.category_links = [BudgetCategory(category_id=category_id) for category_id in included_categories]
         budget.comment = str(budget_dto.comment)
 
         db.add(budget)
@@ -60,6 +107,7 @@ def create_new_budget(user_id: int, db: Session, budget_dto: NewBudgetInputSchem
 
     db.refresh(budget)
     fill_budget_with_existing_transactions(db, budget)
+    bump_user_data_version(user_id)
 
     return budget
 
@@ -72,36 +120,27 @@ def update_budget(user_id: int, db: Session, budget_dto: NewBudgetInputSchema |
 
 def fill_budget_with_existing_transactions(db: Session, budget: Budget):
     """Fill budget with existing transactions"""
-    logger.info(f"Filling budget with existing transactions for budget: {budget.id}")
-
-    transactions: list[Transaction] = (
-        db.query(Transaction)
-        .filter(  # type: ignore
-            Transaction.user_id == budget.user_id,
-            Transaction.is_deleted.is_(False),
-            Transaction.is_transfer.is_(False),
-            Transaction.is_income.is_(False),
-            Transaction.date_time.between(budget.start_date, budget.end_date),
-        )
-        .all()
-    )
+    fill_budgets_with_existing_transactions(db, [budget])
 
-    included_categories = [int(category_id) for category_id in budget.included_categories.split(",")]
-
-    budget.collected_amount = Decimal(0)
-    for transaction in transactions:
-        if transaction.category_id in included_categories:
-            adjusted_amount: Decimal = calc_amount(
-                transaction.amount,
-                transaction.account.currency.code,
-                transaction.date_time.date(),
-                budget.currency.code,
-                db,
-            )
-            budget.collected_amount += adjusted_amount
+
+def fill_budgets_with_existing_transactions(db: Session, budgets: list[Budget]):
+    """
+    Recalculate collected amounts of the budgets from their transactions with one aggregate query.
+    Budgets with expenses which can not be converted into the budget currency are left as they are.
+    """
+    if not budgets:
+        return
+    logger.info(f"Filling budgets with existing transactions: {[budget.id for budget in budgets]}")
+
+    budgets_by_id = {budget.id: budget for budget in budgets}
+    for row in db.execute(BUDGETS_COLLECTED_AMOUNTS_SQL, {"budget_ids": list(budgets_by_id)}):
+        if row.absent_rates_count:
+            logger.warning(f"Budget {row.budget_id} is not filled, {row.absent_rates_count} expenses lack rates")
+            continue
+        budgets_by_id[row.budget_id].collected_amount = row.collected_amount
 
     db.commit()
-    logger.info(f"Filled budget with existing transactions for budget: {budget.id}")
+    logger.info(f"Filled {len(budgets)} budgets with existing transactions")
 
 
 def update_budget_with_amount(
@@ -115,17 +154,99 @@ def update_budget_with_amount(
         db.query(Budget)
         .filter(
             Budget.user_id == user_id,
+            Budget.is_deleted.is_(False),
         )
         .all()
     )
 
     # just update all budgets not to complicate the logic
-    for budget in user_budgets:
-        fill_budget_with_existing_transactions(db, budget)
+    fill_budgets_with_existing_transactions(db, user_budgets)
+    bump_user_data_version(user_id)
 
     logger.info(f"Updated budgets for user with id: {user_id}")
 
 
+def apply_transaction_to_budgets(
+    db: Session,
+    user_id: int,
+    prev_transaction: Transaction | None,
+    transaction: Transaction | None,
+):
+    """
+    Move the amount of a changed transaction from the active budgets matching its previous state
+    to the ones matching its current state. None or a deleted state stands for the state
+    of a created or deleted transaction. Budgets are changed in place, the caller commits.
+    """
+    for state, sign in ((prev_transaction, -1), (transaction, 1)):
+        if state is None or state.is_deleted or state.is_income or state.is_transfer or state.date_time is None:
+            continue
+
+        budgets: list[Budget] = (
+            db.query(Budget)  # type: ignore
+            .options(joinedload(Budget.currency))
+            .filter(
+                Budget.user_id == user_id,
+                Budget.is_deleted.is_(False),
+                Budget.is_archived.is_(False),
+                Budget.start_date <= state.date_time,
+                Budget.end_date >= state.date_time,
+                Budget.category_links.any(BudgetCategory.category_id == state.category_id),
+            )
+            .all()
+        )
+        if not budgets:
+            continue
+
+        currency_code: str = (
+            db.query(Currency.code)
+            .join(Account, Account.currency_id == Currency.id)
+            .filter(Account.id == state.account_id)
+            .scalar()
+        )
+        for budget in budgets:
+            try:
+                amount = calc_amount(state.amount, currency_code, state.date_time.date(), budget.currency.code, db)
+            except ExchangeRateAbsentError as e:
+                # the budget is refilled by the nightly repair once the rates are there
+                logger.warning(f"Budget {budget.id} is not changed by transaction {state.id}: {e}")
+                continue
+            # concurrent changes of other transactions must not overwrite each other
+            db.execute(
+                update(Budget)
+                .where(Budget.id == budget.id)
+                .values(collected_amount=Budget.collected_amount + sign * amount)
+            )
+            logger.info(f"Budget {budget.id} collected amount is changed by {sign * amount}")
+
+
+def repair_budgets(db: Session) -> list[int]:
+    """
+    Refill all the active budgets from their transactions and report the ones whose collected amount was wrong.
+    Budgets are changed incrementally with every transaction, this is the safety net for the missed changes.
+    """
+    budgets: list[Budget] = (
+        db.query(Budget)  # type: ignore
+        .filter(Budget.is_deleted.is_(False), Budget.is_archived.is_(False))
+        .all()
+    )
+
+    collected_amounts = {budget.id: budget.collected_amount for budget in budgets}
+    fill_budgets_with_existing_transactions(db, budgets)
+
+    repaired_budgets = []
+    for budget in budgets:
+        collected_amount = collected_amounts[budget.id]
+        if abs(budget.collected_amount - collected_amount) >= COLLECTED_AMOUNT_TOLERANCE:
+            logger.warning(
+                f"Budget {budget.id} collected amount is repaired: {collected_amount} -> {budget.collected_amount}"
+            )
+            repaired_budgets.append(budget.id)
+
+    logger.info(f"Checked {len(budgets)} budgets, repaired budgets: {repaired_budgets}")
+
+    return repaired_budgets
+
+
 def get_user_budgets(user_id: int, db: Session, include: str = "all") -> list[Budget]:
     """Get all budgets for user"""
     logger.info(f"Getting all budgets for user_id: {user_id}")
@@ -167,6 +288,7 @@ def delete_budget(user_id: int, db: Session, budget_id: int):
     budget.is_deleted = True
     db.commit()
     db.refresh(budget)
+    bump_user_data_version(user_id)
     logger.info(f"Deleted budget with id: {budget_id}")
 
     return budget
@@ -189,6 +311,7 @@ def archive_budget(user_id: int, db: Session, budget_id: int):
     budget.is_archived = True
     db.commit()
     db.refresh(budget)
+    bump_user_data_version(user_id)
     logger.info(f"Archived budget with id: {budget_id}")
 
     return budget
@@ -220,6 +343,7 @@ def put_outdated_budgets_to_archive(db: Session):
             create_copy_of_outdated_budget(db, budget)
         budget.is_archived = True
         db.commit()
+        bump_user_data_version(budget.user_id)
         archiving_budgets.append(budget.id)
 
     logger.info(f"Archived budgets: {archiving_budgets}")
@@ -258,6 +382,7 @@ def create_copy_of_outdated_budget(db: Session, budget: Budget):
         start_date=new_start_date,
         end_date=new_end_date,
         included_categories=budget.included_categories,
+        category_links=[BudgetCategory(category_id=link.category_id) for link in budget.category_links],
         comment=budget.comment,
         is_deleted=False,
         is_archived=False,
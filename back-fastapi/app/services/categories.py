@@ -7,79 +7,44 @@ from app.schemas.category_schema import (
     CategoryCreateUpdateSchema,
     GroupedCategorySchema,
 )
+from app.services.category_tree import CategoryNode, get_category_tree, invalidate_category_tree
+from app.services.data_versions import bump_user_data_version
 
 ic.configureOutput(includeContext=True)
 
 
-def get_user_categories(user_id: int, db: Session, include_deleted: bool = False) -> list[UserCategory]:
-    query = db.query(UserCategory).filter_by(user_id=user_id)
-
-    if not include_deleted:
-        query = query.filter(UserCategory.is_deleted == False)
-
-    categories = query.order_by(UserCategory.is_income, UserCategory.name).all()
-
-    def add_children(category: UserCategory, result_list: list, parent_name: str | None = None):
-        if parent_name:
-            category_display_name = f"{parent_name} >> {category.name}"
-        else:
-            category_display_name = category.name
-
-        prefix = "+" if category.is_income else "-"
-        category.name = f"({prefix}) {category_display_name}"
-
-        result_list.append(category)
-
-        children = [cat for cat in categories if cat.parent_id == category.id]
-        for child in sorted(children, key=lambda x: x.name):
-            add_children(child, result_list, category_display_name)
-
-    result: list[UserCategory] = []
-    for category in categories:
-        if category.parent_id is None:
-            add_children(category, result)
-
-    return result
+def get_user_categories(user_id: int, db: Session, include_deleted: bool = False) -> list[dict]:
+    """User categories with their full names, every category goes right after its parent"""
+    return [
+        {
+            "id": node["id"],
+            "user_id": node["user_id"],
+            "name": f"({'+' if node['is_income'] else '-'}) {node['full_name']}",
+            "parent_id": node["parent_id"],
+            "is_income": node["is_income"],
+            "created_at": node["created_at"],
+            "updated_at": node["updated_at"],
+        }
+        for node in get_category_tree(user_id, db, include_deleted)
+    ]
 
 
 def grouped_user_categories(user_id: int, db: Session, include_deleted: bool = False) -> GroupedCategorySchema:
-    query = db.query(UserCategory).filter(UserCategory.user_id == user_id)
-
-    if not include_deleted:
-        query = query.filter(UserCategory.is_deleted == False).order_by(UserCategory.name)
-
-    raw_categories: list[UserCategory] = query.all()
-
-    categories_dict: dict[int, UserCategory] = {}
-
-    income_categories: list[dict] = []
-    expense_categories: list[dict] = []
-
-    for category in raw_categories:
-        categories_dict[category.id] = category
-        category.children = []
-
-    for category in raw_categories:
-        if category.parent_id:
-            categories_dict[category.parent_id].children.append(category)
-        else:
-            if category.is_income:
-                income_categories.append(category)
-            else:
-                expense_categories.append(category)
+    nodes = {node["id"]: node for node in get_category_tree(user_id, db, include_deleted)}
 
-    def category_to_dict(category):
+    def category_to_dict(node: CategoryNode) -> dict:
         return {
-            "id": category.id,
-            "name": category.name,
-            "parentId": category.parent_id,
-            "isIncome": category.is_income,
-            "children": [category_to_dict(child) for child in category.children],
+            "id": node["id"],
+            "name": node["name"],
+            "parentId": node["parent_id"],
+            "isIncome": node["is_income"],
+            "children": [category_to_dict(nodes[child_id]) for child_id in node["children"]],
         }
 
+    roots = [node for node in nodes.values() if node["parent_id"] is None]
     grouped_categories = {
-        "income": [category_to_dict(category) for category in income_categories],
-        "expenses": [category_to_dict(category) for category in expense_categories],
+        "income": [category_to_dict(node) for node in roots if node["is_income"]],
+        "expenses": [category_to_dict(node) for node in roots if not node["is_income"]],
     }
 
     return GroupedCategorySchema(**grouped_categories)
@@ -106,6 +71,8 @@ def create_or_update_category(user_id: int, db: Session, category_data: Category
         db.add(category)
         db.commit()
         db.refresh(category)
+    invalidate_category_tree(user_id)
+    bump_user_data_version(user_id)
 
     return category
 
@@ -117,6 +84,8 @@ def delete_category(user_id: int, category_id: int, db: Session) -> UserCategory
         )
         category.is_deleted = True
         db.commit()
+        invalidate_category_tree(user_id)
+        bump_user_data_version(user_id)
     except Exception as e:
         logger.error(f"Error deleting category: {e}")
         raise e
@@ -0,0 +1,116 @@
+import json
+from collections import defaultdict
+from typing import Iterable, TypedDict
+
+from icecream import ic
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.logger_config import logger
+from app.models.UserCategory import UserCategory
+from app.utils.redis_client import get_redis
+
+ic.configureOutput(includeContext=True)
+
+CATEGORY_TREE_KEY = 'category_tree:{user_id}'
+FULL_NAME_SEPARATOR = ' >> '
+
+
+class CategoryNode(TypedDict):
+    id: int
+    user_id: int
+    name: str
+    full_name: str  # names of all the ancestors and the category joined with FULL_NAME_SEPARATOR
+    parent_id: int | None
+    parent_name: str | None
+    is_income: bool
+    depth: int  # 0 for the root categories
+    children: list[int]
+    created_at: str | None
+    updated_at: str | None
+
+
+def build_category_tree(categories: Iterable[UserCategory]) -> list[CategoryNode]:
+    """
+    Build the tree of the categories in one pass, whatever the depth.
+    Returns the nodes in the depth-first order: every category goes right after its parent,
+    the siblings keep the order of the categories. Categories whose parent is not among the categories are skipped.
+    The categories themselves are not changed.
+    """
+    categories = list(categories)
+    ids = {category.id for category in categories}
+    children_by_parent: dict[int | None, list[UserCategory]] = defaultdict(list)
+    for category in categories:
+        parent_id = category.parent_id if category.parent_id in ids else None
+        if category.parent_id is not None and parent_id is None:
+            continue
+        children_by_parent[parent_id].append(category)
+
+    nodes: list[CategoryNode] = []
+    stack: list[tuple[UserCategory, CategoryNode | None]] = [
+        (category, None) for category in reversed(children_by_parent[None])
+    ]
+    while stack:
+        category, parent = stack.pop()
+        node: CategoryNode = {
+            'id': category.id,
+            'user_id': category.user_id,
+            'name': category.name,
+            'full_name': f"{parent['full_name']}{FULL_NAME_SEPARATOR}{category.name}" if parent else category.name,
+            'parent_id': parent['id'] if parent else None,
+            'parent_name': parent['name'] if parent else None,
+            'is_income': category.is_income,
+            'depth': parent['depth'] + 1 if parent else 0,
+            'children': [child.id for child in children_by_parent[category.id]],
+            'created_at': category.created_at.isoformat() if category.created_at else None,
+            'updated_at': category.updated_at.isoformat() if category.updated_at else None,
+        }
+        nodes.append(node)
+        stack.extend((child, node) for child in reversed(children_by_parent[category.id]))
+
+    return nodes
+
+
+def get_category_tree(user_id: int, db: Session, include_deleted: bool = False) -> list[CategoryNode]:
+    """
+    Tree of the user's categories (see build_category_tree), income ones go after the expense ones,
+    the siblings are ordered by name. The tree of not deleted categories is cached per user.
+    """
+    if include_deleted:
+        return _load_category_tree(user_id, db, include_deleted)
+
+    key = CATEGORY_TREE_KEY.format(user_id=user_id)
+    try:
+        cached_tree = get_redis().get(key)
+        if cached_tree is not None:
+            return json.loads(cached_tree)
+    except RedisError as e:
+        logger.warning(f'Unable to get category tree of user {user_id}: {e}')
+
+    tree = _load_category_tree(user_id, db, include_deleted)
+    try:
+        get_redis().set(key, json.dumps(tree), ex=settings.CATEGORY_TREE_CACHE_SECONDS)
+    except RedisError as e:
+        logger.warning(f'Unable to cache category tree of user {user_id}: {e}')
+
+    return tree
+
+
+def invalidate_category_tree(user_id: int):
+    """Forget the cached category tree of the user, must be called after the user's categories are changed"""
+    try:
+        get_redis().delete(CATEGORY_TREE_KEY.format(user_id=user_id))
+    except RedisError as e:
+        logger.warning(f'Unable to invalidate category tree of user {user_id}: {e}')
+
+
+def _load_category_tree(user_id: int, db: Session, include_deleted: bool) -> list[CategoryNode]:
+    query = select(UserCategory).where(UserCategory.user_id == user_id)
+    if not include_deleted:
+        query = query.where(UserCategory.is_deleted == False)  # noqa: E712
+
+    categories = db.execute(query.order_by(UserCategory.is_income, UserCategory.name)).scalars().all()
+
+    return build_category_tree(categories)
@@ -0,0 +1,106 @@
+from datetime import date
+from typing import Any
+
+from icecream import ic
+from sqlalchemy import ColumnElement, and_, case, func, select, text
+from sqlalchemy.orm import Session, aliased
+
+from app.logger_config import logger
+from app.models.DailyExchangeRate import DailyExchangeRate
+from app.models.ExchangeRateHistory import ExchangeRateHistory
+
+ic.configureOutput(includeContext=True)
+
+# Every rate of every `exchange_rates` row becomes a point, points are spread over all the days
+# till the next point of the same currency. Days run till the latest rates or today, whichever is later.
+SYNC_DAILY_EXCHANGE_RATES_SQL = text("""
+    WITH known_date AS (
+        SELECT coalesce(max(actual_date), CAST(:start_date AS date)) AS actual_date
+        FROM exchange_rates
+        WHERE actual_date <= CAST(:start_date AS date)
+    ),
+    points AS (
+        SELECT DISTINCT ON (er.actual_date, rate.key)
+            er.actual_date, rate.key AS currency_code, CAST(rate.value AS numeric) AS rate
+        FROM exchange_rates er
+        CROSS JOIN LATERAL jsonb_each_text(er.rates) rate
+        WHERE er.actual_date >= (SELECT actual_date FROM known_date) AND length(rate.key) = 3
+        ORDER BY er.actual_date, rate.key, er.updated_at DESC
+    ),
+    days AS (
+        SELECT CAST(day AS date) AS actual_date
+        FROM generate_series(
+            (SELECT min(actual_date) FROM points),
+            greatest((SELECT max(actual_date) FROM points), current_date),
+            interval '1 day'
+        ) day
+    ),
+    grid AS (
+        SELECT days.actual_date, codes.currency_code, points.rate,
+            count(points.rate) OVER (PARTITION BY codes.currency_code ORDER BY days.actual_date) AS rate_group
+        FROM days
+        CROSS JOIN (SELECT DISTINCT currency_code FROM points) codes
+        LEFT JOIN points ON points.actual_date = days.actual_date AND points.currency_code = codes.currency_code
+    ),
+    filled AS (
+        SELECT actual_date, currency_code, rate_group,
+            first_value(rate) OVER (PARTITION BY currency_code, rate_group ORDER BY actual_date) AS rate
+        FROM grid
+    )
+    INSERT INTO daily_exchange_rates (actual_date, currency_code, rate)
+    SELECT actual_date, currency_code, rate
+    FROM filled
+    WHERE rate_group > 0 AND actual_date >= CAST(:start_date AS date)
+""")
+
+
+def sync_daily_exchange_rates(db: Session, start_date: date | None = None):
+    """
+    Rebuild daily_exchange_rates from start_date (the whole history if None) with the rates of `exchange_rates`.
+    The rates known on start_date are carried forward from the latest earlier rates. The caller commits.
+    """
+    if start_date is None:
+        start_date = db.query(func.min(ExchangeRateHistory.actual_date)).scalar()
+        if start_date is None:
+            return
+
+    logger.info(f'Syncing daily exchange rates from {start_date}')
+    db.query(DailyExchangeRate).filter(DailyExchangeRate.actual_date >= start_date).delete(synchronize_session=False)
+    db.execute(SYNC_DAILY_EXCHANGE_RATES_SQL, {'start_date': start_date})
+
+
+def convert_to_base_currency(
+    query: Any,
+    amount: ColumnElement,
+    currency_code: ColumnElement,
+    calc_date: ColumnElement | date,
+    base_currency_code: str,
+) -> tuple[Any, ColumnElement]:
+    """
+    Join the rates needed to convert amount from currency_code into base_currency_code on calc_date.
+    Dates later than the latest known rates use the latest ones, earlier than the first known rates - the first ones.
+
+    Returns the query with the rates joined and the converted amount expression,
+    which is NULL when any of the rates is absent.
+    """
+    from_rate = aliased(DailyExchangeRate)
+    base_rate = aliased(DailyExchangeRate)
+    first_date = select(func.min(DailyExchangeRate.actual_date)).scalar_subquery()
+    latest_date = select(func.max(DailyExchangeRate.actual_date)).scalar_subquery()
+    rate_date = func.greatest(func.least(calc_date, latest_date), first_date)
+
+    query = query.join(
+        from_rate,
+        and_(from_rate.currency_code == currency_code, from_rate.actual_date == rate_date),
+        isouter=True,
+    ).join(
+        base_rate,
+        and_(base_rate.currency_code == base_currency_code, base_rate.actual_date == rate_date),
+        isouter=True,
+    )
+    converted_amount = case(
+        (currency_code == base_currency_code, amount),
+        else_=amount / from_rate.rate * base_rate.rate,
+    )
+
+    return query, converted_amount
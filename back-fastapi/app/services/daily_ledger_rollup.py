@@ -0,0 +1,146 @@
+from datetime import date, datetime
+
+from icecream import ic
+from sqlalchemy import Date, cast, delete, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.logger_config import logger
+from app.models.DailyLedgerRollup import DailyLedgerRollup
+from app.models.Transaction import Transaction
+
+ic.configureOutput(includeContext=True)
+
+# Rollup rows of :account_id (all the accounts if NULL) on the days at or after :since (all the days if NULL)
+DELETE_DAILY_LEDGER_ROLLUP_SQL = text("""
+    DELETE FROM daily_ledger_rollup
+    WHERE (CAST(:account_id AS integer) IS NULL OR account_id = :account_id)
+        AND (CAST(:since AS date) IS NULL OR day >= CAST(:since AS date))
+""")
+
+# The same rows summed up from the not deleted, not transfer transactions
+INSERT_DAILY_LEDGER_ROLLUP_SQL = text("""
+    INSERT INTO daily_ledger_rollup (user_id, account_id, category_id, day, income, expense, count)
+    SELECT user_id, account_id, category_id, CAST(date_time AS date),
+        coalesce(sum(amount) FILTER (WHERE is_income), 0),
+        coalesce(sum(amount) FILTER (WHERE NOT is_income), 0),
+        count(*)
+    FROM transactions
+    WHERE is_deleted = false
+        AND is_transfer = false
+        AND date_time IS NOT NULL
+        AND (CAST(:account_id AS integer) IS NULL OR account_id = :account_id)
+        AND (CAST(:since AS date) IS NULL OR CAST(date_time AS date) >= CAST(:since AS date))
+    GROUP BY user_id, account_id, category_id, CAST(date_time AS date)
+""")
+
+# Rewrite only the rollup rows of all the accounts which differ from their transactions,
+# returns the users whose rows were inserted, updated or deleted
+REPAIR_DAILY_LEDGER_ROLLUP_SQL = text("""
+    WITH expected AS (
+        SELECT user_id, account_id, category_id, CAST(date_time AS date) AS day,
+            coalesce(sum(amount) FILTER (WHERE is_income), 0) AS income,
+            coalesce(sum(amount) FILTER (WHERE NOT is_income), 0) AS expense,
+            count(*) AS count
+        FROM transactions
+        WHERE is_deleted = false
+            AND is_transfer = false
+            AND date_time IS NOT NULL
+        GROUP BY user_id, account_id, category_id, CAST(date_time AS date)
+    ),
+    deleted AS (
+        DELETE FROM daily_ledger_rollup dlr
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM expected
+            WHERE expected.account_id = dlr.account_id
+                AND expected.category_id IS NOT DISTINCT FROM dlr.category_id
+                AND expected.day = dlr.day
+        )
+        RETURNING dlr.user_id
+    ),
+    upserted AS (
+        INSERT INTO daily_ledger_rollup (user_id, account_id, category_id, day, income, expense, count)
+        SELECT user_id, account_id, category_id, day, income, expense, count
+        FROM expected
+        ON CONFLICT (account_id, category_id, day) DO UPDATE
+        SET user_id = excluded.user_id, income = excluded.income, expense = excluded.expense, count = excluded.count
+        WHERE (daily_ledger_rollup.user_id, daily_ledger_rollup.income, daily_ledger_rollup.expense,
+                daily_ledger_rollup.count)
+            IS DISTINCT FROM (excluded.user_id, excluded.income, excluded.expense, excluded.count)
+        RETURNING user_id
+    )
+    SELECT user_id FROM deleted
+    UNION
+    SELECT user_id FROM upserted
+    ORDER BY user_id
+""")
+
+
+def apply_transaction_to_ledger_rollup(
+    db: Session, prev_transaction: Transaction | None, transaction: Transaction | None
+):
+    """
+    Move a changed transaction from the rollup row of its previous state to the row of its current state.
+    None or a deleted state stands for the state of a created or deleted transaction, transfers are not counted.
+    Rows are changed in place, the caller commits.
+    """
+    for state, sign in ((prev_transaction, -1), (transaction, 1)):
+        if state is None or state.is_deleted or state.is_transfer or state.date_time is None:
+            continue
+
+        income = state.amount if state.is_income else 0
+        expense = 0 if state.is_income else state.amount
+        # the day is taken in SQL, the same way the reports and the rebuild take it
+        day = cast(state.date_time, Date)
+        statement = insert(DailyLedgerRollup).values(
+            user_id=state.user_id,
+            account_id=state.account_id,
+            category_id=state.category_id,
+            day=day,
+            income=sign * income,
+            expense=sign * expense,
+            count=sign,
+        )
+        # concurrent changes of other transactions of the same day must not overwrite each other
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[DailyLedgerRollup.account_id, DailyLedgerRollup.category_id, DailyLedgerRollup.day],
+                set_={
+                    'income': DailyLedgerRollup.income + statement.excluded.income,
+                    'expense': DailyLedgerRollup.expense + statement.excluded.expense,
+                    'count': DailyLedgerRollup.count + statement.excluded.count,
+                },
+            )
+        )
+        db.execute(
+            delete(DailyLedgerRollup).where(
+                DailyLedgerRollup.account_id == state.account_id,
+                DailyLedgerRollup.category_id.is_not_distinct_from(state.category_id),
+                DailyLedgerRollup.day == day,
+                DailyLedgerRollup.count == 0,
+            )
+        )
+
+
+def refresh_daily_ledger_rollup(db: Session, account_id: int | None = None, since: date | datetime | None = None):
+    """
+    Rewrite the rollup rows of account_id (all the accounts if None) from the day of since (all the days if None)
+    with the sums of their transactions. The caller commits.
+    """
+    params = {'account_id': account_id, 'since': since}
+    db.execute(DELETE_DAILY_LEDGER_ROLLUP_SQL, params)
+    db.execute(INSERT_DAILY_LEDGER_ROLLUP_SQL, params)
+
+
+def rebuild_daily_ledger_rollup(db: Session) -> list[int]:
+    """
+    Repair the rollup rows of all the accounts, only the wrong ones are rewritten.
+    Returns the ids of the users whose rows were repaired.
+    """
+    user_ids = list(db.execute(REPAIR_DAILY_LEDGER_ROLLUP_SQL).scalars())
+    db.commit()
+
+    logger.info(f'Daily ledger rollup is rebuilt, repaired users: {user_ids}')
+
+    return user_ids
@@ -0,0 +1,45 @@
+from icecream import ic
+from redis.exceptions import RedisError
+
+from app.logger_config import logger
+from app.utils.redis_client import get_redis
+
+ic.configureOutput(includeContext=True)
+
+USER_DATA_VERSION_KEY = 'data_version:user:{user_id}'
+# Bumped by the changes of data shared by all the users (exchange rates) and by the repairs of derived data
+GLOBAL_DATA_VERSION_KEY = 'data_version:global'
+
+
+def get_data_version(user_id: int) -> str | None:
+    """
+    Version of everything the user's reports are computed from.
+    It is changed by every write of the user's data and by every global change, see the bump functions.
+    None if Redis is not available: the writes of the other workers are not known then,
+    so nothing may be cached or validated by the version.
+    """
+    try:
+        user_version, global_version = get_redis().mget(
+            USER_DATA_VERSION_KEY.format(user_id=user_id), GLOBAL_DATA_VERSION_KEY
+        )
+    except RedisError as e:
+        logger.warning(f'Unable to get data version of user {user_id}: {e}')
+        return None
+
+    return f'{int(user_version or 0)}.{int(global_version or 0)}'
+
+
+def bump_user_data_version(user_id: int):
+    """Change the data version of the user, must be called after the user's data is committed"""
+    try:
+        get_redis().incr(USER_DATA_VERSION_KEY.format(user_id=user_id))
+    except RedisError as e:
+        logger.warning(f'Unable to bump data version of user {user_id}: {e}')
+
+
+def bump_global_data_version():
+    """Change the data versions of all the users, must be called after the shared data is committed"""
+    try:
+        get_redis().incr(GLOBAL_DATA_VERSION_KEY)
+    except RedisError as e:
+        logger.warning(f'Unable to bump global data version: {e}')
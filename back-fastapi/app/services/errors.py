@@ -32,3 +32,7 @@ class NotFoundError(Exception):
 
 class InvalidPeriod(Exception):
     pass
+
+
+class InvalidImportFile(Exception):
+    pass
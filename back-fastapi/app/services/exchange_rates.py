@@ -5,6 +5,8 @@ from sqlalchemy.orm import Session
 
 from app.logger_config import logger
 from app.models.ExchangeRateHistory import ExchangeRateHistory
+from app.services.CurrencyProcessor import notify_exchange_rates_updated
+from app.services.daily_exchange_rates import sync_daily_exchange_rates
 from app.services.exchange_services.CurrencyBeacon import CurrencyBeaconService
 
 ic.configureOutput(includeContext=True)
@@ -42,7 +44,10 @@ def update_exchange_rates(db: Session, when: date) -> ExchangeRateHistory:
             db.flush()
         exchange_rates = ExchangeRateHistory(**currency_service.get_currency_rates(when.isoformat()))  # noqa
         db.add(exchange_rates)
+        db.flush()
+        sync_daily_exchange_rates(db, when)
         db.commit()
+        notify_exchange_rates_updated(db)
         return exchange_rates
     except Exception as e:  # pragma: no cover
         logger.exception(e)
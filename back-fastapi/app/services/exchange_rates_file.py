@@ -0,0 +1,100 @@
+import math
+import mmap
+import os
+import struct
+from datetime import date
+from decimal import Decimal
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.services.CurrencyProcessor import RatesTable
+
+# File layout (little-endian):
+#   header: magic, number of days, number of currencies, ordinal of the first day, exchange rates version
+#   currency codes: 3 ASCII bytes per currency, padded to 8 bytes
+#   matrix: float64 rates, one row per day and one column per currency, NaN when the rate is unknown
+MAGIC = b'BTRATES1'
+HEADER = struct.Struct('<8sIIiq')
+RATE_SIZE = 8
+
+
+def _matrix_offset(currencies_count: int) -> int:
+    codes_end = HEADER.size + 3 * currencies_count
+    return (codes_end + RATE_SIZE - 1) // RATE_SIZE * RATE_SIZE
+
+
+class MappedRatesTable:
+    """
+    Read-only, memory-mapped view of the exchange rates file.
+    The pages are shared by all the processes mapping the file, so the rates do not live in the Python heap.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, days_count, currencies_count, first_day, version = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not an exchange rates file')
+
+        matrix_offset = _matrix_offset(currencies_count)
+        matrix_end = matrix_offset + RATE_SIZE * days_count * currencies_count
+        if len(self._mmap) < matrix_end:
+            raise ValueError(f'Exchange rates file {path} is truncated')
+
+        codes = self._mmap[HEADER.size : HEADER.size + 3 * currencies_count].decode('ascii')
+        self.columns = {codes[idx * 3 : idx * 3 + 3]: idx for idx in range(currencies_count)}
+        self.first_day = first_day
+        self.days_count = days_count
+        self.version = version
+        # native byte order, all the platforms we run on are little-endian
+        self._matrix = memoryview(self._mmap)[matrix_offset:matrix_end].cast('d')
+
+    def get_rate(self, calc_date: date, currency_code: str) -> Decimal | None:
+        """Get the latest known rate on or before calc_date, None if there is no such rate"""
+        column = self.columns.get(currency_code)
+        day = calc_date.toordinal() - self.first_day
+        if column is None or day < 0 or self.days_count == 0:
+            return None
+
+        rate = self._matrix[min(day, self.days_count - 1) * len(self.columns) + column]
+        return None if math.isnan(rate) else Decimal(rate)
+
+
+def write_rates_file(path: str, table: 'RatesTable', version: int):
+    """
+    Write the rates table into the file at path. The file is replaced atomically,
+    so processes which have mapped the previous file keep reading it until they switch to the new one.
+    """
+    dates = table['dates']
+    # codes are stored as 3 ASCII bytes, anything else can not be a currency code
+    codes = sorted(code for code in table['rates'] if len(code) == 3 and code.isascii())
+    first_day = dates[0] if dates else 0
+    days_count = dates[-1] - first_day + 1 if dates else 0
+
+    matrix = [math.nan] * (days_count * len(codes))
+    for column, code in enumerate(codes):
+        rates = table['rates'][code]
+        last_rate = None
+        day_idx = 0
+        for day in range(days_count):
+            # the table may skip days, they get the latest known rate
+            while day_idx < len(dates) and dates[day_idx] - first_day <= day:
+                if rates[day_idx] is not None:
+                    last_rate = rates[day_idx]
+                day_idx += 1
+            if last_rate is not None:
+                matrix[day * len(codes) + column] = float(last_rate)
+
+    header = HEADER.pack(MAGIC, days_count, len(codes), first_day, version)
+    codes_block = ''.join(codes).encode('ascii').ljust(_matrix_offset(len(codes)) - HEADER.size, b'\0')
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(codes_block)
+        f.write(struct.pack(f'<{len(matrix)}d', *matrix))
+    os.replace(tmp_path, path)
@@ -14,6 +14,7 @@ from app.schemas.planned_transaction_schema import (
     RecurrenceFrequencyEnum,
     UpdatePlannedTransactionSchema,
 )
+from app.services.data_versions import bump_user_data_version
 from app.services.errors import AccessDenied
 
 
@@ -54,6 +55,7 @@ def create_planned_transaction(
     db.add(planned_transaction)
     db.commit()
     db.refresh(planned_transaction)
+    bump_user_data_version(user_id)
 
     logger.debug(f"Created planned transaction {planned_transaction.id} for user {user_id}")
 
@@ -188,6 +190,7 @@ def update_planned_transaction(
 
     db.commit()
     db.refresh(planned_transaction)
+    bump_user_data_version(user_id)
 
     logger.info(f"Updated planned transaction {planned_transaction_id} for user {user_id}")
 
@@ -213,6 +216,7 @@ def delete_planned_transaction(planned_transaction_id: int, user_id: int, db: Se
     planned_transaction.is_active = False
 
     db.commit()
+    bump_user_data_version(user_id)
 
     logger.info(f"Deleted planned transaction {planned_transaction_id} for user {user_id}")
 
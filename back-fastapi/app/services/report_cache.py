@@ -0,0 +1,74 @@
+import hashlib
+import json
+import threading
+from datetime import date
+from typing import Any, Callable, TypeVar
+
+from cachetools import TTLCache
+from fastapi.encoders import jsonable_encoder
+from icecream import ic
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.logger_config import logger
+from app.services.data_versions import get_data_version
+from app.utils.redis_client import get_redis
+
+ic.configureOutput(includeContext=True)
+
+REPORT_CACHE_KEY = 'report:{user_id}:{name}:{version}:{params_hash}'
+
+T = TypeVar('T')
+
+# key -> report result, the results are shared by the requests and must not be changed
+report_cache: TTLCache[str, Any] = TTLCache(maxsize=settings.REPORT_CACHE_SIZE, ttl=settings.REPORT_CACHE_SECONDS)
+_report_cache_lock = threading.Lock()
+
+
+def get_cached_report(user_id: int, name: str, params: dict, compute: Callable[[], T]) -> T:
+    """
+    Result of compute() for the report name of the user with params, cached till the user's data version changes.
+    The current date is a part of the key, so the reports defaulting to today are recomputed every day.
+    If REPORT_CACHE_USE_REDIS is set, the results are shared by the workers in Redis in their JSON form.
+    Nothing is cached while the data version is unknown.
+    """
+    version = get_data_version(user_id)
+    if version is None:
+        return compute()
+
+    key = REPORT_CACHE_KEY.format(
+        user_id=user_id,
+        name=name,
+        version=version,
+        params_hash=_hash_params({**params, 'today': date.today()}),
+    )
+
+    with _report_cache_lock:
+        result = report_cache.get(key)
+    if result is not None:
+        return result
+
+    if settings.REPORT_CACHE_USE_REDIS:
+        try:
+            cached_result = get_redis().get(key)
+            if cached_result is not None:
+                result = json.loads(cached_result)
+        except RedisError as e:
+            logger.warning(f'Unable to get cached report {name} of user {user_id}: {e}')
+
+    if result is None:
+        result = compute()
+        if settings.REPORT_CACHE_USE_REDIS:
+            try:
+                get_redis().set(key, json.dumps(jsonable_encoder(result)), ex=settings.REPORT_CACHE_SECONDS)
+            except RedisError as e:
+                logger.warning(f'Unable to cache report {name} of user {user_id}: {e}')
+
+    with _report_cache_lock:
+        report_cache[key] = result
+
+    return result
+
+
+def _hash_params(params: dict) -> str:
+    return hashlib.sha256(json.dumps(jsonable_encoder(params), sort_keys=True).encode()).hexdigest()
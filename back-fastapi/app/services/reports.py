@@ -10,6 +10,9 @@ from app.services.diagrams.builder import combine_small_categories, prepare_data
 from app.services.reports_generators.BalanceReportGenerator import (
     BalanceReportGenerator,
 )
+from app.services.reports_generators.BalanceSeriesReportGenerator import (
+    BalanceSeriesReportGenerator,
+)
 from app.services.reports_generators.CashFlowReportGenerator import (
     CashFlowReportGenerator,
 )
@@ -46,6 +49,22 @@ def get_balance_report(user_id: int, db: Session, account_ids: list[int], balanc
     return balance_data
 
 
+def get_balance_series(
+    user_id: int,
+    db: Session,
+    account_ids: list[int],
+    dates: list[date],
+    period: str | None = None,
+    start_date: date | None = None,
+    end_date: date | None = None,
+) -> dict:
+    """Get balances of accounts at the end of every date, the dates are the last days of the period buckets if set"""
+    if period:
+        dates = BalanceSeriesReportGenerator.get_period_days(period, start_date, end_date)
+
+    return BalanceSeriesReportGenerator(user_id, db, account_ids).get_balances(dates)
+
+
 def get_expenses_by_categories(
     user_id: int,
     db: Session,
@@ -1,15 +1,15 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from decimal import Decimal
 
 from icecream import ic
-from sqlalchemy import and_, func
-from sqlalchemy.orm import Session, aliased
+from sqlalchemy import true
+from sqlalchemy.orm import Session
 
 from app.models.Account import Account
 from app.models.Currency import Currency
-from app.models.Transaction import Transaction
 from app.models.User import User
-from app.services.CurrencyProcessor import calc_amount
+from app.services.account_daily_balances import latest_account_daily_balance
+from app.services.CurrencyProcessor import calc_amounts
 
 ic.configureOutput(includeContext=True)
 
@@ -37,44 +37,27 @@ class BalanceReportGenerator:
         )
 
     def prepare_raw_data(self) -> 'BalanceReportGenerator':
-        AccountAlias = aliased(Account)
-
-        filters = [
-            Transaction.user_id == self.user_id,
-            Transaction.date_time < self.balance_date + timedelta(days=1),
-        ]
+        # balance of every account at the end of balance_date is one lookup in the daily balances
+        daily_balance = latest_account_daily_balance(Account.id, self.balance_date)
 
+        filters = [Account.user_id == self.user_id]
         if self.account_ids:
-            filters.append(Transaction.account_id.in_(self.account_ids))
+            filters.append(Account.id.in_(self.account_ids))
         else:
-            filters.append(AccountAlias.show_in_reports == True)
-
-        subquery = (
-            self.db.query(
-                Transaction.account_id,
-                func.max(Transaction.date_time).label('max_date_time'),
-            )
-            .join(AccountAlias, AccountAlias.id == Transaction.account_id)
-            .filter(and_(*filters))
-            .group_by(Transaction.account_id)
-            .subquery()
-        )
+            filters.append(Account.show_in_reports == True)
 
         self.raw_results = (
             self.db.query(  # type: ignore
-                Transaction.account_id,
-                Transaction.new_balance,
+                Account.id.label('account_id'),
+                daily_balance.c.balance.label('new_balance'),
                 Account.name,
                 Account.show_in_reports,
                 Currency.code,
             )
-            .distinct(Transaction.account_id, Account.name, Currency.code)
-            .join(
-                subquery,
-                (Transaction.account_id == subquery.c.account_id) & (Transaction.date_time == subquery.c.max_date_time),
-            )
-            .join(Account, Account.id == Transaction.account_id)
+            .select_from(Account)
+            .join(daily_balance, true())
             .join(Currency, Account.currency_id == Currency.id)
+            .filter(*filters)
             .order_by(Account.name)
             .all()
         )
@@ -84,22 +67,23 @@ class BalanceReportGenerator:
     def get_balances(self) -> list[dict]:
         balance_data = []
         balance_date = self.balance_date
+
+        # zero balances need no conversion, all the others are converted in one batch
+        non_zero_results = [result for result in self.raw_results if result and result.new_balance != 0]  # type: ignore
+        converted_balances = calc_amounts(
+            [(result.new_balance, result.code, balance_date) for result in non_zero_results],
+            self.user_base_currency.code,
+            self.db,
+        )
+        base_currency_balances = dict(zip([result.account_id for result in non_zero_results], converted_balances))
+
         for result in self.raw_results:  # type: ignore
             balance = result.new_balance if result else 0
             account_name = result.name if result else ''
             currency_code = result.code if result else ''
 
             # calculate in the same currency
-            if balance != 0:
-                base_currency_balance = calc_amount(
-                    balance,
-                    currency_code,
-                    balance_date,
-                    self.user_base_currency.code,
-                    self.db,
-                )
-            else:
-                base_currency_balance = Decimal(0)
+            base_currency_balance = base_currency_balances.get(result.account_id, Decimal(0))
 
             balance_data.append(
                 {
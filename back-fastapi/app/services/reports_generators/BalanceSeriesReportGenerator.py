@@ -0,0 +1,152 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from icecream import ic
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models.Account import Account
+from app.models.Currency import Currency
+from app.models.User import User
+from app.services.CurrencyProcessor import calc_amounts
+from app.services.errors import InvalidPeriod
+from app.services.reports_generators.CashFlowReportGenerator import PERIODS
+
+ic.configureOutput(includeContext=True)
+
+MAX_BALANCE_SERIES_POINTS = 1000
+
+# Closing balances of :account_ids at the end of every day of :days (ascending, distinct).
+# Every daily balance belongs to the first point at or after its day, the latest one of every point
+# gives the balance there. Points without transactions carry the previous balance forward,
+# the ones before the first transaction of an account have its initial balance.
+BALANCE_SERIES_SQL = text("""
+    WITH points AS (
+        SELECT day, lag(day) OVER (ORDER BY day) AS previous_day
+        FROM unnest(CAST(:days AS date[])) AS day
+    ),
+    closing AS (
+        SELECT DISTINCT ON (b.account_id, points.day) b.account_id, points.day, b.balance AS new_balance
+        FROM account_daily_balances b
+        JOIN points
+            ON b.day <= points.day
+            AND (points.previous_day IS NULL OR b.day > points.previous_day)
+        WHERE b.account_id = ANY(:account_ids)
+        ORDER BY b.account_id, points.day, b.day DESC
+    ),
+    grid AS (
+        SELECT account.id AS account_id, account.initial_balance, points.day, closing.new_balance,
+            count(closing.new_balance) OVER (PARTITION BY account.id ORDER BY points.day) AS balance_group
+        FROM accounts account
+        CROSS JOIN points
+        LEFT JOIN closing ON closing.account_id = account.id AND closing.day = points.day
+        WHERE account.id = ANY(:account_ids)
+    )
+    SELECT account_id, day,
+        coalesce(
+            first_value(new_balance) OVER (PARTITION BY account_id, balance_group ORDER BY day),
+            initial_balance
+        ) AS balance
+    FROM grid
+    ORDER BY account_id, day
+""")
+
+
+class BalanceSeriesReportGenerator:
+    def __init__(self, user_id: int, db: Session, account_ids: list[int] | None = None):
+        self.user_id = user_id
+        self.db = db
+        self.account_ids = account_ids or []
+
+        self.user_base_currency = (
+            db.query(Currency).join(User, User.base_currency_id == Currency.id).filter(User.id == user_id).one()
+        )
+
+    @staticmethod
+    def get_period_days(period: str, start_date: date | None = None, end_date: date | None = None) -> list[date]:
+        """Last days of the buckets of period between start_date and end_date (today if None)"""
+        if period not in PERIODS:
+            raise InvalidPeriod(f"Invalid period: {period}")
+        cash_flow_period = PERIODS[period]
+
+        if end_date is None:
+            end_date = datetime.now().date()
+        bucket = cash_flow_period.truncate(start_date or end_date)
+        if start_date is None:
+            bucket -= cash_flow_period.step * cash_flow_period.default_buckets
+
+        days = []
+        while bucket <= end_date:
+            next_bucket = bucket + cash_flow_period.step
+            days.append(min(next_bucket - timedelta(days=1), end_date))
+            bucket = next_bucket
+
+        return days
+
+    def get_balances(self, days: list[date]) -> dict:
+        """Balances of the accounts and their total in the base currency at the end of every day of days"""
+        days = sorted(set(days))
+        if not days or len(days) > MAX_BALANCE_SERIES_POINTS:
+            raise InvalidPeriod(f"Balance series must have from 1 to {MAX_BALANCE_SERIES_POINTS} dates")
+
+        query = (
+            self.db.query(Account.id, Account.name, Currency.code)
+            .join(Currency, Account.currency_id == Currency.id)
+            .filter(Account.user_id == self.user_id, Account.is_deleted == False)  # noqa: E712
+        )
+        if self.account_ids:
+            query = query.filter(Account.id.in_(self.account_ids))
+        else:
+            query = query.filter(Account.show_in_reports == True)  # noqa: E712
+        accounts = {account.id: account for account in query.order_by(Account.name).all()}
+
+        balances: dict[int, list] = {account_id: [] for account_id in accounts}
+        if accounts:
+            rows = self.db.execute(BALANCE_SERIES_SQL, {'days': days, 'account_ids': list(accounts)}).all()
+            for row in rows:
+                balances[row.account_id].append((row.day, row.balance))
+
+        # every (currency, day) pair of non-zero balances is converted once, in one batch
+        pairs = sorted(
+            {
+                (accounts[account_id].code, day)
+                for account_id, account_balances in balances.items()
+                for day, balance in account_balances
+                if balance
+            }
+        )
+        rates = dict(
+            zip(
+                pairs,
+                calc_amounts([(Decimal(1), code, day) for code, day in pairs], self.user_base_currency.code, self.db),
+            )
+        )
+
+        totals = {day: Decimal(0) for day in days}
+        accounts_data = []
+        for account_id, account in accounts.items():
+            account_balances = []
+            for day, balance in balances[account_id]:
+                base_currency_balance = balance * rates[(account.code, day)] if balance else Decimal(0)
+                totals[day] += base_currency_balance
+                account_balances.append(
+                    {
+                        "date": day,
+                        "balance": balance,
+                        "base_currency_balance": base_currency_balance,
+                    }
+                )
+            accounts_data.append(
+                {
+                    "account_id": account_id,
+                    "account_name": account.name,
+                    "currency_code": account.code,
+                    "balances": account_balances,
+                }
+            )
+
+        return {
+            "base_currency_code": self.user_base_currency.code,
+            "accounts": accounts_data,
+            "totals": [{"date": day, "base_currency_balance": total} for day, total in totals.items()],
+        }
@@ -1,30 +1,78 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+from typing import Callable, NamedTuple
 
+from dateutil.relativedelta import relativedelta
 from icecream import ic
-from sqlalchemy import and_, case
+from sqlalchemy import Date, Numeric, cast, literal, literal_column, select
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
 from app.models.Account import Account
 from app.models.Currency import Currency
-from app.models.Transaction import Transaction
+from app.models.DailyLedgerRollup import DailyLedgerRollup
 from app.models.User import User
-from app.services.CurrencyProcessor import calc_amount
+from app.services.CurrencyProcessor import ExchangeRateAbsentError
+from app.services.daily_exchange_rates import convert_to_base_currency
+from app.services.errors import InvalidPeriod
 
 ic.configureOutput(includeContext=True)
 
 
+class CashFlowPeriod(NamedTuple):
+    unit: str  # date_trunc unit
+    interval: str  # length of the bucket as a Postgres interval
+    step: relativedelta
+    truncate: Callable[[date], date]
+    label: Callable[[date], str]
+    default_buckets: int  # buckets before the current one shown when the start date is not set
+
+
+PERIODS = {
+    "daily": CashFlowPeriod("day", "1 day", relativedelta(days=1), lambda day: day, lambda day: day.isoformat(), 30),
+    "weekly": CashFlowPeriod(
+        "week",
+        "1 week",
+        relativedelta(weeks=1),
+        lambda day: day - timedelta(days=day.weekday()),
+        lambda day: f"{day.isocalendar().year}-W{day.isocalendar().week:02}",
+        12,
+    ),
+    "monthly": CashFlowPeriod(
+        "month",
+        "1 month",
+        relativedelta(months=1),
+        lambda day: day.replace(day=1),
+        lambda day: day.strftime("%Y-%m"),
+        12,
+    ),
+    "quarterly": CashFlowPeriod(
+        "quarter",
+        "3 months",
+        relativedelta(months=3),
+        lambda day: day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1),
+        lambda day: f"{day.year}-Q{(day.month - 1) // 3 + 1}",
+        8,
+    ),
+    "yearly": CashFlowPeriod(
+        "year",
+        "1 year",
+        relativedelta(years=1),
+        lambda day: day.replace(month=1, day=1),
+        lambda day: str(day.year),
+        5,
+    ),
+}
+
+
 class CashFlowReportGenerator:
     def __init__(self, user_id, db: Session):
         self._db = db
         self.user_id = user_id
         self.account_ids: list[int] = []
-        self.period = None
+        self.period: str = "monthly"
         self.start_date = None
         self.end_date = None
-        self.period_str: str = ""
-        self.label: str = ""
 
         self._accounts_info: dict = {}
 
@@ -50,50 +98,31 @@ class CashFlowReportGenerator:
         self._accounts_info = {account.id: {"name": account.name, "currency": account.currency} for account in accounts}
 
     def get_cash_flows(self):
-        prepared_results = self.prepare_data()
-
-        today = datetime.now().date()
         user = self._db.query(User).filter(User.id == self.user_id).one()
+        period = self.get_period()
+        first_bucket, last_bucket = self.get_buckets_range(period)
+        prepared_results = self.prepare_data(user.base_currency.code, period, first_bucket)
 
         income_sum: dict = {}
         expenses_sum: dict = {}
         net_flow: dict = {}
 
-        for result in prepared_results:
-            account_id, period, total_income, total_expenses = result
-            income_in_period = Decimal(
-                calc_amount(
-                    total_income or Decimal(0),
-                    self._accounts_info[account_id]["currency"],
-                    today,
-                    user.base_currency.code,
-                    self._db,
-                )
-            )
-            if period not in income_sum:
-                income_sum.setdefault(period, income_in_period)
-            else:
-                income_sum[period] += income_in_period
-
-            expenses_in_period = Decimal(
-                calc_amount(
-                    total_expenses or Decimal(0),
-                    self._accounts_info[account_id]["currency"],
-                    today,
-                    user.base_currency.code,
-                    self._db,
-                )
-            )
-            if period not in expenses_sum:
-                expenses_sum.setdefault(period, expenses_in_period)
-            else:
-                expenses_sum[period] += expenses_in_period
+        # every bucket of the range is reported, the ones without transactions are zero
+        bucket = first_bucket
+        while bucket <= last_bucket:
+            label = period.label(bucket)
+            income_sum[label] = expenses_sum[label] = net_flow[label] = Decimal(0)
+            bucket += period.step
+
+        # amounts come already converted into the base currency and summed up per bucket
+        for bucket, total_income, total_expenses, absent_rate_date in prepared_results:
+            if absent_rate_date is not None:
+                raise ExchangeRateAbsentError("All", absent_rate_date)
 
-            net_flow_in_period = income_in_period - expenses_in_period
-            if period not in net_flow:
-                net_flow.setdefault(period, net_flow_in_period)
-            else:
-                net_flow[period] += net_flow_in_period
+            label = period.label(bucket)
+            income_sum[label] = total_income
+            expenses_sum[label] = total_expenses
+            net_flow[label] = total_income - total_expenses
 
         cash_flow = {
             "total_income": income_sum,
@@ -104,82 +133,74 @@ class CashFlowReportGenerator:
 
         return cash_flow
 
-    def set_label(self):
-        if self.period == "monthly":
-            self.label = "transactions_month"
-            self.period_str = "YYYY-MM"
-        elif self.period == "daily":
-            self.label = "transactions_day"
-            self.period_str = "YYYY-MM-DD"
-        else:
-            raise ValueError(f"Invalid period: {self.period}")
+    def get_period(self) -> CashFlowPeriod:
+        if self.period not in PERIODS:
+            raise InvalidPeriod(f"Invalid period: {self.period}")
 
-    def prepare_data(self):
-        self.set_label()
+        return PERIODS[self.period]
 
-        query = (
-            self._db.query(
-                Account.id.label("account_id"),
-                func.to_char(Transaction.date_time, self.period_str).label(self.label),
-                func.coalesce(
-                    func.sum(
-                        case((Transaction.is_income == True, Transaction.amount), else_=0)  # noqa
-                    ).filter(
-                        Transaction.is_deleted == False,
-                        Transaction.is_transfer == False,
-                    ),
-                    0,
-                ).label("total_income"),
-                func.coalesce(
-                    func.sum(
-                        case(
-                            (Transaction.is_income == False, Transaction.amount),
-                            else_=0,
-                        )  # noqa
-                    ).filter(
-                        Transaction.is_deleted == False,
-                        Transaction.is_transfer == False,
-                    ),
-                    0,
-                ).label("total_expenses"),
+    def get_buckets_range(self, period: CashFlowPeriod) -> tuple[date, date]:
+        """First days of the first and the last buckets of the report"""
+        last_day = self.end_date.date() if self.end_date else datetime.now().date()
+        last_bucket = period.truncate(last_day)
+        if self.start_date:
+            first_bucket = period.truncate(self.start_date.date())
+        else:
+            first_bucket = last_bucket - period.step * period.default_buckets
+
+        return first_bucket, last_bucket
+
+    def prepare_data(self, base_currency_code: str, period: CashFlowPeriod, first_bucket: date):
+        """
+        Sum up income and expenses per bucket in SQL.
+        Daily rollups are summed up per account and bucket first, these sums are converted into the base currency
+        with the rates of the last day of their bucket (the latest known rates for the current one).
+        """
+        bucket = cast(func.date_trunc(period.unit, DailyLedgerRollup.day), Date)
+        start_day = self.start_date.date() if self.start_date else first_bucket
+        end_day = self.end_date.date() if self.end_date else datetime.now().date()
+
+        account_buckets = (
+            select(
+                bucket.label("bucket"),
+                Currency.code.label("currency_code"),
+                func.sum(DailyLedgerRollup.income).label("income"),
+                func.sum(DailyLedgerRollup.expense).label("expense"),
             )
-            .outerjoin(
-                Transaction,
-                and_(
-                    Account.id == Transaction.account_id,
-                    Transaction.account_id.in_(self.account_ids),
-                ),
+            .select_from(DailyLedgerRollup)
+            .join(Account, DailyLedgerRollup.account_id == Account.id)
+            .join(Currency, Account.currency_id == Currency.id)
+            .where(
+                DailyLedgerRollup.user_id == self.user_id,
+                DailyLedgerRollup.account_id.in_(self.account_ids),
+                DailyLedgerRollup.day >= start_day,
+                DailyLedgerRollup.day <= end_day,
             )
-            .filter(Account.user_id == self.user_id, Account.id.in_(self.account_ids))
-            .group_by(
-                Account.id,
-                func.to_char(Transaction.date_time, self.period_str),
-                Transaction.date_time,
+            .group_by(DailyLedgerRollup.account_id, Currency.code, bucket)
+            .subquery()
+        )
+        rate_date = cast(
+            account_buckets.c.bucket
+            + literal_column(f"interval '{period.interval}'")
+            - literal_column("interval '1 day'"),
+            Date,
+        )
+        # income and expenses of an account bucket share the rate, it is the converted unit of the account currency
+        query, rate = convert_to_base_currency(
+            select(account_buckets.c.bucket).select_from(account_buckets),
+            literal(1, Numeric()),
+            account_buckets.c.currency_code,
+            rate_date,
+            base_currency_code,
+        )
+        query = (
+            query.add_columns(
+                func.coalesce(func.sum(account_buckets.c.income * rate), 0).label("total_income"),
+                func.coalesce(func.sum(account_buckets.c.expense * rate), 0).label("total_expenses"),
+                func.min(rate_date).filter(rate.is_(None)).label("absent_rate_date"),
             )
-            .order_by(self.label)
+            .group_by(account_buckets.c.bucket)
+            .order_by(account_buckets.c.bucket)
         )
 
-        additional_filters = []
-        if self.start_date:
-            additional_filters.append(Transaction.date_time >= self.start_date)
-        else:
-            # get start date 12 months ago in case of monthly report and 30 days ago in case of daily report
-            if self.period == "monthly":
-                # Start from the first day of the month 12 months ago
-                twelve_months_ago = datetime.now() - timedelta(days=365)
-                start_of_month = twelve_months_ago.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                additional_filters.append(Transaction.date_time >= start_of_month)
-            elif self.period == "daily":
-                additional_filters.append(Transaction.date_time >= (datetime.now() - timedelta(days=30)))
-
-        if self.end_date:
-            additional_filters.append(Transaction.date_time <= (self.end_date + timedelta(days=1)))
-        else:
-            additional_filters.append(Transaction.date_time <= (datetime.now() + timedelta(days=1)))
-
-        if additional_filters:
-            query = query.filter(*additional_filters)
-
-        results = query.all()
-
-        return results
+        return self._db.execute(query).all()
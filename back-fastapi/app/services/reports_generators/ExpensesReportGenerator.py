@@ -1,16 +1,17 @@
-from datetime import date, timedelta
+from datetime import date
 
 from icecream import ic
-from sqlalchemy import select
-from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
 
 from app.logger_config import logger
 from app.models.Account import Account
 from app.models.Currency import Currency
-from app.models.Transaction import Transaction
+from app.models.DailyLedgerRollup import DailyLedgerRollup
 from app.models.User import User
-from app.models.UserCategory import UserCategory
-from app.services.CurrencyProcessor import calc_amount
+from app.services.category_tree import get_category_tree
+from app.services.CurrencyProcessor import ExchangeRateAbsentError
+from app.services.daily_exchange_rates import convert_to_base_currency
 
 ic.configureOutput(includeContext=True)
 
@@ -37,37 +38,48 @@ class ExpensesReportGenerator:
 
         categories_ids = user_categories.keys()
 
-        query = (
+        user: User = self._db.get(User, self.user_id)  # type: ignore
+        base_currency: Currency = user.base_currency
+
+        # expenses come summed up per category and day from the rollup, they are summed up per currency
+        # and converted into the base currency with the rates of their day
+        daily_expenses = (
             select(
-                UserCategory.name.label('category_name'),
-                UserCategory.id.label('category_id'),
-                UserCategory.parent_id.label('parent_category_id'),
-                Transaction.amount.label('amount'),
-                Currency.code.label('currency'),
+                DailyLedgerRollup.category_id.label('category_id'),
+                Currency.code.label('currency_code'),
+                DailyLedgerRollup.day.label('day'),
+                func.sum(DailyLedgerRollup.expense).label('amount'),
             )
-            .join(UserCategory, Transaction.category_id == UserCategory.id)
-            .join(Account, Transaction.account_id == Account.id)
+            .join(Account, DailyLedgerRollup.account_id == Account.id)
             .join(Currency, Account.currency_id == Currency.id)
             .where(
-                Transaction.date_time >= self.start_date,
-                Transaction.date_time < (self.end_date + timedelta(days=1)),
-                Transaction.is_income == False,
-                Transaction.is_deleted == False,
-                Transaction.is_transfer == False,
-                Transaction.category_id.in_(categories_ids),
+                DailyLedgerRollup.user_id == self.user_id,
+                DailyLedgerRollup.day >= self.start_date,
+                DailyLedgerRollup.day <= self.end_date,
+                DailyLedgerRollup.expense != 0,
+                DailyLedgerRollup.category_id.in_(categories_ids),
             )
-            .order_by(UserCategory.name, UserCategory.parent_id)
+            .group_by(DailyLedgerRollup.category_id, Currency.code, DailyLedgerRollup.day)
+            .subquery()
         )
+        query, converted_amount = convert_to_base_currency(
+            select(daily_expenses.c.category_id).select_from(daily_expenses),
+            daily_expenses.c.amount,
+            daily_expenses.c.currency_code,
+            daily_expenses.c.day,
+            base_currency.code,
+        )
+        query = query.add_columns(
+            func.sum(converted_amount).label('total_expenses'),
+            func.min(daily_expenses.c.day).filter(converted_amount.is_(None)).label('absent_rate_date'),
+        ).group_by(daily_expenses.c.category_id)
 
         result = self._db.execute(query).all()
 
-        user: User = self._db.get(User, self.user_id)  # type: ignore
-        base_currency: Currency = user.base_currency
-
         for row in result:
-            # Calculate amount in base currency
-            transaction_amount = calc_amount(row.amount, row.currency, self.start_date, base_currency.code, self._db)
-            user_categories[row.category_id]['total_expenses'] += transaction_amount
+            if row.absent_rate_date is not None:
+                raise ExchangeRateAbsentError("All", row.absent_rate_date)
+            user_categories[row.category_id]['total_expenses'] += row.total_expenses
             user_categories[row.category_id]['currency_code'] = base_currency.code
 
         self._user_categories_with_expenses = list(user_categories.values())
@@ -84,65 +96,26 @@ class ExpensesReportGenerator:
 
     def _get_flat_user_categories(self):
         """Get all user categories in a flat structure ordered by name and children go right after their parent"""
-        parent_alias = aliased(UserCategory)
-
-        query = (
-            select(
-                UserCategory.id.label('category_id'),
-                UserCategory.name.label('category_name'),
-                UserCategory.parent_id.label('parent_category_id'),
-                parent_alias.name.label('parent_category_name'),
-            )
-            .join(parent_alias, UserCategory.parent_id == parent_alias.id, isouter=True)
-            .where(
-                UserCategory.user_id == self.user_id,
-                UserCategory.is_deleted == False,
-                UserCategory.is_income == False,
-            )
-            .order_by(UserCategory.name)
-        )
-
-        categories = self._db.execute(query).all()
-
-        structured_categories = {}
-
-        for category in categories:
-            if category.parent_category_id is None:
-                structured_categories[category.category_id] = {
-                    'id': category.category_id,
-                    'name': category.category_name,
-                    'children': [],
-                }
-
-        for category in categories:
-            if category.parent_category_id is not None:
-                structured_categories[category.parent_category_id]['children'].append(
-                    {
-                        'id': category.category_id,
-                        'name': category.category_name,
-                        'parent_id': category.parent_category_id,
-                        'parent_name': category.parent_category_name,
-                    }
-                )
-
         flat_categories = {}
 
-        for category in structured_categories.values():  # type: ignore
-            flat_categories[int(category['id'])] = {  # type: ignore
-                'id': int(category['id']),  # type: ignore
-                'name': category['name'],  # type: ignore
-                'parent_id': None,
-                'parent_name': None,
-                'total_expenses': 0,
-                'isParent': True,
-            }
-
-            for child in category['children']:  # type: ignore
-                flat_categories[int(child['id'])] = {
-                    'id': int(child['id']),
-                    'name': f"{category['name']} >> {child['name']}",  # type: ignore
-                    'parent_id': child['parent_id'],
-                    'parent_name': child['parent_name'],
+        for node in get_category_tree(self.user_id, self._db):
+            if node['is_income']:
+                continue
+            if node['parent_id'] is None:
+                flat_categories[node['id']] = {
+                    'id': node['id'],
+                    'name': node['name'],
+                    'parent_id': None,
+                    'parent_name': None,
+                    'total_expenses': 0,
+                    'isParent': True,
+                }
+            else:
+                flat_categories[node['id']] = {
+                    'id': node['id'],
+                    'name': node['full_name'],
+                    'parent_id': node['parent_id'],
+                    'parent_name': node['parent_name'],
                     'total_expenses': 0,
                     'is_parent': False,
                 }
@@ -4,16 +4,22 @@ from datetime import datetime, timezone
 from icecream import ic
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy.sql import select
+from sqlalchemy.sql import select, text
 
 from app.logger_config import logger
 from app.models.Account import Account
 from app.models.Transaction import Transaction
+from app.models.User import User
 from app.models.UserCategory import UserCategory
 from app.schemas.transaction_schema import (
     CreateTransactionSchema,
     UpdateTransactionSchema,
 )
+from app.services.account_daily_balances import refresh_account_daily_balances
+from app.services.base_currency_amounts import calc_base_currency_amount
+from app.services.budgets import apply_transaction_to_budgets
+from app.services.daily_ledger_rollup import apply_transaction_to_ledger_rollup
+from app.services.data_versions import bump_user_data_version
 from app.services.errors import AccessDenied, InvalidAccount, InvalidCategory
 from app.services.transaction_management.errors import InvalidTransaction
 from app.services.transaction_management.NonTransferTypeTransaction import (
@@ -22,10 +28,39 @@ from app.services.transaction_management.NonTransferTypeTransaction import (
 from app.services.transaction_management.TransferTypeTransaction import (
     TransferTypeTransaction,
 )
-from app.tasks.tasks import run_user_budgets_update
 
 ic.configureOutput(includeContext=True)
 
+# Running balance of the account from the first transaction at or after :since,
+# starting from the balance after the latest earlier transaction (or the initial balance).
+# A NULL :since recalculates the whole account.
+UPDATE_NEW_BALANCES_SQL = text("""
+    UPDATE transactions
+    SET new_balance = running.new_balance
+    FROM (
+        SELECT t.id,
+            coalesce(
+                (
+                    SELECT prev.new_balance
+                    FROM transactions prev
+                    WHERE prev.account_id = :account_id
+                        AND prev.is_deleted = false
+                        AND prev.date_time < CAST(:since AS timestamptz)
+                    ORDER BY prev.date_time DESC, prev.id DESC
+                    LIMIT 1
+                ),
+                (SELECT initial_balance FROM accounts WHERE id = :account_id)
+            ) + sum(CASE WHEN t.is_income THEN t.amount ELSE -t.amount END) OVER (
+                ORDER BY t.date_time, t.id
+            ) AS new_balance
+        FROM transactions t
+        WHERE t.account_id = :account_id
+            AND t.is_deleted = false
+            AND (CAST(:since AS timestamptz) IS NULL OR t.date_time >= :since OR t.date_time IS NULL)
+    ) running
+    WHERE transactions.id = running.id AND transactions.new_balance IS DISTINCT FROM running.new_balance
+""")
+
 
 class TransactionManager:
     def __init__(
@@ -116,21 +151,41 @@ class TransactionManager:
         return self._transaction
 
     def process(self) -> 'TransactionManager':
+        base_currency_code = self._get_base_currency_code()
+        # the linked transaction is moved to the new target account by the processing
+        prev_target_account_id = self._get_prev_target_account_id()
         if self._transaction.is_transfer:
-            self._process_transfer_type()
+            self._process_transfer_type(base_currency_code)
         else:
             self._process_non_transfer_type()
             self.db.add(self._transaction)
+        self._transaction.base_currency_amount = calc_base_currency_amount(  # type: ignore
+            self._transaction, base_currency_code, self.db
+        )
+        prev_transaction = self.prev_transaction_state if self.is_update else None
+        apply_transaction_to_budgets(self.db, self.user_id, prev_transaction, self._transaction)
+        apply_transaction_to_ledger_rollup(self.db, prev_transaction, self._transaction)
 
         self.db.commit()
 
-        #  update budgets if transaction is not transfer
-        if not self._transaction.is_transfer and not self._transaction.is_income:
-            run_user_budgets_update.delay(self.user_id)
+        # balances change from the earliest of the old and the new dates of the transaction
+        since = self._transaction.date_time
+        if self.is_update and self.prev_transaction_state.date_time is not None:
+            since = min(since, self.prev_transaction_state.date_time) if since else None
+            if self.prev_transaction_state.account_id != self._transaction.account_id:
+                update_transactions_new_balances(
+                    self.prev_transaction_state.account_id, self.db, self.prev_transaction_state.date_time
+                )
+            if (
+                prev_target_account_id is not None
+                and prev_target_account_id != self.transaction_details.target_account_id
+            ):
+                update_transactions_new_balances(prev_target_account_id, self.db, self.prev_transaction_state.date_time)
 
-        update_transactions_new_balances(self._transaction.account_id, self.db)
+        update_transactions_new_balances(self._transaction.account_id, self.db, since)
         if self._transaction.is_transfer:
-            update_transactions_new_balances(self.transaction_details.target_account_id, self.db)  # type: ignore
+            update_transactions_new_balances(self.transaction_details.target_account_id, self.db, since)  # type: ignore
+        bump_user_data_version(self.user_id)
 
         return self
 
@@ -152,20 +207,39 @@ class TransactionManager:
             indirect_transaction_type.correct_prev_balance()
             self.db.add(indirect_transaction)
         else:
-            run_user_budgets_update.delay(self.user_id)
+            apply_transaction_to_budgets(self.db, self.user_id, self._transaction, None)
+            apply_transaction_to_ledger_rollup(self.db, self._transaction, None)
 
         self._transaction.is_deleted = True
         self.db.add(self._transaction)
         self.db.commit()
 
+        update_transactions_new_balances(self._transaction.account_id, self.db, self._transaction.date_time)
+        if self._transaction.is_transfer:
+            update_transactions_new_balances(indirect_transaction.account_id, self.db, self._transaction.date_time)
+        bump_user_data_version(self.user_id)
+
         return self
 
-    def _process_transfer_type(self) -> None:
+    def _get_prev_target_account_id(self) -> int | None:
+        if not self.is_update or not self.prev_transaction_state.is_transfer:
+            return None
+
+        return self.db.execute(
+            select(Transaction.account_id).where(Transaction.id == self.prev_transaction_state.linked_transaction_id)
+        ).scalar_one_or_none()
+
+    def _get_base_currency_code(self) -> str:
+        user: User = self.db.query(User).options(joinedload(User.base_currency)).filter_by(id=self.user_id).one()
+        return user.base_currency.code
+
+    def _process_transfer_type(self, base_currency_code: str) -> None:
         transfer_type_transaction = TransferTypeTransaction(
             self._transaction,
             self.prev_transaction_state,
             self.db,
             is_update=self.is_update,
+            base_currency_code=base_currency_code,
         )
         transfer_type_transaction.process(self.transaction_details)
 
@@ -180,28 +254,14 @@ class TransactionManager:
         return self
 
 
-def update_transactions_new_balances(account_id: int, db: Session) -> bool:
-    """Update all transactions new_balance field for given account_id"""
-    transactions = (
-        db.query(Transaction)
-        .filter(Transaction.is_deleted == False)  # noqa: E712
-        .filter(Transaction.account_id == account_id)
-        .order_by(Transaction.date_time.asc())
-        .all()
-    )
-    for idx, transaction in enumerate(transactions):
-        if transaction.is_income:
-            if idx == 0:
-                transaction.new_balance = transaction.account.initial_balance + transaction.amount
-            else:
-                transaction.new_balance = transactions[idx - 1].new_balance + transaction.amount
-        else:
-            if idx == 0:
-                transaction.new_balance = transaction.account.initial_balance - transaction.amount
-            else:
-                transaction.new_balance = transactions[idx - 1].new_balance - transaction.amount
-
-        db.add(transaction)
+def update_transactions_new_balances(account_id: int, db: Session, since: datetime | None = None) -> bool:
+    """
+    Update new_balance field of transactions of given account_id, starting from the ones at or after since.
+    Transactions are ordered by date_time and id, the whole account is updated if since is None.
+    Daily balances of the account are updated from the day of since as well.
+    """
+    db.execute(UPDATE_NEW_BALANCES_SQL, {'account_id': account_id, 'since': since})
+    refresh_account_daily_balances(db, account_id, since)
     db.commit()
 
     return True
@@ -11,6 +11,7 @@ from app.schemas.transaction_schema import (
     CreateTransactionSchema,
     UpdateTransactionSchema,
 )
+from app.services.base_currency_amounts import calc_base_currency_amount
 
 from .errors import InvalidTransaction
 from .NonTransferTypeTransaction import NonTransferTypeTransaction
@@ -25,11 +26,13 @@ class TransferTypeTransaction:
         prev_transaction_state: Transaction,
         db: Session,
         is_update=False,
+        base_currency_code: str | None = None,
     ):
         self._transaction = transaction
         self._prev_transaction_state = prev_transaction_state
         self._db = db
         self._is_update = is_update
+        self._base_currency_code = base_currency_code
 
     def process(
         self, transaction_details: UpdateTransactionSchema | CreateTransactionSchema
@@ -65,6 +68,10 @@ class TransferTypeTransaction:
             target_transaction, self._prev_transaction_state, self._db, self._is_update
         )
         target_account_transaction.process()
+        if self._base_currency_code is not None:
+            target_transaction.base_currency_amount = calc_base_currency_amount(  # type: ignore
+                target_transaction, self._base_currency_code, self._db
+            )
 
         self._db.add(target_transaction)
         self._db.flush()
@@ -2,26 +2,30 @@ from datetime import datetime, timedelta
 
 from fastapi import HTTPException, status
 from icecream import ic
-from sqlalchemy import and_, or_, select
+from sqlalchemy import and_, or_, select, tuple_
 from sqlalchemy import delete as sa_delete
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Query, Session, contains_eager, joinedload
 
 from app.logger_config import logger
 from app.models.Account import Account
 from app.models.Transaction import Transaction
 from app.models.TransactionTemplate import TransactionTemplate
+from app.models.User import User
 from app.schemas.transaction_schema import (
     CreateTransactionSchema,
     UpdateTransactionSchema,
 )
-from app.services.CurrencyProcessor import calc_amount
+from app.services.base_currency_amounts import get_base_currency_amounts
 from app.services.errors import AccessDenied
 from app.services.transaction_management.errors import InvalidTransaction
 from app.services.transaction_management.TransactionManager import TransactionManager
+from app.utils.transactions_cursor import encode_cursor
 
 ic.configureOutput(includeContext=True)
 
+DEFAULT_PER_PAGE = 30
+
 
 def create_transaction(transaction_details: CreateTransactionSchema, user_id: int, db: Session) -> Transaction:
     """Create a new transaction for a user
@@ -36,16 +40,23 @@ def create_transaction(transaction_details: CreateTransactionSchema, user_id: in
     return transaction
 
 
-def get_transactions(user_id: int, db: Session, params: dict | None = None, include_deleted=False) -> list[Transaction]:
-    if params is None:
-        params = dict()
-
+def get_transactions_query(user_id: int, db: Session, params: dict, include_deleted=False) -> Query:
+    """
+    Query of the user's transactions matching the filters of params (see prepare_filters), newest first.
+    Pagination params are not applied.
+    """
+    # everything the response schema reads is loaded by this query
     stmt = (
         db.query(Transaction)
         .join(Transaction.account)
-        .options(joinedload(Transaction.account), joinedload(Transaction.category))
+        .options(
+            contains_eager(Transaction.account).joinedload(Account.currency),
+            contains_eager(Transaction.account).joinedload(Account.account_type),
+            joinedload(Transaction.category),
+        )
         .filter(Transaction.user_id == user_id)
-        .order_by(Transaction.date_time.desc())
+        # id makes the order stable for transactions with the same date_time, cursors rely on it
+        .order_by(Transaction.date_time.desc(), Transaction.id.desc())
     )
 
     if not include_deleted:
@@ -94,37 +105,74 @@ def get_transactions(user_id: int, db: Session, params: dict | None = None, incl
     if "categories" in params:
         stmt = stmt.filter(Transaction.category_id.in_(params["categories"]))
 
-    page = 1
-    if "page" in params:
-        page = int(params["page"])
-    per_page = 30
-    if "per_page" in params:
-        per_page = int(params["per_page"])
-    offset = (page - 1) * per_page
-
-    transactions: list[Transaction] = stmt.offset(offset).limit(per_page).all()  # type: ignore
-    for transaction in transactions:
-        transaction.base_currency_amount = calc_amount(
-            transaction.amount,
-            transaction.account.currency.code,
-            transaction.date_time.date(),  # type: ignore
-            transaction.user.base_currency.code,
-            db,
-        )
-        transaction.base_currency_code = transaction.user.base_currency.code
+    return stmt
+
+
+def get_transactions(user_id: int, db: Session, params: dict | None = None, include_deleted=False) -> list[Transaction]:
+    if params is None:
+        params = dict()
+
+    stmt = get_transactions_query(user_id, db, params, include_deleted)
+
+    if "cursor" in params:
+        # keyset pagination: continue right after the (date_time, id) of the last transaction of the previous page,
+        # transactions without date_time go first in the descending order
+        cursor_date_time, cursor_id = params["cursor"]
+        if cursor_date_time is None:
+            stmt = stmt.filter(
+                or_(
+                    Transaction.date_time.is_not(None),
+                    Transaction.id < cursor_id,
+                )
+            )
+        else:
+            stmt = stmt.filter(tuple_(Transaction.date_time, Transaction.id) < tuple_(cursor_date_time, cursor_id))
+    else:
+        page = 1
+        if "page" in params:
+            page = int(params["page"])
+        stmt = stmt.offset((page - 1) * get_per_page(params))
+
+    transactions: list[Transaction] = stmt.limit(get_per_page(params)).all()  # type: ignore
+    if not transactions:
+        return transactions
+
+    # transaction.user of every transaction is taken from the identity map after this query
+    user: User = db.query(User).options(joinedload(User.base_currency)).filter(User.id == user_id).one()
+    base_currency_code = user.base_currency.code
+    base_currency_amounts = get_base_currency_amounts(transactions, base_currency_code, db)
+    for transaction, base_currency_amount in zip(transactions, base_currency_amounts):
+        transaction.base_currency_amount = base_currency_amount
+        transaction.base_currency_code = base_currency_code
 
     return transactions
 
 
+def get_per_page(params: dict) -> int:
+    if "per_page" in params:
+        return int(params["per_page"])
+    return DEFAULT_PER_PAGE
+
+
+def get_next_cursor(transactions: list[Transaction], params: dict) -> str | None:
+    """Get the cursor of the page following the transactions returned by get_transactions, None for the last page"""
+    if not transactions or len(transactions) < get_per_page(params):
+        return None
+
+    return encode_cursor(transactions[-1].date_time, transactions[-1].id)
+
+
 def get_transaction_details(transaction_id: int, user_id: int, db: Session) -> Transaction:
     try:
         transaction: Transaction = (
             db.query(Transaction)  # type: ignore
             .filter_by(id=transaction_id)
             .options(
-                joinedload(Transaction.user),
+                joinedload(Transaction.user).joinedload(User.base_currency),
                 joinedload(Transaction.linked_transaction),
-                joinedload(Transaction.account),
+                joinedload(Transaction.account).joinedload(Account.currency),
+                joinedload(Transaction.account).joinedload(Account.account_type),
+                joinedload(Transaction.category),
             )
             .one()
         )
@@ -136,13 +184,9 @@ def get_transaction_details(transaction_id: int, user_id: int, db: Session) -> T
         logger.error(f"User {user_id} tried to get not own transaction {transaction_id}")
         raise HTTPException(status.HTTP_403_FORBIDDEN)
 
-    transaction.base_currency_amount = calc_amount(
-        transaction.amount,
-        transaction.account.currency.code,
-        transaction.date_time.date(),  # type: ignore
-        transaction.user.base_currency.code,
-        db,
-    )
+    transaction.base_currency_amount = get_base_currency_amounts(
+        [transaction], transaction.user.base_currency.code, db
+    )[0]
     transaction.base_currency_code = transaction.user.base_currency.code
 
     return transaction
@@ -169,7 +213,11 @@ def delete(transaction_id: int, user_id: int, db: Session) -> Transaction:
         logger.error(f"User {user_id} tried to delete not own transaction {transaction_id}")
         raise AccessDenied()
 
-    transaction.is_deleted = True
+    if transaction.is_deleted:
+        logger.error(f"Transaction {transaction_id} is already deleted")
+        raise InvalidTransaction("Transaction not found")
+
+    # the transaction is marked as deleted by the manager, after its amount is taken from the budgets and the rollup
     transaction.is_template = False
     schema = UpdateTransactionSchema.model_validate(transaction)
     transaction_manager: TransactionManager = TransactionManager(schema, user_id, db)
@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterator
+
+from icecream import ic
+from sqlalchemy.orm import Session, joinedload
+
+from app.logger_config import logger
+from app.models.Transaction import Transaction
+from app.models.User import User
+from app.services.base_currency_amounts import get_base_currency_amounts
+from app.services.transactions import get_transactions_query
+
+ic.configureOutput(includeContext=True)
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_COLUMNS = (
+    'id',
+    'date_time',
+    'account',
+    'currency',
+    'amount',
+    'is_income',
+    'is_transfer',
+    'category',
+    'label',
+    'notes',
+    'base_currency_amount',
+    'base_currency_code',
+    'new_balance',
+)
+
+
+def export_transactions(user_id: int, db: Session, params: dict, export_format: str) -> Iterator[str]:
+    """
+    Stream the user's transactions matching the filters of params in export_format (csv or ndjson), newest first.
+    Transactions are read through a server-side cursor and converted into the base currency batch by batch,
+    so the memory used does not depend on the number of the exported transactions.
+    """
+    base_currency_code = (
+        db.query(User).options(joinedload(User.base_currency)).filter(User.id == user_id).one().base_currency.code
+    )
+    transactions = iter(get_transactions_query(user_id, db, params).yield_per(EXPORT_BATCH_SIZE))
+
+    if export_format == 'csv':
+        yield _to_csv([EXPORT_COLUMNS])
+
+    exported_count = 0
+    while batch := list(islice(transactions, EXPORT_BATCH_SIZE)):
+        base_currency_amounts = get_base_currency_amounts(batch, base_currency_code, db)
+        rows = [
+            _to_row(transaction, base_currency_amount, base_currency_code)
+            for transaction, base_currency_amount in zip(batch, base_currency_amounts)
+        ]
+        if export_format == 'csv':
+            yield _to_csv([[row[column] for column in EXPORT_COLUMNS] for row in rows])
+        else:
+            yield ''.join(json.dumps(row, default=float) + '\n' for row in rows)
+
+        # the exported transactions are not needed anymore, the session must not keep all of them
+        for transaction in batch:
+            db.expunge(transaction)
+        exported_count += len(batch)
+
+    logger.info(f'Exported {exported_count} transactions of user {user_id}')
+
+
+def _to_row(transaction: Transaction, base_currency_amount, base_currency_code: str) -> dict:
+    return {
+        'id': transaction.id,
+        'date_time': transaction.date_time.isoformat() if transaction.date_time else None,
+        'account': transaction.account.name,
+        'currency': transaction.account.currency.code,
+        'amount': transaction.amount,
+        'is_income': transaction.is_income,
+        'is_transfer': transaction.is_transfer,
+        'category': transaction.category.name if transaction.category else None,
+        'label': transaction.label,
+        'notes': transaction.notes,
+        'base_currency_amount': base_currency_amount,
+        'base_currency_code': base_currency_code,
+        'new_balance': transaction.new_balance,
+    }
+
+
+def _to_csv(rows: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
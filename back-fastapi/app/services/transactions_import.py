@@ -0,0 +1,227 @@
+import csv
+import re
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Iterable, Iterator, NamedTuple
+
+from icecream import ic
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, joinedload
+
+from app.logger_config import logger
+from app.models.Account import Account
+from app.models.Transaction import LABEL_MAX_LENGTH, Transaction
+from app.models.User import User
+from app.models.UserCategory import UserCategory
+from app.services.CurrencyProcessor import ExchangeRateAbsentError, calc_amounts
+from app.services.daily_ledger_rollup import refresh_daily_ledger_rollup
+from app.services.data_versions import bump_user_data_version
+from app.services.errors import AccessDenied, InvalidAccount, InvalidCategory, InvalidImportFile
+from app.services.transaction_management.TransactionManager import update_transactions_new_balances
+from app.tasks.tasks import schedule_user_budgets_update
+
+ic.configureOutput(includeContext=True)
+
+IMPORT_CHUNK_SIZE = 1000
+
+# OFX 1.x is SGML where the closing tags of values are optional, OFX 2.x is XML. Both are read tag by tag.
+OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+
+
+class ImportedTransaction(NamedTuple):
+    date_time: datetime
+    amount: Decimal  # negative for expenses
+    label: str
+    category: str
+    notes: str
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[ImportedTransaction]:
+    """
+    Parse a CSV statement with the header row.
+    Columns: date (ISO date or date and time), amount (negative for expenses),
+    optional label, category (name of the user's category) and notes.
+    """
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None or not {'date', 'amount'} <= {name.strip().lower() for name in reader.fieldnames}:
+        raise InvalidImportFile('CSV file must have date and amount columns')
+
+    for row in reader:
+        # fields beyond the header are collected under the None key
+        if None in row:
+            raise InvalidImportFile(f'Too many fields at line {reader.line_num}')
+        row = {key.strip().lower(): (value or '').strip() for key, value in row.items()}
+        yield ImportedTransaction(
+            date_time=_parse_date_time(row.get('date', ''), reader.line_num),
+            amount=_parse_amount(row.get('amount', ''), reader.line_num),
+            label=row.get('label', ''),
+            category=row.get('category', ''),
+            notes=row.get('notes', ''),
+        )
+
+
+def parse_ofx(lines: Iterable[str]) -> Iterator[ImportedTransaction]:
+    """Parse STMTTRN records of an OFX statement"""
+    record: dict[str, str] | None = None
+    for line_num, line in enumerate(lines, start=1):
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing and record is not None:
+                    yield _ofx_record_to_transaction(record, line_num)
+                record = None if closing else {}
+            elif record is not None and not closing:
+                record[tag] = value.strip()
+
+
+def import_transactions(
+    user_id: int,
+    account_id: int,
+    transactions: Iterable[ImportedTransaction],
+    expense_category_id: int,
+    income_category_id: int,
+    db: Session,
+) -> int:
+    """
+    Insert the imported transactions into the account in chunks.
+    Transactions get the user's category of the same name, the default expense or income category otherwise.
+    Balances of the account and the budgets are recalculated once, after all the transactions are inserted.
+
+    Returns the number of the imported transactions.
+    """
+    account: Account | None = db.execute(
+        select(Account).options(joinedload(Account.currency)).where(Account.id == account_id)
+    ).scalar_one_or_none()
+    if account is None or account.is_deleted:
+        logger.error(f'Account {account_id} not found')
+        raise InvalidAccount()
+    if account.user_id != user_id:
+        logger.error(f'User {user_id} tried to import transactions into not own account {account_id}')
+        raise AccessDenied()
+
+    categories: list[UserCategory] = list(
+        db.execute(
+            select(UserCategory).where(UserCategory.user_id == user_id, UserCategory.is_deleted == False)  # noqa: E712
+        ).scalars()
+    )
+    categories_by_id = {category.id: category for category in categories}
+    expense_category = categories_by_id.get(expense_category_id)
+    income_category = categories_by_id.get(income_category_id)
+    if (
+        expense_category is None
+        or expense_category.is_income
+        or income_category is None
+        or not income_category.is_income
+    ):
+        logger.error(f'Invalid default categories {expense_category_id}, {income_category_id} of user {user_id}')
+        raise InvalidCategory()
+    categories_by_name = {(category.name.lower(), category.is_income): category.id for category in categories}
+
+    base_currency_code = (
+        db.query(User).options(joinedload(User.base_currency)).filter(User.id == user_id).one().base_currency.code
+    )
+
+    imported_count = 0
+    balance_delta = Decimal(0)
+    earliest_date_time: datetime | None = None
+    has_expenses = False
+    transactions = iter(transactions)
+    try:
+        while chunk := list(islice(transactions, IMPORT_CHUNK_SIZE)):
+            try:
+                base_currency_amounts: list[Decimal | None] = calc_amounts(  # type: ignore
+                    [(abs(item.amount), account.currency.code, item.date_time.date()) for item in chunk],
+                    base_currency_code,
+                    db,
+                )
+            except ExchangeRateAbsentError as e:
+                # converted on read till they are materialized
+                logger.warning(f'Base currency amounts of the imported transactions are left empty: {e}')
+                base_currency_amounts = [None] * len(chunk)
+
+            rows = []
+            for item, base_currency_amount in zip(chunk, base_currency_amounts):
+                is_income = item.amount > 0
+                default_category = income_category if is_income else expense_category
+                rows.append(
+                    {
+                        'user_id': user_id,
+                        'account_id': account_id,
+                        'category_id': categories_by_name.get((item.category.lower(), is_income), default_category.id),
+                        'amount': abs(item.amount),
+                        'label': item.label[:LABEL_MAX_LENGTH],
+                        'notes': item.notes,
+                        'is_income': is_income,
+                        'is_transfer': False,
+                        'is_deleted': False,
+                        'date_time': item.date_time,
+                        'base_currency_amount': base_currency_amount,
+                    }
+                )
+                balance_delta += item.amount
+                has_expenses = has_expenses or not is_income
+                if earliest_date_time is None or item.date_time < earliest_date_time:
+                    earliest_date_time = item.date_time
+
+            db.execute(insert(Transaction), rows)
+            imported_count += len(rows)
+            logger.info(f'Imported {imported_count} transactions into account {account_id}')
+    except Exception:
+        # nothing is imported from a file with an invalid row
+        db.rollback()
+        raise
+
+    if imported_count == 0:
+        return 0
+
+    account.balance += balance_delta
+    refresh_daily_ledger_rollup(db, account_id, earliest_date_time)
+    db.commit()
+
+    update_transactions_new_balances(account_id, db, earliest_date_time)
+    bump_user_data_version(user_id)
+    if has_expenses:
+        schedule_user_budgets_update(user_id)
+
+    return imported_count
+
+
+def _parse_date_time(value: str, line_num: int) -> datetime:
+    try:
+        date_time = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidImportFile(f'Invalid date "{value}" at line {line_num}')
+
+    return date_time if date_time.tzinfo is not None else date_time.replace(tzinfo=timezone.utc)
+
+
+def _parse_amount(value: str, line_num: int) -> Decimal:
+    try:
+        amount = Decimal(value.replace(' ', ''))
+    except InvalidOperation:
+        raise InvalidImportFile(f'Invalid amount "{value}" at line {line_num}')
+    if not amount.is_finite() or amount == 0:
+        raise InvalidImportFile(f'Invalid amount "{value}" at line {line_num}')
+
+    return amount
+
+
+def _ofx_record_to_transaction(record: dict[str, str], line_num: int) -> ImportedTransaction:
+    # DTPOSTED is YYYYMMDD[HHMMSS[.XXX]][[offset:TZ]], the time zone is ignored
+    posted = record.get('DTPOSTED', '')
+    try:
+        if len(posted) >= 14:
+            date_time = datetime.strptime(posted[:14], '%Y%m%d%H%M%S')
+        else:
+            date_time = datetime.combine(datetime.strptime(posted[:8], '%Y%m%d').date(), datetime.min.time())
+    except ValueError:
+        raise InvalidImportFile(f'Invalid date "{posted}" at line {line_num}')
+
+    return ImportedTransaction(
+        date_time=date_time.replace(tzinfo=timezone.utc),
+        amount=_parse_amount(record.get('TRNAMT', ''), line_num),
+        label=record.get('NAME') or record.get('PAYEE') or '',
+        category='',
+        notes=record.get('MEMO', ''),
+    )
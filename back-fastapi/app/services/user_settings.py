@@ -8,7 +8,10 @@ from app.models.Language import Language
 from app.models.PlannedTransaction import PlannedTransaction
 from app.models.User import User
 from app.models.UserSettings import UserSettings
+from app.services.base_currency_amounts import reset_base_currency_amounts
 from app.services.CurrencyProcessor import calc_amount
+from app.services.data_versions import bump_user_data_version
+from app.tasks.tasks import materialize_transactions_base_currency_amounts
 
 
 def get_languages(db: Session) -> list[Language]:
@@ -111,9 +114,16 @@ def update_base_currency(user_id: int, currency_id: int, db: Session) -> Currenc
 
         logger.info(f"Converted {len(planned_transactions)} planned transactions to {new_currency.code}")
 
+        # amounts in the old currency are not served, transactions are converted on read till they are materialized
+        reset_base_currency_amounts(db, user_id)
+
     # Update user's base currency
     user.base_currency_id = currency_id
     db.commit()
     db.refresh(user)
+    bump_user_data_version(user_id)
+
+    if old_currency and old_currency.id != currency_id:
+        materialize_transactions_base_currency_amounts.delay(user_id=user_id)  # type: ignore
 
     return new_currency
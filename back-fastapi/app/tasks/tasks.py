@@ -3,6 +3,8 @@ import os
 from datetime import date, datetime, timedelta
 from pathlib import Path
 
+from redis.exceptions import RedisError
+
 from app.celery import celery_app
 from app.config import Settings
 from app.database import get_db
@@ -10,18 +12,27 @@ from app.logger_config import logger
 from app.models.ActivationToken import ActivationToken
 from app.models.PlannedTransaction import PlannedTransaction
 from app.models.User import User
+from app.services.account_daily_balances import rebuild_account_daily_balances
+from app.services.base_currency_amounts import materialize_base_currency_amounts
 from app.services.budgets import (
     put_outdated_budgets_to_archive,
+    repair_budgets,
     update_budget_with_amount,
 )
+from app.services.CurrencyProcessor import build_exchange_rates_file
+from app.services.daily_ledger_rollup import rebuild_daily_ledger_rollup
+from app.services.data_versions import bump_global_data_version, bump_user_data_version
 from app.services.exchange_rates import update_exchange_rates as update_exchange_rates
 from app.tasks.errors import BackupPostgresDbError
 from app.utils.db.backup import backup_postgres_db
 from app.utils.email import send_html_email
 from app.utils.gdrive_backup import GoogleDriveBackup
+from app.utils.redis_client import get_redis
 
 settings = Settings()
 
+BUDGETS_UPDATE_PENDING_KEY = 'budgets_update_pending:{user_id}'
+
 
 @celery_app.task(bind=True, max_retries=24, default_retry_delay=600)
 def daily_update_exchange_rates(task):
@@ -32,6 +43,15 @@ def daily_update_exchange_rates(task):
     except Exception as e:
         raise task.retry(exc=e)
 
+    try:
+        build_exchange_rates_file(db)
+    except Exception as e:
+        # the rates are already in DB, the workers load them from there until the next successful build
+        logger.exception(e)
+
+    # today's transactions were converted with the rates carried forward from the previous day
+    materialize_transactions_base_currency_amounts.delay(since=date.today().isoformat())  # type: ignore
+
     now = datetime.now()
     send_email.delay(  # type: ignore
         subject='Exchange rates updated',
@@ -176,10 +196,70 @@ def run_daily_budgets_processing(task):
     return True
 
 
+@celery_app.task(bind=True, max_retries=10, default_retry_delay=600)
+def run_budgets_repair(task):
+    """Refill all the active budgets and report the ones which were out of sync with their transactions"""
+    logger.info('Budgets repair is requested')
+
+    db = next(get_db())
+    try:
+        repaired_budgets = repair_budgets(db)
+    except Exception as e:
+        logger.exception(e)
+        db.rollback()
+        task.retry(exc=e)
+    if repaired_budgets:
+        bump_global_data_version()
+
+    return f'Repaired budgets: {repaired_budgets}'
+
+
+@celery_app.task(bind=True, max_retries=10, default_retry_delay=600)
+def run_account_daily_balances_repair(task):
+    """Rebuild the daily balances of all the accounts from the balances of their transactions"""
+    logger.info('Account daily balances repair is requested')
+
+    db = next(get_db())
+    try:
+        repaired_user_ids = rebuild_account_daily_balances(db)
+    except Exception as e:
+        logger.exception(e)
+        db.rollback()
+        task.retry(exc=e)
+    for user_id in repaired_user_ids:
+        bump_user_data_version(user_id)
+
+    return f'Repaired account daily balances of users: {repaired_user_ids}'
+
+
+@celery_app.task(bind=True, max_retries=10, default_retry_delay=600)
+def run_daily_ledger_rollup_repair(task):
+    """Rebuild the daily ledger rollup of all the accounts from their transactions"""
+    logger.info('Daily ledger rollup repair is requested')
+
+    db = next(get_db())
+    try:
+        repaired_user_ids = rebuild_daily_ledger_rollup(db)
+    except Exception as e:
+        logger.exception(e)
+        db.rollback()
+        task.retry(exc=e)
+    for user_id in repaired_user_ids:
+        bump_user_data_version(user_id)
+
+    return f'Repaired daily ledger rollup of users: {repaired_user_ids}'
+
+
 @celery_app.task(bind=True, max_retries=10, default_retry_delay=30)
 def run_user_budgets_update(task, user_id: int):
     logger.info(f'Updating budgets for user_id: {user_id}')
 
+    # transactions changed from now on are not seen by this update, so they schedule the next one
+    try:
+        get_redis().delete(BUDGETS_UPDATE_PENDING_KEY.format(user_id=user_id))
+    except RedisError as e:
+        logger.warning(f'Unable to clear pending budgets update of user {user_id}: {e}')
+
     db = next(get_db())
     try:
         update_budget_with_amount(db, user_id)
@@ -190,6 +270,55 @@ def run_user_budgets_update(task, user_id: int):
     return True
 
 
+def schedule_user_budgets_update(user_id: int) -> bool:
+    """
+    Schedule the update of the user's budgets in BUDGETS_UPDATE_DELAY_SECONDS, unless one is pending already.
+    All the changes made till the pending update starts are picked up by it.
+    Returns True if a new update is scheduled.
+    """
+    try:
+        is_scheduled = get_redis().set(
+            BUDGETS_UPDATE_PENDING_KEY.format(user_id=user_id),
+            1,
+            nx=True,
+            ex=settings.BUDGETS_UPDATE_PENDING_TTL_SECONDS,
+        )
+    except RedisError as e:
+        logger.warning(f'Unable to check pending budgets update of user {user_id}: {e}')
+        is_scheduled = True
+
+    if is_scheduled:
+        run_user_budgets_update.apply_async((user_id,), countdown=settings.BUDGETS_UPDATE_DELAY_SECONDS)
+
+    return bool(is_scheduled)
+
+
+@celery_app.task(bind=True, max_retries=10, default_retry_delay=600)
+def materialize_transactions_base_currency_amounts(task, user_id: int | None = None, since: str | None = None):
+    """
+    Rewrite base currency amounts of the transactions of user_id (all the users if None)
+    dated at or after since (ISO date, all the dates if None)
+    """
+    logger.info(f'Materializing base currency amounts for user_id: {user_id}, since: {since}')
+
+    db = next(get_db())
+    try:
+        materialized_count = materialize_base_currency_amounts(
+            db, user_id=user_id, since=date.fromisoformat(since) if since else None
+        )
+    except Exception as e:
+        logger.exception(e)
+        db.rollback()
+        task.retry(exc=e)
+
+    if user_id is not None:
+        bump_user_data_version(user_id)
+    elif materialized_count:
+        bump_global_data_version()
+
+    return materialized_count
+
+
 @celery_app.task(bind=True, max_retries=10, default_retry_delay=600)
 def delete_old_activation_tokens(task):
     """Delete activation tokens older than 24 hours"""
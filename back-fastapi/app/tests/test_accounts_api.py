@@ -1,4 +1,5 @@
 import pytest
+import redis
 from fastapi import status
 from fastapi.testclient import TestClient
 from icecream import ic
@@ -145,6 +146,45 @@ def test_get_accounts_list(token, create_accounts):
     assert accounts_list[number_of_accounts - 1]['openingDate'] is not None
 
 
+def test_get_accounts_list_etag(token, create_accounts, monkeypatch):
+    # the same Redis which is the Celery broker in tests
+    redis_client = redis.Redis.from_url('redis://localhost:6379')
+    monkeypatch.setattr('app.services.data_versions.get_redis', lambda: redis_client)
+    headers = {'auth-token': token}
+    response = client.get(f'{accounts_path_prefix}/', headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers['ETag']
+    assert etag.startswith('"') and etag.endswith('"')
+
+    def fail_get_user_accounts(*args, **kwargs):
+        raise AssertionError('Not modified accounts must not be read')
+
+    with monkeypatch.context() as patch:
+        patch.setattr('app.routes.accounts.get_user_accounts', fail_get_user_accounts)
+        response = client.get(f'{accounts_path_prefix}/', headers={**headers, 'If-None-Match': f'"other", W/{etag}'})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b''
+    assert response.headers['ETag'] == etag
+    assert 'new_access_token' in response.headers
+
+    response = client.get(f'{accounts_path_prefix}/?includeHidden=true', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['ETag'] != etag
+
+    # other workers' writes are not known without Redis, nothing may be validated then
+    with monkeypatch.context() as patch:
+        patch.setattr('app.dependencies.check_etag.get_data_version', lambda user_id: None)
+        response = client.get(f'{accounts_path_prefix}/', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert 'ETag' not in response.headers
+
+    delete_response = client.delete(f'{accounts_path_prefix}/{create_accounts[0].id}', headers=headers)
+    assert delete_response.status_code == status.HTTP_200_OK
+    response = client.get(f'{accounts_path_prefix}/', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == len(create_accounts) - 1
+
+
 def test_all_account_types_exist(token):
     response = client.get(f'{accounts_path_prefix}/types/', headers={'auth-token': token})
     assert response.status_code == status.HTTP_200_OK
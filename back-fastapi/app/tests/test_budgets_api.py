@@ -1,14 +1,31 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
 import pytest
+import redis
 from fastapi import status
 from fastapi.testclient import TestClient
+from sqlalchemy import func
 
+from app.config import settings
 from app.main import app
 from app.models.Budget import PeriodEnum
+from app.models.Currency import Currency
+from app.models.UserCategory import UserCategory
+from app.schemas.account_schema import CreateAccountSchema
+from app.schemas.budgets_schema import EditBudgetInputSchema, NewBudgetInputSchema
+from app.schemas.transaction_schema import CreateTransactionSchema, UpdateTransactionSchema
+from app.services.accounts import create_account as create_account_service
+from app.services.budgets import create_new_budget, repair_budgets, update_budget
 from app.services.errors import NotFoundError
+from app.services.transaction_management.errors import InvalidTransaction
+from app.services.transactions import create_transaction as create_transaction_service
+from app.services.transactions import delete as delete_transaction_service
+from app.services.transactions import update as update_transaction_service
+from app.tasks import tasks
 from app.tests.conftest import db, main_test_user_id
+from app.tests.data.accounts_data import test_accounts_data
+from app.tests.db_test_cfg import override_get_db
 
 client = TestClient(app)
 
@@ -62,3 +79,161 @@ class TestBudgetsAPI:
         # We'll test the forbidden case since we don't have admin user
         response = client.get("/budgets/daily-processing/", headers=auth_headers)
         assert response.status_code == 403
+
+
+def test_budgets_updates_are_coalesced(monkeypatch):
+    # the same Redis which is the Celery broker in tests
+    redis_client = redis.Redis.from_url("redis://localhost:6379")
+    monkeypatch.setattr(tasks, "get_redis", lambda: redis_client)
+    monkeypatch.setattr(tasks, "get_db", override_get_db)
+    scheduled = []
+    monkeypatch.setattr(
+        tasks.run_user_budgets_update, "apply_async", lambda args, countdown: scheduled.append((args, countdown))
+    )
+    pending_key = tasks.BUDGETS_UPDATE_PENDING_KEY.format(user_id=main_test_user_id)
+    redis_client.delete(pending_key)
+
+    try:
+        assert [tasks.schedule_user_budgets_update(main_test_user_id) for _ in range(50)] == [True] + [False] * 49
+        assert scheduled == [((main_test_user_id,), settings.BUDGETS_UPDATE_DELAY_SECONDS)]
+
+        # the update clears the marker before it reads the transactions, later changes schedule the next one
+        tasks.run_user_budgets_update(main_test_user_id)
+        assert tasks.schedule_user_budgets_update(main_test_user_id)
+        assert len(scheduled) == 2
+    finally:
+        redis_client.delete(pending_key)
+
+
+def test_budgets_are_changed_incrementally(one_account):
+    expense_categories = (
+        db.query(UserCategory)
+        .filter(UserCategory.user_id == main_test_user_id, UserCategory.is_income.is_(False))
+        .order_by(UserCategory.id)
+        .all()
+    )
+    budget_category, other_category = expense_categories[0], expense_categories[1]
+    budget_dto = NewBudgetInputSchema(
+        name="January",
+        currency_id=one_account["currency_id"],
+        target_amount=Decimal(1000),
+        period=PeriodEnum.MONTHLY,
+        repeat=False,
+        start_date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+        end_date=datetime(2024, 1, 31, tzinfo=timezone.utc),
+        categories=[budget_category.id],
+    )
+    budget = create_new_budget(main_test_user_id, db, budget_dto)
+
+    def collected_amount() -> Decimal:
+        db.refresh(budget)
+        return budget.collected_amount
+
+    def save(amount: int, category_id: int, day: int, transaction_id: int | None = None):
+        transaction_details = {
+            "id": transaction_id,
+            "account_id": one_account["id"],
+            "amount": amount,
+            "category_id": category_id,
+            "is_income": False,
+            "is_transfer": False,
+            "date_time": datetime(2024, 1, day, 12, tzinfo=timezone.utc),
+            "target_account_id": None,
+        }
+        if transaction_id is None:
+            return create_transaction_service(CreateTransactionSchema(**transaction_details), main_test_user_id, db)
+        return update_transaction_service(UpdateTransactionSchema(**transaction_details), main_test_user_id, db)
+
+    transaction = save(100, budget_category.id, 10)
+    assert collected_amount() == 100
+
+    save(150, budget_category.id, 10, transaction.id)
+    assert collected_amount() == 150
+
+    # neither other categories nor other dates are collected
+    save(150, other_category.id, 10, transaction.id)
+    save(40, budget_category.id, 1)
+    assert collected_amount() == 40
+
+    save(150, budget_category.id, 20, transaction.id)
+    assert collected_amount() == 190
+
+    delete_transaction_service(transaction.id, main_test_user_id, db)
+    assert collected_amount() == 40
+
+    # a deleted transaction is not taken from the budgets again
+    with pytest.raises(InvalidTransaction):
+        delete_transaction_service(transaction.id, main_test_user_id, db)
+    assert collected_amount() == 40
+
+    assert repair_budgets(db) == []
+    budget.collected_amount = Decimal(999)
+    db.commit()
+    assert repair_budgets(db) == [budget.id]
+    assert collected_amount() == 40
+
+    # expenses of the added categories are collected right away
+    save(60, other_category.id, 15)
+    edit_dto = EditBudgetInputSchema(
+        **{**budget_dto.model_dump(), "categories": [budget_category.id, other_category.id]}, id=budget.id
+    )
+    update_budget(main_test_user_id, db, edit_dto)
+    assert collected_amount() == 100
+    assert sorted(link.category_id for link in budget.category_links) == [budget_category.id, other_category.id]
+
+
+def test_transactions_without_rates_do_not_block_writes(token, one_account):
+    headers = {"auth-token": token}
+    # currencies are loaded with their ids, the sequence is not advanced
+    currency = Currency(id=db.query(func.max(Currency.id)).scalar() + 1, code="XTS", name="Currency without rates")
+    db.add(currency)
+    db.commit()
+    account = create_account_service(
+        CreateAccountSchema.model_validate({**test_accounts_data[0], "id": None, "currencyId": currency.id}),
+        main_test_user_id,
+        db,
+    )
+    expense_category = (
+        db.query(UserCategory)
+        .filter(UserCategory.user_id == main_test_user_id, UserCategory.is_income.is_(False))
+        .order_by(UserCategory.id)
+        .first()
+    )
+    now = datetime.now(timezone.utc)
+    budget = create_new_budget(
+        main_test_user_id,
+        db,
+        NewBudgetInputSchema(
+            name="Active",
+            currency_id=one_account["currency_id"],
+            target_amount=Decimal(1000),
+            period=PeriodEnum.MONTHLY,
+            repeat=False,
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1),
+            categories=[expense_category.id],  # type: ignore
+        ),
+    )
+    transaction_data = {
+        "accountId": account.id,
+        "amount": 100,
+        "categoryId": expense_category.id,  # type: ignore
+        "isIncome": False,
+        "isTransfer": False,
+        "dateTime": now.isoformat(),
+    }
+
+    response = client.post("/transactions/", json=transaction_data, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    transaction_id = response.json()["id"]
+
+    response = client.put(
+        "/transactions/", json={**transaction_data, "id": transaction_id, "amount": 50}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.delete(f"/transactions/{transaction_id}", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    db.refresh(budget)
+    assert budget.collected_amount == 0
@@ -1,9 +1,14 @@
 import icecream
+import redis
 from fastapi.testclient import TestClient
 from icecream import ic
 
 from app.main import app
-from app.tests.conftest import categories_path_prefix
+from app.models.UserCategory import UserCategory
+from app.services import category_tree
+from app.services.categories import get_user_categories
+from app.services.category_tree import CATEGORY_TREE_KEY
+from app.tests.conftest import categories_path_prefix, db, main_test_user_id
 
 icecream.install()
 
@@ -16,3 +21,44 @@ def test_get_user_categories(token):
     categories = response.json()
     assert type(categories) == list
     assert len(categories) > 0
+
+
+def test_category_tree(token, monkeypatch):
+    # the same Redis which is the Celery broker in tests
+    redis_client = redis.Redis.from_url("redis://localhost:6379")
+    monkeypatch.setattr(category_tree, "get_redis", lambda: redis_client)
+    cache_key = CATEGORY_TREE_KEY.format(user_id=main_test_user_id)
+    redis_client.delete(cache_key)
+
+    try:
+        parent_id = None
+        for name in ('Zoo', 'Tickets', 'Kids'):
+            response = client.post(
+                f'{categories_path_prefix}/',
+                json={'name': name, 'parentId': parent_id, 'isIncome': False},
+                headers={'auth-token': token},
+            )
+            assert response.status_code == 201
+            parent_id = response.json()['id']
+
+        categories = get_user_categories(main_test_user_id, db)
+        names = [category['name'] for category in categories]
+        assert names.index('(-) Zoo >> Tickets >> Kids') == names.index('(-) Zoo >> Tickets') + 1
+        # the categories loaded into the session are left untouched
+        assert not db.dirty
+        assert all(not category.name.startswith('(') for category in db.query(UserCategory).all())
+        assert redis_client.exists(cache_key)
+
+        response = client.get(f'{categories_path_prefix}/grouped/', headers={'auth-token': token})
+        zoo = next(category for category in response.json()['expenses'] if category['name'] == 'Zoo')
+        assert zoo['children'][0]['name'] == 'Tickets'
+        assert zoo['children'][0]['children'][0]['id'] == parent_id
+
+        response = client.delete(f'{categories_path_prefix}/{parent_id}/', headers={'auth-token': token})
+        assert response.status_code == 200
+        assert not redis_client.exists(cache_key)
+        names = [category['name'] for category in get_user_categories(main_test_user_id, db)]
+        assert '(-) Zoo >> Tickets >> Kids' not in names
+        assert '(-) Zoo >> Tickets' in names
+    finally:
+        redis_client.delete(cache_key)
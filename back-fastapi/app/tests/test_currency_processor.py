@@ -0,0 +1,224 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from app.config import settings
+from app.models.ExchangeRateHistory import ExchangeRateHistory
+from app.services import CurrencyProcessor
+from app.services.CurrencyProcessor import (
+    ExchangeRateAbsentError,
+    build_rates_table,
+    calc_amount,
+    calc_amounts,
+    clear_cross_rates,
+    currency_cache,
+    get_cross_rates_stats,
+    get_exchange_rates_for_date,
+    get_exchange_rates_for_year,
+    get_rate_with_fallback,
+    notify_exchange_rates_updated,
+)
+from app.services.exchange_rates_file import MappedRatesTable, write_rates_file
+from app.tests.conftest import db
+
+raw_rates = {
+    '2024-01-01': {'USD': 1, 'EUR': 0.5},
+    '2024-01-02': {'USD': 1, 'EUR': 0.6, 'UAH': 40},
+    '2024-01-03': {'USD': 1, 'EUR': 0.7},
+}
+
+
+@pytest.fixture(autouse=True)
+def empty_cross_rates():
+    # the tests below use their own rates, they must not leak into the cross rates of other tests
+    clear_cross_rates()
+    yield
+    clear_cross_rates()
+
+
+def test_build_rates_table():
+    table = build_rates_table(raw_rates)
+
+    assert table['dates'] == [date(2024, 1, day).toordinal() for day in (1, 2, 3)]
+    assert table['rates']['EUR'] == [Decimal(0.5), Decimal(0.6), Decimal(0.7)]
+    # absent rates are forward-filled, but never back-filled
+    assert table['rates']['UAH'] == [None, Decimal(40), Decimal(40)]
+
+
+def test_get_rate_with_fallback():
+    table = build_rates_table(raw_rates)
+
+    assert get_rate_with_fallback(table, date(2024, 1, 2), 'EUR') == Decimal(0.6)
+    assert get_rate_with_fallback(table, date(2024, 1, 3), 'UAH') == Decimal(40)
+    assert get_rate_with_fallback(table, date(2030, 1, 1), 'EUR') == Decimal(0.7)
+
+    with pytest.raises(ExchangeRateAbsentError):
+        get_rate_with_fallback(table, date(2023, 12, 31), 'EUR')
+    with pytest.raises(ExchangeRateAbsentError):
+        get_rate_with_fallback(table, date(2024, 1, 1), 'UAH')
+    with pytest.raises(ExchangeRateAbsentError):
+        get_rate_with_fallback(table, date(2024, 1, 2), 'GBP')
+
+
+def test_calc_amounts(monkeypatch):
+    table = build_rates_table(raw_rates)
+    monkeypatch.setattr(CurrencyProcessor, 'get_exchange_rates_for_year', lambda db: table)
+    monkeypatch.setattr(CurrencyProcessor, 'get_exchange_rates_for_date', lambda db, calc_date: table)
+
+    items = [
+        (Decimal(10), 'EUR', date(2024, 1, 1)),
+        (Decimal(20), 'USD', date(2024, 1, 1)),
+        (Decimal(30), 'EUR', date(2024, 1, 1)),
+        (Decimal(400), 'UAH', date(2024, 1, 3)),
+    ]
+    converted = calc_amounts(items, 'USD', None)  # type: ignore
+
+    assert converted == [calc_amount(amount, code, day, 'USD', None) for amount, code, day in items]  # type: ignore
+    assert converted[1] == Decimal(20)
+    assert converted[3] == Decimal(10)
+    assert calc_amounts([], 'USD', None) == []  # type: ignore
+
+
+def test_cross_rates_are_memoized(monkeypatch):
+    table = build_rates_table(raw_rates)
+    monkeypatch.setattr(CurrencyProcessor, 'get_exchange_rates_for_year', lambda db: table)
+    monkeypatch.setattr(CurrencyProcessor, 'get_exchange_rates_for_date', lambda db, calc_date: table)
+    stats = get_cross_rates_stats()
+
+    cross_rate = Decimal(40) / Decimal(0.6)
+    assert calc_amount(Decimal(10), 'EUR', date(2024, 1, 2), 'UAH', None) == Decimal(10) * cross_rate  # type: ignore
+    assert calc_amount(Decimal(20), 'EUR', date(2024, 1, 2), 'UAH', None) == Decimal(20) * cross_rate  # type: ignore
+
+    assert get_cross_rates_stats()['misses'] == stats['misses'] + 1
+    assert get_cross_rates_stats()['hits'] == stats['hits'] + 1
+    assert get_cross_rates_stats()['size'] == 1
+
+    clear_cross_rates()
+    assert get_cross_rates_stats()['size'] == 0
+
+
+def test_refresh_loads_only_new_rates():
+    get_exchange_rates_for_year(db)
+    loaded_watermark = currency_cache['watermark']
+
+    rates_date = date.today() - timedelta(days=100)
+    exchange_rates = ExchangeRateHistory(
+        rates={'USD': 1, 'EUR': 0.25},
+        actual_date=rates_date,
+        base_currency_code='USD',
+        service_name='test',
+    )
+    db.add(exchange_rates)
+    db.commit()
+
+    try:
+        notify_exchange_rates_updated(db)
+
+        table = get_exchange_rates_for_year(db)
+        assert get_rate_with_fallback(table, rates_date, 'EUR') == Decimal(0.25)
+        assert currency_cache['watermark'] > loaded_watermark
+    finally:
+        db.delete(exchange_rates)
+        db.commit()
+        # force the full reload, the deleted row must not stay in the cache
+        currency_cache['last_updated'] = None
+
+
+def test_history_segments_are_loaded_on_demand(monkeypatch):
+    monkeypatch.setattr(settings, 'EXCHANGE_RATES_HISTORY_SEGMENTS', 1)
+    exchange_rates = ExchangeRateHistory(
+        rates={'USD': 1, 'EUR': 0.8},
+        actual_date=date(2021, 3, 1),
+        base_currency_code='USD',
+        service_name='test',
+    )
+    db.add(exchange_rates)
+    db.commit()
+
+    try:
+        segment = get_exchange_rates_for_date(db, date(2021, 3, 15))
+        assert get_rate_with_fallback(segment, date(2021, 3, 15), 'EUR') == Decimal(0.8)
+        assert list(currency_cache['history']) == [2021]
+
+        # the least recently used year is evicted
+        get_exchange_rates_for_date(db, date(2020, 6, 1))
+        assert list(currency_cache['history']) == [2020]
+        assert get_exchange_rates_for_date(db, date.today()) is currency_cache['data']
+    finally:
+        db.delete(exchange_rates)
+        db.commit()
+        currency_cache['history'].clear()
+
+
+def test_mapped_rates_file(tmp_path):
+    table = build_rates_table(raw_rates)
+    path = str(tmp_path / 'exchange_rates.bin')
+    write_rates_file(path, table, version=7)
+
+    mapped_table = MappedRatesTable(path)
+
+    assert mapped_table.version == 7
+    for day in (date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3), date(2030, 1, 1)):
+        for code in ('USD', 'EUR'):
+            assert get_rate_with_fallback(mapped_table, day, code) == pytest.approx(
+                get_rate_with_fallback(table, day, code)
+            )
+    assert get_rate_with_fallback(mapped_table, date(2024, 1, 3), 'UAH') == Decimal(40)
+
+    with pytest.raises(ExchangeRateAbsentError):
+        get_rate_with_fallback(mapped_table, date(2023, 12, 31), 'EUR')
+    with pytest.raises(ExchangeRateAbsentError):
+        get_rate_with_fallback(mapped_table, date(2024, 1, 1), 'UAH')
+    with pytest.raises(ExchangeRateAbsentError):
+        get_rate_with_fallback(mapped_table, date(2024, 1, 2), 'GBP')
+
+
+def test_first_load_is_single_flight(monkeypatch):
+    monkeypatch.setitem(currency_cache, 'last_updated', None)
+    loads = []
+
+    def slow_load(db):
+        loads.append(db)
+        time.sleep(0.1)
+        currency_cache['last_updated'] = datetime.now()
+
+    monkeypatch.setattr(CurrencyProcessor, 'load_exchange_rates', slow_load)
+
+    threads = [threading.Thread(target=get_exchange_rates_for_year, args=(db,)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+
+
+def test_stale_rates_are_served_while_refreshing(monkeypatch):
+    stale_table = build_rates_table(raw_rates)
+    monkeypatch.setitem(currency_cache, 'data', stale_table)
+    monkeypatch.setitem(currency_cache, 'last_updated', datetime.now() - timedelta(days=2))
+    refresh_started = threading.Event()
+    refresh_released = threading.Event()
+    loads = []
+
+    def slow_load(db):
+        loads.append(db)
+        refresh_started.set()
+        refresh_released.wait(5)
+
+    monkeypatch.setattr(CurrencyProcessor, 'load_exchange_rates', slow_load)
+
+    try:
+        assert get_exchange_rates_for_year(db) is stale_table
+        assert refresh_started.wait(5)
+        # the refresh is still running, so the stale rates are served and no other refresh is started
+        assert get_exchange_rates_for_year(db) is stale_table
+    finally:
+        refresh_released.set()
+        with CurrencyProcessor._load_lock:
+            pass
+
+    assert len(loads) == 1
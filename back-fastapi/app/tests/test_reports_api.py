@@ -1,10 +1,22 @@
 from datetime import date, datetime
+from decimal import Decimal
 
 import pytest
+import redis
 from fastapi import status
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.models.Account import Account
+from app.models.AccountDailyBalance import AccountDailyBalance
+from app.models.ExchangeRateHistory import ExchangeRateHistory
+from app.models.User import User
+from app.services.account_daily_balances import rebuild_account_daily_balances
+from app.services.CurrencyProcessor import calc_amount
+from app.services.daily_exchange_rates import sync_daily_exchange_rates
+from app.services.data_versions import bump_global_data_version
+from app.services.reports import get_cash_flows
+from app.services.transactions import delete as delete_transaction_service
 from app.tests.conftest import db, main_test_user_id
 
 client = TestClient(app)
@@ -39,6 +51,301 @@ class TestReportsAPI:
         result = response.json()
         assert isinstance(result, list)
 
+    def test_cash_flow_report_is_converted_in_sql(self, auth_headers, one_account, create_transaction):
+        sync_daily_exchange_rates(db)
+        db.commit()
+        for amount, is_income in ((300, True), (100, False), (50, False)):
+            create_transaction(
+                {
+                    'accountId': one_account['id'],
+                    'targetAccountId': None,
+                    'amount': amount,
+                    'isIncome': is_income,
+                }
+            )
+
+        response = client.post("/reports/cashflow/", json={"period": "monthly"}, headers=auth_headers)
+
+        assert response.status_code == 200
+        result = response.json()
+        period = datetime.now().strftime('%Y-%m')
+        account_currency = db.get(Account, one_account['id']).currency.code  # type: ignore
+        base_currency = db.get(User, main_test_user_id).base_currency.code  # type: ignore
+        expected_income = calc_amount(Decimal(300), account_currency, date.today(), base_currency, db)
+        expected_expenses = calc_amount(Decimal(150), account_currency, date.today(), base_currency, db)
+        assert account_currency != base_currency
+        assert result['totalIncome'][period] == pytest.approx(float(expected_income))
+        assert result['totalExpenses'][period] == pytest.approx(float(expected_expenses))
+        assert result['netFlow'][period] == pytest.approx(float(expected_income - expected_expenses))
+
+    def test_cash_flow_report_fills_empty_buckets(self, auth_headers, one_account, create_transaction):
+        sync_daily_exchange_rates(db)
+        db.commit()
+        for amount, is_income, date_time in ((100, False, '2024-01-15T12:00:00Z'), (300, True, '2024-07-15T12:00:00Z')):
+            create_transaction(
+                {
+                    'accountId': one_account['id'],
+                    'targetAccountId': None,
+                    'amount': amount,
+                    'isIncome': is_income,
+                    'dateTime': date_time,
+                }
+            )
+
+        report_data = {"period": "quarterly", "startDate": "2024-01-01T00:00:00", "endDate": "2024-09-30T00:00:00"}
+        response = client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+
+        assert response.status_code == 200
+        result = response.json()
+        account_currency = db.get(Account, one_account['id']).currency.code  # type: ignore
+        base_currency = db.get(User, main_test_user_id).base_currency.code  # type: ignore
+        expected_expenses = calc_amount(Decimal(100), account_currency, date(2024, 3, 31), base_currency, db)
+        expected_income = calc_amount(Decimal(300), account_currency, date(2024, 9, 30), base_currency, db)
+        assert list(result['netFlow']) == ['2024-Q1', '2024-Q2', '2024-Q3']
+        assert result['totalExpenses']['2024-Q1'] == pytest.approx(float(expected_expenses))
+        assert result['netFlow']['2024-Q2'] == 0
+        assert result['totalIncome']['2024-Q3'] == pytest.approx(float(expected_income))
+
+        response = client.post("/reports/cashflow/", json={"period": "weekly"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert len(response.json()['netFlow']) == 13
+
+        response = client.post("/reports/cashflow/", json={"period": "fortnightly"}, headers=auth_headers)
+        assert response.status_code == 422
+
+    def test_cash_flow_report_uses_first_rates_for_earlier_dates(self, auth_headers, one_account, create_transaction):
+        sync_daily_exchange_rates(db)
+        db.commit()
+        first_rates = db.query(ExchangeRateHistory).order_by(ExchangeRateHistory.actual_date).first()
+        transaction_date = date(first_rates.actual_date.year - 1, 6, 15)  # type: ignore
+        create_transaction(
+            {
+                'accountId': one_account['id'],
+                'targetAccountId': None,
+                'amount': 100,
+                'dateTime': f'{transaction_date.isoformat()}T12:00:00Z',
+            }
+        )
+
+        report_data = {
+            "period": "monthly",
+            "startDate": f"{transaction_date.year}-06-01T00:00:00",
+            "endDate": f"{transaction_date.year}-06-30T00:00:00",
+        }
+        response = client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+
+        assert response.status_code == 200
+        account_currency = db.get(Account, one_account['id']).currency.code  # type: ignore
+        base_currency = db.get(User, main_test_user_id).base_currency.code  # type: ignore
+        rates = first_rates.rates  # type: ignore
+        expected_expenses = Decimal(100) / Decimal(str(rates[account_currency])) * Decimal(str(rates[base_currency]))
+        assert account_currency != base_currency
+        assert response.json()['totalExpenses'][f'{transaction_date.year}-06'] == pytest.approx(
+            float(expected_expenses)
+        )
+
+    def test_balance_series(self, auth_headers, one_account, create_transaction):
+        sync_daily_exchange_rates(db)
+        db.commit()
+        initial_balance = Decimal(one_account['initial_balance'])
+        for amount, is_income, date_time in ((100, False, '2024-01-10T12:00:00Z'), (300, True, '2024-01-20T12:00:00Z')):
+            create_transaction(
+                {
+                    'accountId': one_account['id'],
+                    'targetAccountId': None,
+                    'amount': amount,
+                    'isIncome': is_income,
+                    'dateTime': date_time,
+                }
+            )
+
+        series_data = {
+            "accountIds": [one_account['id']],
+            "dates": ["2024-01-15", "2024-01-01", "2024-01-31", "2024-01-20"],
+        }
+        response = client.post("/reports/balance-series/", json=series_data, headers=auth_headers)
+
+        assert response.status_code == 200
+        result = response.json()
+        account_currency = db.get(Account, one_account['id']).currency.code  # type: ignore
+        balances = result['accounts'][0]['balances']
+        assert [balance['date'] for balance in balances] == ['2024-01-01', '2024-01-15', '2024-01-20', '2024-01-31']
+        expected_balances = [initial_balance, initial_balance - 100, initial_balance + 200, initial_balance + 200]
+        assert [balance['balance'] for balance in balances] == [float(balance) for balance in expected_balances]
+        for balance, total in zip(balances, result['totals']):
+            expected_balance = calc_amount(
+                Decimal(str(balance['balance'])),
+                account_currency,
+                date.fromisoformat(balance['date']),
+                result['baseCurrencyCode'],
+                db,
+            )
+            assert balance['baseCurrencyBalance'] == pytest.approx(float(expected_balance))
+            assert total['baseCurrencyBalance'] == pytest.approx(float(expected_balance))
+
+        series_data = {"period": "monthly", "startDate": "2023-11-15", "endDate": "2024-01-15"}
+        response = client.post("/reports/balance-series/", json=series_data, headers=auth_headers)
+        assert response.status_code == 200
+        assert [total['date'] for total in response.json()['totals']] == ['2023-11-30', '2023-12-31', '2024-01-15']
+
+        response = client.post("/reports/balance-series/", json={"period": "hourly"}, headers=auth_headers)
+        assert response.status_code == 422
+
+    def test_account_daily_balances(self, auth_headers, one_account, create_transaction):
+        initial_balance = Decimal(one_account['initial_balance'])
+
+        def daily_balances() -> list[tuple]:
+            balances = (
+                db.query(AccountDailyBalance)
+                .filter(AccountDailyBalance.account_id == one_account['id'])
+                .order_by(AccountDailyBalance.day)
+                .all()
+            )
+            return [(balance.day, balance.balance) for balance in balances]
+
+        transactions = [
+            create_transaction(
+                {
+                    'accountId': one_account['id'],
+                    'targetAccountId': None,
+                    'amount': amount,
+                    'dateTime': date_time,
+                }
+            )
+            for amount, date_time in (
+                (10, '2024-02-01T10:00:00Z'),
+                (20, '2024-02-01T12:00:00Z'),
+                (30, '2024-02-03T12:00:00Z'),
+            )
+        ]
+        assert daily_balances() == [
+            (date(2024, 2, 1), initial_balance - 30),
+            (date(2024, 2, 3), initial_balance - 60),
+        ]
+
+        delete_transaction_service(transactions[1].id, main_test_user_id, db)
+        assert daily_balances() == [
+            (date(2024, 2, 1), initial_balance - 10),
+            (date(2024, 2, 3), initial_balance - 40),
+        ]
+
+        assert main_test_user_id not in rebuild_account_daily_balances(db)
+        assert daily_balances() == [
+            (date(2024, 2, 1), initial_balance - 10),
+            (date(2024, 2, 3), initial_balance - 40),
+        ]
+
+        db.query(AccountDailyBalance).filter(
+            AccountDailyBalance.account_id == one_account['id'], AccountDailyBalance.day == date(2024, 2, 1)
+        ).update({'balance': 0})
+        db.add(AccountDailyBalance(account_id=one_account['id'], day=date(2024, 2, 2), balance=0))
+        db.commit()
+        assert main_test_user_id in rebuild_account_daily_balances(db)
+        assert daily_balances() == [
+            (date(2024, 2, 1), initial_balance - 10),
+            (date(2024, 2, 3), initial_balance - 40),
+        ]
+
+        report_data = {"accountIds": [one_account['id']], "balanceDate": "2024-02-02"}
+        response = client.post("/reports/balance/non-hidden/", json=report_data, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()[0]['balance'] == float(initial_balance - 10)
+
+    def test_expenses_data_is_converted_per_day(self, auth_headers, one_account, create_transaction):
+        rates = db.query(ExchangeRateHistory).order_by(ExchangeRateHistory.actual_date).first().rates  # type: ignore
+        account_currency = db.get(Account, one_account['id']).currency.code  # type: ignore
+        base_currency = db.get(User, main_test_user_id).base_currency.code  # type: ignore
+        exchange_rates = [
+            ExchangeRateHistory(
+                rates={**rates, account_currency: rates[account_currency] * 2},
+                actual_date=date(2024, 3, 10),
+                base_currency_code='USD',
+                service_name='test',
+            ),
+            ExchangeRateHistory(
+                rates=rates, actual_date=date(2024, 3, 11), base_currency_code='USD', service_name='test'
+            ),
+        ]
+        db.add_all(exchange_rates)
+        db.commit()
+        sync_daily_exchange_rates(db)
+        db.commit()
+
+        try:
+            for day in (9, 10, 10):
+                transaction = create_transaction(
+                    {
+                        'accountId': one_account['id'],
+                        'targetAccountId': None,
+                        'amount': 100,
+                        'dateTime': f'2024-03-{day:02}T12:00:00Z',
+                    }
+                )
+
+            report_data = {"startDate": "2024-03-01", "endDate": "2024-03-31"}
+            response = client.post("/reports/expenses-by-categories/", json=report_data, headers=auth_headers)
+
+            assert response.status_code == 200
+            category = next(item for item in response.json() if item['id'] == transaction.category_id)
+            expected_expenses = sum(
+                Decimal(amount) / Decimal(str(rates[account_currency])) * rate_multiplier
+                for amount, rate_multiplier in ((100, 1), (200, Decimal('0.5')))
+            ) * Decimal(str(rates[base_currency]))
+            assert account_currency != base_currency
+            assert category['totalExpenses'] == pytest.approx(float(expected_expenses))
+        finally:
+            for exchange_rate in exchange_rates:
+                db.delete(exchange_rate)
+            db.commit()
+            sync_daily_exchange_rates(db, date(2024, 3, 10))
+            db.commit()
+
+    def test_reports_are_cached_till_data_changes(self, auth_headers, one_account, create_transaction, monkeypatch):
+        # the same Redis which is the Celery broker in tests
+        redis_client = redis.Redis.from_url("redis://localhost:6379")
+        monkeypatch.setattr('app.services.data_versions.get_redis', lambda: redis_client)
+        calls = []
+
+        def counted_get_cash_flows(*args):
+            calls.append(args)
+            return get_cash_flows(*args)
+
+        monkeypatch.setattr('app.routes.reports.get_cash_flows', counted_get_cash_flows)
+        report_data = {"period": "monthly"}
+
+        first_response = client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+        second_response = client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+        assert first_response.status_code == second_response.status_code == 200
+        assert second_response.json() == first_response.json()
+        assert len(calls) == 1
+
+        client.post("/reports/cashflow/", json={"period": "weekly"}, headers=auth_headers)
+        assert len(calls) == 2
+
+        create_transaction(
+            {
+                'accountId': one_account['id'],
+                'targetAccountId': None,
+                'amount': 100,
+                'isIncome': False,
+            }
+        )
+        response = client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+        assert len(calls) == 3
+        period = datetime.now().strftime('%Y-%m')
+        assert response.json()['totalExpenses'][period] > first_response.json()['totalExpenses'].get(period, 0)
+
+        # rate updates change the reports of all the users
+        bump_global_data_version()
+        client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+        assert len(calls) == 4
+
+        # nothing is cached while the data version is unknown
+        monkeypatch.setattr('app.services.report_cache.get_data_version', lambda user_id: None)
+        client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+        client.post("/reports/cashflow/", json=report_data, headers=auth_headers)
+        assert len(calls) == 6
+
     def test_expenses_data_success(self, token, auth_headers):
         report_data = {
             "startDate": "2024-01-01",
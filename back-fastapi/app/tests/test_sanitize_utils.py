@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 import icecream
 import pytest
 from fastapi import HTTPException, status
@@ -10,6 +12,7 @@ from app.utils.sanitize_transaction_filters import (
     to_int_list,
     to_str_list,
 )
+from app.utils.transactions_cursor import decode_cursor, encode_cursor
 
 icecream.install()
 
@@ -139,3 +142,12 @@ def test_incorrect_to_str_list():
 
     processed_val = to_str_list('123,45,67')
     assert processed_val == ['123', '45', '67']
+
+
+def test_transactions_cursor():
+    date_time = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(date_time, 42)) == (date_time, 42)
+    assert decode_cursor(encode_cursor(None, 42)) == (None, 42)
+
+    assert decode_cursor('abc') is None
+    assert decode_cursor('') is None
@@ -1,26 +1,44 @@
+import csv
+import io
+import json
+from datetime import date, datetime, timezone
 from decimal import Decimal
 
 import pytest
 from fastapi import HTTPException, status
 from fastapi.testclient import TestClient
 from icecream import ic
+from sqlalchemy import event
 
 from app.logger_config import logger
 from app.main import app
 from app.models.Account import Account
+from app.models.AccountDailyBalance import AccountDailyBalance
+from app.models.DailyLedgerRollup import DailyLedgerRollup
 from app.models.Transaction import Transaction
 from app.models.User import User
+from app.models.UserCategory import UserCategory
+from app.schemas.account_schema import CreateAccountSchema, UpdateAccountSchema
 from app.schemas.transaction_schema import (
     CreateTransactionSchema,
+    ResponseTransactionSchema,
     UpdateTransactionSchema,
 )
 from app.schemas.user_schema import UserLoginSchema
+from app.services import accounts, transactions_export
+from app.services.accounts import create_account as create_account_service
 from app.services.auth import get_jwt_token as get_jwt_token_service
-from app.services.errors import AccessDenied, InvalidAccount, InvalidCategory
+from app.services.base_currency_amounts import materialize_base_currency_amounts, reset_base_currency_amounts
+from app.services.CurrencyProcessor import calc_amount
+from app.services.daily_exchange_rates import sync_daily_exchange_rates
+from app.services.daily_ledger_rollup import rebuild_daily_ledger_rollup
+from app.services.errors import AccessDenied, InvalidAccount, InvalidCategory, InvalidImportFile
 from app.services.transaction_management.errors import InvalidTransaction
 from app.services.transactions import create_transaction as create_transaction_service
+from app.services.transactions import delete as delete_transaction_service
 from app.services.transactions import get_transaction_details, get_transactions
 from app.services.transactions import update as update_transaction_service
+from app.services.transactions_import import parse_csv, parse_ofx
 from app.tests.conftest import (
     accounts_path_prefix,
     auth_path_prefix,
@@ -43,6 +61,34 @@ def run_around_tests():
     db.commit()
 
 
+def get_categories(token: str) -> tuple[dict, dict]:
+    """Expense and income categories of the user as the API returns them"""
+    categories = client.get(f'{categories_path_prefix}/', headers={'auth-token': token}).json()
+    expense_category = next(category for category in categories if not category['isIncome'])
+    income_category = next(category for category in categories if category['isIncome'])
+    return expense_category, income_category
+
+
+def save_transaction(
+    account_id: int, category: dict, amount: int = 100, day: int = 1, transaction_id: int | None = None, **details
+) -> Transaction:
+    """Create a transaction of January 2024 through the service, or update it if transaction_id is set"""
+    transaction_details = {
+        'id': transaction_id,
+        'account_id': account_id,
+        'amount': amount,
+        'category_id': category['id'],
+        'is_income': category['isIncome'],
+        'is_transfer': False,
+        'date_time': datetime(2024, 1, day, 12, tzinfo=timezone.utc),
+        'target_account_id': None,
+        **details,
+    }
+    if transaction_id is None:
+        return create_transaction_service(CreateTransactionSchema(**transaction_details), main_test_user_id, db)
+    return update_transaction_service(UpdateTransactionSchema(**transaction_details), main_test_user_id, db)
+
+
 @pytest.mark.parametrize("amount", [100, 200, 125_000, 500_000_000])
 def test_create_transaction_expense_route(token, one_account, amount):
     categories_response = client.get(f'{categories_path_prefix}/', headers={'auth-token': token})
@@ -815,3 +861,343 @@ def test_get_transaction_details_forbidden(token, create_transaction, one_accoun
         get_transaction_details(transaction_id=transaction.id, user_id=user2.id, db=db)
     assert ex.value.status_code == status.HTTP_403_FORBIDDEN
     assert ex.value.detail == 'Forbidden'
+
+
+def test_new_balances_are_updated_from_edit_point(token, one_account):
+    expense_category, income_category = get_categories(token)
+
+    def new_balances() -> list[Decimal]:
+        transactions = (
+            db.query(Transaction)
+            .filter(Transaction.account_id == one_account['id'], Transaction.is_deleted == False)  # noqa: E712
+            .order_by(Transaction.date_time)
+            .all()
+        )
+        return [transaction.new_balance for transaction in transactions]
+
+    initial_balance = Decimal(one_account['initial_balance'])
+    first = save_transaction(one_account['id'], expense_category, 100, 1)
+    save_transaction(one_account['id'], income_category, 50, 3)
+    assert new_balances() == [initial_balance - 100, initial_balance - 50]
+
+    # a transaction in the past shifts the balances of all the later ones
+    save_transaction(one_account['id'], expense_category, 30, 2)
+    assert new_balances() == [initial_balance - 100, initial_balance - 130, initial_balance - 80]
+
+    delete_transaction_service(first.id, main_test_user_id, db)
+    assert new_balances() == [initial_balance - 30, initial_balance + 20]
+
+
+def test_new_balances_of_previous_transfer_target_are_updated(token, one_account):
+    expense_category, _ = get_categories(token)
+    first_target, second_target = (
+        create_account_service(
+            CreateAccountSchema.model_validate({**test_accounts_data[0], 'id': None, 'name': name}),
+            main_test_user_id,
+            db,
+        )
+        for name in ('First target', 'Second target')
+    )
+    initial_balance = Decimal(test_accounts_data[0]['initial_balance'])
+    transfer_details = {'is_transfer': True, 'target_amount': 100}
+
+    transfer = save_transaction(
+        one_account['id'], expense_category, 100, 2, target_account_id=first_target.id, **transfer_details
+    )
+    expense = save_transaction(first_target.id, expense_category, 10, 5)
+    db.refresh(expense)
+    assert expense.new_balance == initial_balance + 90
+
+    # the transfer goes to another account now, the later balances of the previous target lose it
+    save_transaction(
+        one_account['id'], expense_category, 100, 2, transfer.id, target_account_id=second_target.id, **transfer_details
+    )
+    db.expire_all()
+    assert db.get(Transaction, expense.id).new_balance == initial_balance - 10  # type: ignore
+    daily_balance = db.get(AccountDailyBalance, (first_target.id, date(2024, 1, 5)))
+    assert daily_balance.balance == initial_balance - 10  # type: ignore
+
+
+def test_get_transactions_by_cursor(token, one_account):
+    expense_category, _ = get_categories(token)
+    created_ids = {save_transaction(one_account['id'], expense_category, day=day).id for day in (1, 2, 2, 2, 3, 4, 5)}
+
+    pages = []
+    params = {'per_page': 3}
+    while True:
+        response = client.get(f'{transactions_path_prefix}/', params=params, headers={'auth-token': token})
+        assert response.status_code == 200
+        pages.append([transaction['id'] for transaction in response.json()])
+        if 'next_cursor' not in response.headers:
+            break
+        params['cursor'] = response.headers['next_cursor']
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    listed_ids = [transaction_id for page in pages for transaction_id in page]
+    assert set(listed_ids) == created_ids
+    # cursor pages keep the order of page/per_page pagination
+    assert listed_ids == [transaction.id for transaction in get_transactions(main_test_user_id, db, {'per_page': 10})]
+
+    response = client.get(f'{transactions_path_prefix}/', params={'cursor': 'abc'}, headers={'auth-token': token})
+    assert response.status_code == 422
+
+
+def test_get_transactions_query_count(token, one_account):
+    expense_category, _ = get_categories(token)
+    for _ in range(10):
+        save_transaction(one_account['id'], expense_category)
+
+    def get_page_statements(per_page: int) -> list[str]:
+        db.commit()
+        connection = db.connection()
+        statements: list[str] = []
+
+        def count_statement(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(connection, 'before_cursor_execute', count_statement)
+        try:
+            transactions = get_transactions(main_test_user_id, db, {'per_page': per_page})
+            for transaction in transactions:
+                ResponseTransactionSchema.model_validate(transaction).model_dump(mode='json')
+        finally:
+            event.remove(connection, 'before_cursor_execute', count_statement)
+        return statements
+
+    # the first call loads exchange rates
+    get_page_statements(10)
+
+    # the page of transactions and the user, whatever the page size
+    assert len(get_page_statements(2)) == 2
+    assert len(get_page_statements(10)) == 2
+
+
+def test_base_currency_amount_is_stored(token, one_account):
+    expense_category, _ = get_categories(token)
+    transaction = save_transaction(one_account['id'], expense_category)
+    base_currency_code = db.get(User, main_test_user_id).base_currency.code  # type: ignore
+    expected_amount = calc_amount(Decimal(100), 'UAH', date(2024, 1, 1), base_currency_code, db)
+
+    def stored_amount() -> Decimal | None:
+        db.expire_all()
+        return db.get(Transaction, transaction.id).base_currency_amount  # type: ignore
+
+    assert stored_amount() == expected_amount
+
+    # the amounts which are not materialized yet are converted on read
+    reset_base_currency_amounts(db, main_test_user_id)
+    db.commit()
+    assert stored_amount() is None
+    details = get_transaction_details(transaction.id, main_test_user_id, db)
+    assert details.base_currency_amount == expected_amount
+
+    db.rollback()
+    sync_daily_exchange_rates(db)
+    db.commit()
+    assert materialize_base_currency_amounts(db, user_id=main_test_user_id) == 1
+    assert stored_amount() == pytest.approx(expected_amount)
+
+
+def test_base_currency_amounts_follow_account_currency(token, one_account, monkeypatch):
+    materialized = []
+    monkeypatch.setattr(
+        accounts.materialize_transactions_base_currency_amounts, 'delay', lambda **kwargs: materialized.append(kwargs)
+    )
+    expense_category, _ = get_categories(token)
+    transaction = save_transaction(one_account['id'], expense_category)
+    base_currency = db.get(User, main_test_user_id).base_currency  # type: ignore
+    assert one_account['currency_id'] != base_currency.id
+
+    account_dto = UpdateAccountSchema.model_validate({**one_account, 'currency_id': base_currency.id})
+    create_account_service(account_dto, main_test_user_id, db)
+
+    # the amounts converted from the old currency are not served
+    db.expire_all()
+    assert db.get(Transaction, transaction.id).base_currency_amount is None  # type: ignore
+    assert get_transaction_details(transaction.id, main_test_user_id, db).base_currency_amount == 100
+    assert materialized == [{'user_id': main_test_user_id}]
+
+
+def test_import_transactions_csv(token, one_account):
+    categories = client.get(f'{categories_path_prefix}/', headers={'auth-token': token}).json()
+    expense_category = next(category for category in categories if not category['isIncome'])
+    income_category = next(category for category in categories if category['isIncome'])
+    other_expense_category = next(
+        category for category in categories if not category['isIncome'] and category['id'] != expense_category['id']
+    )
+    # the names of the API are decorated with the parents, statements use the plain names
+    other_expense_category_name = db.get(UserCategory, other_expense_category['id']).name  # type: ignore
+    statement = (
+        'date,amount,label,category\n'
+        '2024-01-03,-50.5,Groceries,\n'
+        f'2024-01-01T10:00:00,-100,Cinema,{other_expense_category_name.upper()}\n'
+        '2024-01-02,1000,Salary,\n'
+    )
+    form = {
+        'accountId': str(one_account['id']),
+        'expenseCategoryId': str(expense_category['id']),
+        'incomeCategoryId': str(income_category['id']),
+    }
+
+    response = client.post(
+        f'{transactions_path_prefix}/import/',
+        headers={'auth-token': token},
+        data=form,
+        files={'file': ('statement.csv', statement.encode(), 'text/csv')},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {'imported': 3}
+
+    db.expire_all()
+    transactions = (
+        db.query(Transaction).filter(Transaction.account_id == one_account['id']).order_by(Transaction.date_time).all()
+    )
+    initial_balance = Decimal(one_account['initial_balance'])
+    assert [transaction.label for transaction in transactions] == ['Cinema', 'Salary', 'Groceries']
+    assert [transaction.category_id for transaction in transactions] == [
+        other_expense_category['id'],
+        income_category['id'],
+        expense_category['id'],
+    ]
+    assert [transaction.new_balance for transaction in transactions] == [
+        initial_balance - 100,
+        initial_balance + 900,
+        initial_balance + Decimal('849.5'),
+    ]
+    assert all(transaction.base_currency_amount is not None for transaction in transactions)
+    assert db.get(Account, one_account['id']).balance == Decimal(one_account['balance']) + Decimal('849.5')  # type: ignore
+
+    # a file with an invalid row is not imported at all
+    response = client.post(
+        f'{transactions_path_prefix}/import/',
+        headers={'auth-token': token},
+        data=form,
+        files={'file': ('statement.csv', b'date,amount\n2024-02-01,-10\nyesterday,-20\n', 'text/csv')},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+    assert db.query(Transaction).filter(Transaction.account_id == one_account['id']).count() == 3
+
+    # so is a file with a row having more fields than the header
+    response = client.post(
+        f'{transactions_path_prefix}/import/',
+        headers={'auth-token': token},
+        data=form,
+        files={'file': ('statement.csv', b'date,amount\n2024-02-01,-10\n2024-02-02,-20,Extra\n', 'text/csv')},
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+    assert 'line 3' in response.json()['detail']
+    assert db.query(Transaction).filter(Transaction.account_id == one_account['id']).count() == 3
+
+
+@pytest.mark.parametrize(
+    'statement',
+    [
+        'date,amount\n2024-02-01,-10,Extra\n',
+        'date,amount\n2024-02-01\n',
+        'date,amount,label\n,-10,Lunch\n',
+    ],
+)
+def test_parse_invalid_csv(statement):
+    with pytest.raises(InvalidImportFile):
+        list(parse_csv(statement.splitlines()))
+
+
+def test_parse_ofx():
+    statement = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240105120000.000[-5:EST]
+<TRNAMT>-12.30
+<NAME>Coffee shop
+<MEMO>Card 1234
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT</TRNTYPE><DTPOSTED>20240106</DTPOSTED><TRNAMT>500</TRNAMT><NAME>Salary</NAME></STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+    transactions = list(parse_ofx(statement.splitlines()))
+
+    assert [(item.date_time, item.amount, item.label, item.notes) for item in transactions] == [
+        (datetime(2024, 1, 5, 12, tzinfo=timezone.utc), Decimal('-12.30'), 'Coffee shop', 'Card 1234'),
+        (datetime(2024, 1, 6, tzinfo=timezone.utc), Decimal(500), 'Salary', ''),
+    ]
+
+
+def test_export_transactions(token, one_account, monkeypatch):
+    monkeypatch.setattr(transactions_export, 'EXPORT_BATCH_SIZE', 2)
+    expense_category, _ = get_categories(token)
+    for day in range(1, 6):
+        save_transaction(one_account['id'], expense_category, 10 * day, day)
+
+    response = client.get(f'{transactions_path_prefix}/export/', headers={'auth-token': token})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['content-type'].startswith('text/csv')
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [Decimal(row['amount']) for row in rows] == [50, 40, 30, 20, 10]
+    assert all(row['base_currency_amount'] for row in rows)
+
+    response = client.get(
+        f'{transactions_path_prefix}/export/',
+        headers={'auth-token': token},
+        params={'format': 'ndjson', 'from_date': '2024-01-02', 'to_date': '2024-01-03'},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row['amount'] for row in rows] == [30, 20]
+
+    response = client.get(
+        f'{transactions_path_prefix}/export/', headers={'auth-token': token}, params={'format': 'xls'}
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_daily_ledger_rollup_is_maintained(token, one_account):
+    expense_category, income_category = get_categories(token)
+
+    def rollup() -> set[tuple]:
+        rows = db.query(DailyLedgerRollup).filter(DailyLedgerRollup.account_id == one_account['id']).all()
+        return {(row.category_id, row.day, row.income, row.expense, row.count) for row in rows}
+
+    first = save_transaction(one_account['id'], expense_category, 100)
+    save_transaction(one_account['id'], expense_category, 50)
+    save_transaction(one_account['id'], income_category, 300)
+    assert rollup() == {
+        (expense_category['id'], date(2024, 1, 1), 0, 150, 2),
+        (income_category['id'], date(2024, 1, 1), 300, 0, 1),
+    }
+
+    save_transaction(one_account['id'], expense_category, 70, 2, first.id)
+    assert rollup() == {
+        (expense_category['id'], date(2024, 1, 1), 0, 50, 1),
+        (income_category['id'], date(2024, 1, 1), 300, 0, 1),
+        (expense_category['id'], date(2024, 1, 2), 0, 70, 1),
+    }
+
+    # the row of a day without transactions is removed
+    delete_transaction_service(first.id, main_test_user_id, db)
+    expected_rollup = {
+        (expense_category['id'], date(2024, 1, 1), 0, 50, 1),
+        (income_category['id'], date(2024, 1, 1), 300, 0, 1),
+    }
+    assert rollup() == expected_rollup
+
+    # deleted transactions are neither taken from the rollup again nor added back by updates
+    response = client.delete(f'{transactions_path_prefix}/{first.id}', headers={'auth-token': token})
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+    save_transaction(one_account['id'], expense_category, 80, 1, first.id)
+    assert rollup() == expected_rollup
+
+    assert main_test_user_id not in rebuild_daily_ledger_rollup(db)
+    assert rollup() == expected_rollup
+
+    db.query(DailyLedgerRollup).filter(
+        DailyLedgerRollup.account_id == one_account['id'], DailyLedgerRollup.category_id == income_category['id']
+    ).update({'income': 0})
+    db.add(
+        DailyLedgerRollup(
+            user_id=main_test_user_id, account_id=one_account['id'], category_id=None, day=date(2024, 1, 3), count=1
+        )
+    )
+    db.commit()
+    assert main_test_user_id in rebuild_daily_ledger_rollup(db)
+    assert rollup() == expected_rollup
@@ -0,0 +1,17 @@
+import redis
+
+from app.config import settings
+
+_redis_client: redis.Redis | None = None
+
+
+def get_redis() -> redis.Redis:
+    """Return the Redis client shared by the whole process. It is created on the first call."""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _redis_client
@@ -1,8 +1,11 @@
 from fastapi import HTTPException, status
 
+from app.utils.transactions_cursor import decode_cursor
+
 transaction_filters = (
     'page',
     'per_page',
+    'cursor',
     'types',
     'categories',
     'accounts',
@@ -38,6 +41,7 @@ def to_str_list(val: str) -> list | None:
 filter_functions = {
     'page': to_int,
     'per_page': to_int,
+    'cursor': decode_cursor,
     'types': to_str_list,
     'currencies': to_int_list,
     'categories': to_int_list,
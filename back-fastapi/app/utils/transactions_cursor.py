@@ -0,0 +1,21 @@
+import base64
+import binascii
+from datetime import datetime
+
+
+def encode_cursor(date_time: datetime | None, transaction_id: int) -> str:
+    """Make an opaque cursor pointing right after the transaction in (date_time, id) order"""
+    raw = f'{date_time.isoformat() if date_time else ""}|{transaction_id}'
+
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, int] | None:
+    """Get (date_time, id) back from the cursor, None if the cursor is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_time, transaction_id = raw.split('|')
+
+        return (datetime.fromisoformat(date_time) if date_time else None), int(transaction_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None